@@ -1,35 +1,106 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from sentence_transformers import SentenceTransformer
 import numpy as np
-import joblib
 import json
 import os
-from collections import OrderedDict
+import math
+import queue
+import asyncio
+import sys
+import time
+import threading
+from collections import OrderedDict, deque
+
+from linear_head import HEAD_FILE, LinearHead, top2
+from lexical import LEXICAL_FILE, LEXICAL_MIN_CONFIDENCE, LEXICAL_MIN_MARGIN, LEXICAL_EXCLUDED_INTENTS, LexicalModel
+from shared_cache import SharedCache
+from canonical import Canonicalizer, KeyStats
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-ART_DIR = os.path.join(BASE_DIR, "aidy_intent_model")
+
+# Profiling and process stats come from the assistant's package, deployed next
+# to Api/, so the Win32 counters and the dump format have one definition.
+sys.path.append(os.path.join(os.path.dirname(BASE_DIR), "PythonCore"))
+from aidy.profiling import Profiler, profile_dir, process_status
+ART_ROOT = os.path.join(BASE_DIR, "aidy_intent_model")
+
+def _artifact_dir() -> str:
+    # train.py writes versions/<version> and points CURRENT at it; the flat files
+    # in ART_ROOT are the original hand-made model.
+    try:
+        with open(os.path.join(ART_ROOT, "CURRENT"), "r", encoding="utf-8") as f:
+            version = f.read().strip()
+        vdir = os.path.join(ART_ROOT, "versions", version)
+        if version and os.path.isdir(vdir):
+            return vdir
+    except OSError:
+        pass
+    return ART_ROOT
+
+ART_DIR = _artifact_dir()
 
 CLF_PATH = os.path.join(ART_DIR, "classifier.joblib")
+HEAD_PATH = os.path.join(ART_DIR, HEAD_FILE)   # NumPy export of the same classifier (preferred)
 ID2INTENT_PATH = os.path.join(ART_DIR, "id2intent.json")
 ENCODER_NAME_PATH = os.path.join(ART_DIR, "encoder_name.txt")
+LEXICAL_PATH = os.path.join(ART_DIR, LEXICAL_FILE)
 
 # Tunables
 CACHE_MAX = 2048
 MIN_CONFIDENCE = 0.40   # ниже -> intent="" (пусть AIDY не исполняет)
 TOP2_MARGIN_MIN = 0.05  # если топ-2 слишком близко -> intent=""
 
+# Cascade: the char n-gram stage answers alone when it clears both thresholds,
+# everything else goes to the encoder. AIDY_LEXICAL=0 turns the first stage off.
+LEXICAL_ENABLED = os.environ.get("AIDY_LEXICAL", "1").strip().lower() not in ("0", "false", "no", "off")
+LEXICAL_MIN_CONF = float(os.environ.get("AIDY_LEXICAL_MIN_CONF", LEXICAL_MIN_CONFIDENCE))
+LEXICAL_MIN_MARG = float(os.environ.get("AIDY_LEXICAL_MIN_MARGIN", LEXICAL_MIN_MARGIN))
+
+# Backpressure: encoder work waits in a bounded queue; anything that can't be
+# answered within its deadline (X-Deadline-Ms header, else DEADLINE_MS) is shed
+# with 429/503 + Retry-After instead of timing out in the client.
+QUEUE_MAX = max(1, int(os.environ.get("AIDY_API_QUEUE", "32")))
+DEADLINE_MS = float(os.environ.get("AIDY_API_DEADLINE_MS", "3000"))
+DEADLINE_MAX_MS = 30000.0
+BATCH_MAX = 16   # larger batches are refused with 422; the assistant caps its N-best to match
+
+# Profiling (opt-in): AIDY_PROFILE=1 -> ./profiles, any other value is the directory.
+# Memory dumps are api-memory-*.txt so they can share a directory with the assistant's.
+PROFILE_DIR = profile_dir(BASE_DIR)
+PROFILE_SAMPLE = max(1, int(os.environ.get("AIDY_PROFILE_SAMPLE", "1")))  # profile every Nth predict
+profiler = Profiler(PROFILE_DIR, prefix="api-")
+_prof_seen = 0
+
 app = FastAPI(title="Aidy Intent API (Local, LogisticRegression)")
 
 class CommandRequest(BaseModel):
     text: str
 
+class BatchRequest(BaseModel):
+    texts: list[str]
+
 encoder: SentenceTransformer | None = None
 clf = None
+lexical: LexicalModel | None = None
 id2intent: dict[str, str] | None = None
 
+_stage_counts = {"cache": 0, "lexical": 0, "encoder": 0}
+
 _cache: OrderedDict[str, dict] = OrderedDict()
 
+# Cache keys are canonical texts (wake words, fillers and punctuation stripped,
+# number words as digits); the models score the same text with numbers left as
+# words. key_stats shows how well that works on real traffic.
+canonicalize = Canonicalizer()
+key_stats = KeyStats()
+
+# Multi-worker mode (serve.py): all workers share one cache in shared memory.
+shared_cache: SharedCache | None = None
+if os.environ.get("AIDY_API_SHM"):
+    shared_cache = SharedCache.attach(os.environ["AIDY_API_SHM"])
+
 def _norm(s: str | None) -> str:
     if not s:
         return ""
@@ -38,6 +109,8 @@ def _norm(s: str | None) -> str:
     return s
 
 def _cache_get(k: str):
+    if shared_cache is not None:
+        return shared_cache.get(k)
     if k in _cache:
         v = _cache.pop(k)
         _cache[k] = v
@@ -45,6 +118,9 @@ def _cache_get(k: str):
     return None
 
 def _cache_put(k: str, v: dict):
+    if shared_cache is not None:
+        shared_cache.put(k, v)
+        return
     if k in _cache:
         _cache.pop(k)
     _cache[k] = v
@@ -53,10 +129,21 @@ def _cache_put(k: str, v: dict):
 
 @app.on_event("startup")
 def _startup():
-    global encoder, clf, id2intent
+    if PROFILE_DIR:
+        profiler.start()
+
+    load_models()
+
+def load_models():
+    # serve.py calls this once before forking workers, so they share the weights
+    # copy-on-write; the workers' startup then finds everything loaded.
+    global encoder, clf, lexical, id2intent
+    if encoder is not None and clf is not None:
+        return
 
     # Check artifacts
-    missing = [p for p in (CLF_PATH, ID2INTENT_PATH, ENCODER_NAME_PATH) if not os.path.exists(p)]
+    head_path = HEAD_PATH if os.path.exists(HEAD_PATH) else CLF_PATH
+    missing = [p for p in (head_path, ID2INTENT_PATH, ENCODER_NAME_PATH) if not os.path.exists(p)]
     if missing:
         raise FileNotFoundError(f"Missing artifacts: {missing}. Files in {ART_DIR}: {os.listdir(ART_DIR) if os.path.isdir(ART_DIR) else 'NO_DIR'}")
 
@@ -65,65 +152,327 @@ def _startup():
         enc_name = f.read().strip()
 
     encoder = SentenceTransformer(enc_name)   # downloads if needed
-    clf = joblib.load(CLF_PATH)
+    if head_path == HEAD_PATH:
+        clf = LinearHead.load(HEAD_PATH)
+    else:
+        import joblib   # pulls in scikit-learn; only for models without classifier.npz
+        clf = joblib.load(CLF_PATH)
 
     with open(ID2INTENT_PATH, "r", encoding="utf-8") as f:
         id2intent = json.load(f)
 
+    if LEXICAL_ENABLED and os.path.exists(LEXICAL_PATH):
+        lexical = LexicalModel.load(LEXICAL_PATH)
+
 @app.get("/")
 def root():
     return {
         "status": "ok",
         "encoder_loaded": encoder is not None,
         "clf_loaded": clf is not None,
+        "clf_backend": None if clf is None else ("numpy" if isinstance(clf, LinearHead) else "sklearn"),
         "num_classes": None if clf is None else int(len(getattr(clf, "classes_", []))),
-        "cache_size": len(_cache),
-        "artifacts_dir": os.path.basename(ART_DIR),
+        "pid": os.getpid(),
+        "cache_size": len(_cache) if shared_cache is None else shared_cache.used(),
+        "shared_cache": None if shared_cache is None else shared_cache.stats(),
+        "queue": _inference.stats(),
+        "lexical_loaded": lexical is not None,
+        "lexical_gate": [LEXICAL_MIN_CONF, LEXICAL_MIN_MARG],
+        "lexical_excluded": sorted(LEXICAL_EXCLUDED_INTENTS),
+        "stages": dict(_stage_counts),
+        "cache_keys": key_stats.summary(),
+        "lexical_fraction": round(_stage_counts["lexical"] / max(1, _stage_counts["lexical"] + _stage_counts["encoder"]), 4),
+        **process_status(),
+        "profiling": PROFILE_DIR is not None,
+        "artifacts_dir": os.path.relpath(ART_DIR, BASE_DIR),
         "files": os.listdir(BASE_DIR),
     }
 
+@app.on_event("shutdown")
+def _shutdown():
+    if PROFILE_DIR:
+        profiler.close()
+
 @app.get("/health")
 def health():
     return {"status": "ok"}
 
+# Readiness, as opposed to liveness: 200 only once the models are loaded.
+@app.get("/ready")
+def ready():
+    ok = encoder is not None and clf is not None and id2intent is not None
+    body = {"ready": ok, "pid": os.getpid(), "lexical_loaded": lexical is not None}
+    return body if ok else JSONResponse(status_code=503, content=body)
+
+@app.get("/cache/keys")
+def cache_keys(top: int = 20):
+    return {"pid": os.getpid(), **key_stats.summary(), "top": key_stats.top(max(1, min(top, 500)))}
+
+class Overloaded(Exception):
+    def __init__(self, status: int, reason: str, retry_after_ms: int):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+        self.retry_after_ms = retry_after_ms
+
+def _resolve(fut, result=None, exc=None):
+    if fut.done():
+        return
+    if exc is not None:
+        fut.set_exception(exc)
+    else:
+        fut.set_result(result)
+
+# Encoder calls run on one inference thread per worker process, fed by a
+# bounded queue; handlers stay async and await the result. Requests that can't
+# finish before their deadline are refused up front, and queued work whose
+# deadline has passed is dropped without running it.
+class InferenceQueue:
+    WINDOW = 500
+
+    def __init__(self, fn, maxsize: int):
+        self.fn = fn
+        self.maxsize = maxsize
+        self._q = queue.Queue(maxsize)
+        self._thread = None
+        self._lock = threading.Lock()
+        self.busy = False
+        self.service_ms = 50.0   # EWMA of one encoder call
+        self.max_depth = 0
+        self.waits = deque(maxlen=self.WINDOW)
+        self.counts = {"done": 0, "rejected_full": 0, "rejected_deadline": 0, "expired": 0, "timeout": 0, "failed": 0}
+
+    def _ensure_thread(self):
+        # Started lazily: threads don't survive serve.py's fork.
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="api-inference", daemon=True)
+                self._thread.start()
+
+    def depth(self) -> int:
+        return self._q.qsize()
+
+    def expected_wait_ms(self) -> float:
+        return (self.depth() + (1 if self.busy else 0)) * self.service_ms
+
+    def retry_after_ms(self) -> int:
+        return int(self.expected_wait_ms() + self.service_ms)
+
+    def submit(self, loop, deadline: float, *args):
+        self._ensure_thread()
+        if time.monotonic() + (self.expected_wait_ms() + self.service_ms) / 1000.0 > deadline:
+            self.counts["rejected_deadline"] += 1
+            raise Overloaded(503, "deadline cannot be met", self.retry_after_ms())
+        fut = loop.create_future()
+        try:
+            self._q.put_nowait((fut, loop, deadline, time.monotonic(), args))
+        except queue.Full:
+            self.counts["rejected_full"] += 1
+            raise Overloaded(429, "inference queue full", self.retry_after_ms())
+        self.max_depth = max(self.max_depth, self.depth())
+        return fut
+
+    def _run(self):
+        while True:
+            fut, loop, deadline, queued_at, args = self._q.get()
+            now = time.monotonic()
+            self.waits.append((now - queued_at) * 1000.0)
+            if fut.cancelled():
+                continue   # the handler already gave up
+            if now >= deadline:
+                self.counts["expired"] += 1
+                loop.call_soon_threadsafe(_resolve, fut, None, Overloaded(503, "expired in queue", self.retry_after_ms()))
+                continue
+
+            self.busy = True
+            t0 = time.perf_counter()
+            try:
+                result = self.fn(*args, queue_ms=round((now - queued_at) * 1000.0, 2))
+                self.counts["done"] += 1
+                loop.call_soon_threadsafe(_resolve, fut, result)
+            except Exception as e:
+                self.counts["failed"] += 1
+                loop.call_soon_threadsafe(_resolve, fut, None, e)
+            finally:
+                self.busy = False
+                self.service_ms = 0.8 * self.service_ms + 0.2 * (time.perf_counter() - t0) * 1000.0
+
+    def stats(self) -> dict:
+        waits = sorted(self.waits)
+        return {
+            "depth": self.depth(),
+            "capacity": self.maxsize,
+            "max_depth": self.max_depth,
+            "busy": self.busy,
+            "service_ms": round(self.service_ms, 2),
+            "wait_ms_p50": round(waits[len(waits) // 2], 2) if waits else 0.0,
+            "wait_ms_p99": round(waits[int(len(waits) * 0.99)], 2) if waits else 0.0,
+            **self.counts,
+        }
+
+def _profiled(fn, *args, **kwargs):
+    # One "predict" section: a call that finds it taken just isn't sampled.
+    global _prof_seen
+    if PROFILE_DIR:
+        _prof_seen += 1
+        if _prof_seen % PROFILE_SAMPLE == 0:
+            with profiler.section("predict"):
+                return fn(*args, **kwargs)
+    return fn(*args, **kwargs)
+
+def _deadline_ms(request: Request) -> float:
+    try:
+        ms = float(request.headers.get("x-deadline-ms", DEADLINE_MS))
+    except ValueError:
+        ms = DEADLINE_MS
+    return min(max(ms, 10.0), DEADLINE_MAX_MS)
+
+def _shed(e: Overloaded):
+    retry_sec = max(1, math.ceil(e.retry_after_ms / 1000.0))
+    return JSONResponse(
+        status_code=e.status,
+        content={"intent": "", "error": e.reason, "retry_after_ms": e.retry_after_ms},
+        headers={"Retry-After": str(retry_sec)},
+    )
+
 @app.post("/predict")
-def predict(req: CommandRequest):
+async def predict(req: CommandRequest, request: Request):
     text = _norm(req.text)
     if not text:
         return {"text": "", "intent": "", "confidence": 0.0, "margin": 0.0, "error": "empty text"}
 
-    cached = _cache_get(text)
+    resp, key, model_text, lexical_ms = _profiled(_predict_fast, text)
+    if resp is not None:
+        return resp
+
+    try:
+        resp = (await _encode_queued(request, [key], [model_text], [lexical_ms]))[0]
+    except Overloaded as e:
+        return _shed(e)
+    return {**resp, "text": text}
+
+# N-best ASR hypotheses for one utterance: everything the cache and lexical
+# stage can't answer goes to the encoder as a single batch.
+@app.post("/predict_batch")
+async def predict_batch(req: BatchRequest, request: Request):
+    if len(req.texts) > BATCH_MAX:
+        return JSONResponse(
+            status_code=422,
+            content={"results": [], "error": f"batch of {len(req.texts)} texts, at most {BATCH_MAX} allowed"},
+        )
+    texts = [_norm(t) for t in req.texts]
+    results = [None] * len(texts)
+    pending = {}   # key -> (model text, lexical_ms, [result indexes])
+    for i, text in enumerate(texts):
+        if not text:
+            results[i] = {"text": "", "intent": "", "confidence": 0.0, "margin": 0.0, "error": "empty text"}
+            continue
+        key = canonicalize(text) or text
+        if key in pending:
+            pending[key][2].append(i)
+            continue
+        resp, key, model_text, lexical_ms = _profiled(_predict_fast, text)
+        if resp is not None:
+            results[i] = resp
+        else:
+            pending[key] = (model_text, lexical_ms, [i])
+
+    if pending:
+        batch = list(pending)
+        try:
+            encoded = await _encode_queued(
+                request, batch, [pending[k][0] for k in batch], [pending[k][1] for k in batch])
+        except Overloaded as e:
+            return _shed(e)
+        for key, resp in zip(batch, encoded):
+            for i in pending[key][2]:
+                results[i] = {**resp, "text": texts[i]}
+    return {"results": results}
+
+async def _encode_queued(request: Request, keys: list, texts: list, lexical_ms: list) -> list:
+    deadline = time.monotonic() + _deadline_ms(request) / 1000.0
+    fut = _inference.submit(asyncio.get_running_loop(), deadline, keys, texts, lexical_ms)
+    try:
+        return await asyncio.wait_for(fut, timeout=max(0.0, deadline - time.monotonic()))
+    except asyncio.TimeoutError:
+        _inference.counts["timeout"] += 1
+        raise Overloaded(503, "deadline exceeded", _inference.retry_after_ms())
+
+def _predict_fast(text: str):
+    # Cache and lexical stage; (response or None, cache key, model text, lexical_ms).
+    model_text, key = canonicalize.split(text)
+    model_text, key = model_text or text, key or text
+    cached = _cache_get(key)
+    key_stats.record(key, text, cached is not None)
     if cached is not None:
-        return cached
+        _stage_counts["cache"] += 1
+        return {**cached, "text": text, "cached": True}, key, model_text, None
 
-    # Encode
-    emb = encoder.encode([text], normalize_embeddings=True)
-    proba = clf.predict_proba(emb)[0]  # shape: [num_classes]
+    # Stage 1: char n-grams, microseconds
+    lexical_ms = None
+    if lexical is not None:
+        t0 = time.perf_counter()
+        col, p, m = lexical.top2(model_text)
+        lexical_ms = round((time.perf_counter() - t0) * 1000, 3)
+        intent = id2intent.get(str(int(lexical.classes_[col])), "")
+        if p >= LEXICAL_MIN_CONF and m >= LEXICAL_MIN_MARG and intent not in LEXICAL_EXCLUDED_INTENTS:
+            _stage_counts["lexical"] += 1
+            resp = {
+                "text": text,
+                "key": key,
+                "intent": intent,
+                "confidence": round(p, 4),
+                "margin": round(m, 4),
+                "raw_intent": intent,
+                "stage": "lexical",
+                "lexical_ms": lexical_ms,
+                "cached": False,
+            }
+            _cache_put(key, resp)
+            return resp, key, model_text, lexical_ms
+    return None, key, model_text, lexical_ms
 
-    best_idx = int(np.argmax(proba))
-    best_p = float(proba[best_idx])
+def _predict_encoder(keys: list, texts: list, lexical_ms: list, queue_ms=None):
+    return _profiled(_encode_and_classify, keys, texts, lexical_ms, queue_ms)
 
-    # margin between top-2
-    if len(proba) >= 2:
-        top2 = np.partition(proba, -2)[-2:]
-        margin = float(top2.max() - top2.min())
-    else:
-        margin = 0.0
+def _encode_and_classify(keys: list, texts: list, lexical_ms: list, queue_ms):
+    # Stage 2: encoder + classifier head, one encoder call for the whole batch
+    _stage_counts["encoder"] += len(texts)
+    t0 = time.perf_counter()
+    emb = encoder.encode(texts, normalize_embeddings=True)
+    t1 = time.perf_counter()
+    proba = clf.predict_proba(emb)  # shape: [batch, num_classes]
+    t2 = time.perf_counter()
 
-    intent = id2intent.get(str(best_idx), "")
+    out = []
+    for key, text, lex_ms, row in zip(keys, texts, lexical_ms, proba):
+        best_idx, best_p, margin = top2(row)   # margin between top-2
+        intent = id2intent.get(str(best_idx), "")
 
-    # Gate uncertain answers
-    if best_p < MIN_CONFIDENCE or margin < TOP2_MARGIN_MIN:
-        intent_out = ""
-    else:
-        intent_out = intent
-
-    resp = {
-        "text": text,
-        "intent": intent_out,
-        "confidence": round(best_p, 4),
-        "margin": round(margin, 4),
-        "raw_intent": intent,   # полезно для дебага (AIDY может игнорировать)
-    }
-    _cache_put(text, resp)
-    return resp
+        # Gate uncertain answers
+        if best_p < MIN_CONFIDENCE or margin < TOP2_MARGIN_MIN:
+            intent_out = ""
+        else:
+            intent_out = intent
+
+        resp = {
+            "text": text,
+            "key": key,
+            "intent": intent_out,
+            "confidence": round(best_p, 4),
+            "margin": round(margin, 4),
+            "raw_intent": intent,   # полезно для дебага (AIDY может игнорировать)
+            "encode_ms": round((t1 - t0) * 1000, 2),
+            "classify_ms": round((t2 - t1) * 1000, 2),
+            "stage": "encoder",
+            "lexical_ms": lex_ms,
+            "queue_ms": queue_ms,
+            "cached": False,
+        }
+        if len(texts) > 1:
+            resp["batch"] = len(texts)
+        _cache_put(key, resp)
+        out.append(resp)
+    return out
+
+_inference = InferenceQueue(_predict_encoder, QUEUE_MAX)
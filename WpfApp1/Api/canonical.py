@@ -0,0 +1,144 @@
+import os
+import re
+from collections import OrderedDict
+
+# Wake words come from AIDY_WAKE_WORDS (comma-separated), which the assistant sets
+# from its WAKE_KEYWORDS when it starts the API.
+DEFAULT_WAKE_KEYWORDS = ("hey aidy", "ok aidy", "aidy")
+# Mishearings of "aidy" that are also ordinary words: "edit notes" keeps its verb.
+AMBIGUOUS_WAKE_KEYWORDS = {"edit", "id", "a d"}
+
+LEADING_FILLERS = ("please", "kindly", "just", "could you", "can you", "would you", "will you")
+TRAILING_FILLERS = ("please", "for me", "thanks", "thank you")
+
+UNITS = {
+    "zero": 0, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7,
+    "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12, "thirteen": 13,
+    "fourteen": 14, "fifteen": 15, "sixteen": 16, "seventeen": 17, "eighteen": 18, "nineteen": 19,
+}
+TENS = {"twenty": 20, "thirty": 30, "forty": 40, "fifty": 50, "sixty": 60, "seventy": 70, "eighty": 80, "ninety": 90}
+
+_PUNCT = re.compile(r"[^\w\s%']+")
+
+
+def load_wake_keywords() -> list:
+    words = [w for w in os.environ.get("AIDY_WAKE_WORDS", "").split(",") if w.strip()] or DEFAULT_WAKE_KEYWORDS
+    return sorted({" ".join(w.lower().split()) for w in words})
+
+
+def numbers_to_digits(words: list) -> list:
+    # "twenty five" -> "25", "one hundred" -> "100"; anything else is left alone.
+    out = []
+    i = 0
+    while i < len(words):
+        w = words[i]
+        if w in TENS:
+            n = TENS[w]
+            if i + 1 < len(words) and 0 < UNITS.get(words[i + 1], 0) < 10:
+                n += UNITS[words[i + 1]]
+                i += 1
+            out.append(str(n))
+        elif w in UNITS or (w == "a" and i + 1 < len(words) and words[i + 1] == "hundred"):
+            n = UNITS.get(w, 1)
+            if i + 1 < len(words) and words[i + 1] == "hundred" and n < 10:
+                n *= 100
+                i += 1
+            out.append(str(n))
+        else:
+            out.append(w)
+        i += 1
+    return out
+
+
+def _strip_prefix(words: list, phrases: list) -> list:
+    changed = True
+    while changed and words:
+        changed = False
+        for p in phrases:
+            if words[:len(p)] == p and len(words) > len(p):
+                words = words[len(p):]
+                changed = True
+                break
+    return words
+
+
+def _strip_suffix(words: list, phrases: list) -> list:
+    changed = True
+    while changed and words:
+        changed = False
+        for p in phrases:
+            if words[-len(p):] == p and len(words) > len(p):
+                words = words[:-len(p)]
+                changed = True
+                break
+    return words
+
+
+# Maps the ways one command gets said to a single cache key: "Aidy, please open
+# chrome." and "open chrome" are the same lookup. split() also returns what the
+# models score: the same text minus wake word and fillers, but with number words
+# left as spoken ("open one note" must not become "open 1 note" for the
+# classifier). The response keeps the text that was sent, so slot parsing still
+# sees it.
+class Canonicalizer:
+    def __init__(self, wake_keywords=None, leading=LEADING_FILLERS, trailing=TRAILING_FILLERS):
+        wake = load_wake_keywords() if wake_keywords is None else wake_keywords
+        # "eighty" is in the wake list as a mishearing of "aidy", but on its own
+        # it's more likely a volume level.
+        wake = [w for w in wake if w not in UNITS and w not in TENS and w not in AMBIGUOUS_WAKE_KEYWORDS]
+        # Longest first, so "hey aidy" is stripped whole rather than leaving "aidy".
+        self.leading = sorted((p.split() for p in list(wake) + list(leading)), key=len, reverse=True)
+        self.trailing = sorted((p.split() for p in trailing), key=len, reverse=True)
+
+    def split(self, text: str) -> tuple:
+        # (model text, cache key)
+        words = _PUNCT.sub(" ", (text or "").lower()).split()
+        if not words:
+            return "", ""
+        words = _strip_prefix(words, self.leading)
+        words = _strip_suffix(words, self.trailing)
+        words = [w for w in words if w != "please"] or words
+        return " ".join(words), " ".join(numbers_to_digits(words))
+
+    def __call__(self, text: str) -> str:
+        return self.split(text)[1]
+
+
+# Hits and misses per canonical key, plus a few raw texts that mapped to it, so
+# the rules can be checked against real traffic. Least recently seen keys drop
+# off once max_keys is reached.
+class KeyStats:
+    MAX_VARIANTS = 5
+
+    def __init__(self, max_keys: int = 2048):
+        self.max_keys = max_keys
+        self._keys: OrderedDict[str, dict] = OrderedDict()
+        self.rewritten = 0
+        self.rewritten_hits = 0
+
+    def record(self, key: str, text: str, hit: bool):
+        item = self._keys.pop(key, None)
+        if item is None:
+            item = {"hits": 0, "misses": 0, "variants": []}
+        self._keys[key] = item
+        while len(self._keys) > self.max_keys:
+            self._keys.popitem(last=False)
+
+        item["hits" if hit else "misses"] += 1
+        if text != key:
+            self.rewritten += 1
+            if hit:
+                self.rewritten_hits += 1
+        if text not in item["variants"] and len(item["variants"]) < self.MAX_VARIANTS:
+            item["variants"].append(text)
+
+    def top(self, n: int = 20) -> list:
+        ranked = sorted(self._keys.items(), key=lambda kv: kv[1]["hits"] + kv[1]["misses"], reverse=True)
+        out = []
+        for key, item in ranked[:n]:
+            lookups = item["hits"] + item["misses"]
+            out.append({"key": key, **item, "hit_ratio": round(item["hits"] / lookups, 4) if lookups else 0.0})
+        return out
+
+    def summary(self) -> dict:
+        return {"keys": len(self._keys), "rewritten": self.rewritten, "rewritten_hits": self.rewritten_hits}
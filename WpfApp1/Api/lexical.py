@@ -0,0 +1,110 @@
+import os
+import math
+
+import numpy as np
+
+from linear_head import LinearHead, head_mode
+
+LEXICAL_FILE = "lexical.npz"
+
+# First-stage gate: answer without the encoder only when both clear.
+LEXICAL_MIN_CONFIDENCE = 0.70
+LEXICAL_MIN_MARGIN = 0.50
+# Never answered from char n-grams alone: "do not restart" and "unlock" share
+# nearly all their n-grams with these. They always go to the encoder.
+LEXICAL_EXCLUDED_INTENTS = {"shutdown", "restart", "lock"}
+
+NGRAM_RANGE = (2, 4)
+LEXICAL_C = 30.0
+
+
+def char_wb_ngrams(text: str, lo: int, hi: int) -> list:
+    # Same n-grams as sklearn's analyzer="char_wb": per word, padded with spaces.
+    out = []
+    for w in text.lower().split():
+        w = " " + w + " "
+        size = len(w)
+        for n in range(lo, hi + 1):
+            offset = 0
+            out.append(w[offset:offset + n])
+            while offset + n < size:
+                offset += 1
+                out.append(w[offset:offset + n])
+            if offset == 0:
+                break
+    return out
+
+
+# Char n-gram TF-IDF + linear model, evaluated with NumPy only. Trained in
+# train.py with scikit-learn and exported; answers in microseconds.
+class LexicalModel:
+    def __init__(self, vocab, idf, ngram_range, sublinear: bool, head: LinearHead):
+        self.vocab = {str(g): i for i, g in enumerate(vocab)}
+        self.idf = np.asarray(idf, dtype=np.float32)
+        self.lo, self.hi = int(ngram_range[0]), int(ngram_range[1])
+        self.sublinear = sublinear
+        self.head = head
+        self.classes_ = head.classes_
+
+    @classmethod
+    def load(cls, path: str) -> "LexicalModel":
+        with np.load(path, allow_pickle=False) as z:
+            head = LinearHead(z["coef"], z["intercept"], z["classes"], str(z["mode"]))
+            return cls(z["vocab"], z["idf"], z["ngram_range"], bool(z["sublinear"]), head)
+
+    def transform(self, texts) -> np.ndarray:
+        X = np.zeros((len(texts), len(self.idf)), dtype=np.float32)
+        for row, text in enumerate(texts):
+            counts = {}
+            for g in char_wb_ngrams(text, self.lo, self.hi):
+                col = self.vocab.get(g)
+                if col is not None:
+                    counts[col] = counts.get(col, 0) + 1
+            for col, tf in counts.items():
+                X[row, col] = (1.0 + math.log(tf)) if self.sublinear else tf
+            X[row] *= self.idf
+            norm = float(np.linalg.norm(X[row]))
+            if norm > 0:
+                X[row] /= norm
+        return X
+
+    def predict_proba(self, texts) -> np.ndarray:
+        return self.head.predict_proba(self.transform(texts))
+
+    def top2(self, text: str) -> tuple:
+        return self.head.top2(self.transform([text]))
+
+
+def fit_lexical(texts: list, y, C: float = LEXICAL_C):
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.linear_model import LogisticRegression
+
+    vec = TfidfVectorizer(analyzer="char_wb", ngram_range=NGRAM_RANGE, sublinear_tf=True)
+    X = vec.fit_transform(texts)
+    clf = LogisticRegression(C=C, max_iter=3000)
+    clf.fit(X, y)
+    return vec, clf
+
+
+def export_lexical(vec, clf, path: str, check_texts: list) -> LexicalModel:
+    vocab = sorted(vec.vocabulary_, key=vec.vocabulary_.get)
+    tmp = path + ".tmp.npz"
+    np.savez(
+        tmp,
+        vocab=np.array(vocab),
+        idf=np.asarray(vec.idf_, dtype=np.float32),
+        ngram_range=np.array(vec.ngram_range),
+        sublinear=np.array(bool(vec.sublinear_tf)),
+        coef=np.asarray(clf.coef_, dtype=np.float32),
+        intercept=np.asarray(clf.intercept_, dtype=np.float32),
+        classes=np.asarray(clf.classes_),
+        mode=np.array(head_mode(clf)),
+    )
+    model = LexicalModel.load(tmp)
+
+    diff = float(np.abs(model.predict_proba(check_texts) - clf.predict_proba(vec.transform(check_texts))).max())
+    if diff > 1e-4:
+        raise ValueError(f"Exported lexical model disagrees with sklearn (max diff {diff:.2g})")
+
+    os.replace(tmp, path)
+    return model
@@ -0,0 +1,78 @@
+import os
+
+import numpy as np
+
+HEAD_FILE = "classifier.npz"
+
+
+# LogisticRegression.predict_proba re-implemented over exported weights, so
+# inference needs NumPy only (no joblib / scikit-learn import at startup).
+class LinearHead:
+    def __init__(self, coef: np.ndarray, intercept: np.ndarray, classes: np.ndarray, mode: str):
+        self.coef_t = np.ascontiguousarray(coef.T, dtype=np.float32)   # [dim, k]
+        self.intercept = np.asarray(intercept, dtype=np.float32)
+        self.classes_ = np.asarray(classes)
+        self.mode = mode
+
+    @classmethod
+    def load(cls, path: str) -> "LinearHead":
+        with np.load(path, allow_pickle=False) as z:
+            return cls(z["coef"], z["intercept"], z["classes"], str(z["mode"]))
+
+    def predict_proba(self, X) -> np.ndarray:
+        scores = np.asarray(X, dtype=np.float32) @ self.coef_t + self.intercept
+        if self.mode == "binary":
+            p = 1.0 / (1.0 + np.exp(-scores[:, 0]))
+            return np.stack([1.0 - p, p], axis=1)
+        if self.mode == "ovr":
+            p = 1.0 / (1.0 + np.exp(-scores))
+            return p / p.sum(axis=1, keepdims=True)
+        scores -= scores.max(axis=1, keepdims=True)
+        np.exp(scores, out=scores)
+        scores /= scores.sum(axis=1, keepdims=True)
+        return scores
+
+    def top2(self, emb) -> tuple:
+        return top2(self.predict_proba(emb)[0])
+
+
+def top2(proba) -> tuple:
+    # (best column, best prob, margin to the runner-up) for one row of probabilities.
+    if len(proba) < 2:
+        return 0, float(proba[0]), 0.0
+    i2, i1 = np.argpartition(proba, -2)[-2:]
+    if proba[i2] > proba[i1]:
+        i1, i2 = i2, i1
+    return int(i1), float(proba[i1]), float(proba[i1] - proba[i2])
+
+
+def head_mode(clf) -> str:
+    if clf.coef_.shape[0] == 1:
+        return "binary"
+    multi = getattr(clf, "multi_class", "auto")
+    if multi == "ovr" or (multi == "auto" and getattr(clf, "solver", "lbfgs") == "liblinear"):
+        return "ovr"
+    return "multinomial"
+
+
+def export_head(clf, path: str, check_dim: int | None = None) -> LinearHead:
+    # Writes the npz and checks it reproduces predict_proba on random inputs.
+    mode = head_mode(clf)
+    tmp = path + ".tmp.npz"
+    np.savez(
+        tmp,
+        coef=np.asarray(clf.coef_, dtype=np.float32),
+        intercept=np.asarray(clf.intercept_, dtype=np.float32),
+        classes=np.asarray(clf.classes_),
+        mode=np.array(mode),
+    )
+    head = LinearHead.load(tmp)
+
+    X = np.random.default_rng(0).standard_normal((16, check_dim or clf.coef_.shape[1])).astype(np.float32)
+    X /= np.linalg.norm(X, axis=1, keepdims=True)
+    diff = float(np.abs(head.predict_proba(X) - clf.predict_proba(X)).max())
+    if diff > 1e-4:
+        raise ValueError(f"Exported head disagrees with the classifier (max diff {diff:.2g}, mode {mode})")
+
+    os.replace(tmp, path)
+    return head
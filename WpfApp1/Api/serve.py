@@ -0,0 +1,119 @@
+import os
+import sys
+import time
+import signal
+import socket
+import argparse
+
+import uvicorn
+
+import app as api
+from shared_cache import SharedCache
+
+RESPAWN_DELAY_SEC = 1.0
+
+
+def _threads_per_worker(workers: int) -> int:
+    env = os.environ.get("AIDY_API_THREADS", "").strip()
+    if env:
+        return max(1, int(env))
+    return max(1, (os.cpu_count() or 1) // workers)
+
+
+def _run_worker(sock: socket.socket, index: int, threads: int, log_level: str):
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except Exception:
+        pass
+    config = uvicorn.Config(api.app, log_level=log_level, lifespan="on")
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+# Pre-fork server: the model is loaded once in this process and the workers
+# are forked from it, so the encoder weights are shared copy-on-write. All
+# workers accept on the same listening socket; dead workers are respawned.
+def prefork(host: str, port: int, workers: int, log_level: str):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    t0 = time.perf_counter()
+    api.load_models()
+    print(f"Model loaded in {time.perf_counter() - t0:.1f}s; forking {workers} workers", flush=True)
+
+    threads = _threads_per_worker(workers)
+    children: dict[int, int] = {}
+    stopping = False
+
+    def spawn(index: int):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                _run_worker(sock, index, threads, log_level)
+            except BaseException:
+                code = 1
+            os._exit(code)
+        children[pid] = index
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for i in range(workers):
+        spawn(i)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        index = children.pop(pid, None)
+        if index is not None and not stopping:
+            print(f"Worker {index} (pid {pid}) exited with {status}; respawning", flush=True)
+            time.sleep(RESPAWN_DELAY_SEC)
+            spawn(index)
+    sock.close()
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Run the Aidy intent API with several workers")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8008)
+    ap.add_argument("--workers", type=int, default=int(os.environ.get("AIDY_API_WORKERS", "0") or 0) or (os.cpu_count() or 1))
+    ap.add_argument("--cache-slots", type=int, default=8192)
+    ap.add_argument("--log-level", default="warning")
+    args = ap.parse_args(argv)
+
+    workers = max(1, args.workers)
+    cache = SharedCache.create(slots=args.cache_slots)
+    api.shared_cache = cache
+    os.environ["AIDY_API_SHM"] = cache.name
+    try:
+        if hasattr(os, "fork"):
+            prefork(args.host, args.port, workers, args.log_level)
+        else:
+            # No fork on Windows: uvicorn spawns the workers and each loads its own
+            # copy of the model. They still share the cache through AIDY_API_SHM.
+            uvicorn.run("app:app", host=args.host, port=args.port, workers=workers, log_level=args.log_level)
+    finally:
+        cache.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
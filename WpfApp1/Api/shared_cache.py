@@ -0,0 +1,173 @@
+import os
+import sys
+import json
+import struct
+import hashlib
+import tempfile
+import threading
+from multiprocessing import shared_memory
+
+MAGIC = b"AIDYSC01"
+HEADER = struct.Struct("<8sII")        # magic, slots, slot_size
+SLOT_HEADER = struct.Struct("<QQI4x")  # seq, key hash, payload length
+
+
+def _key_hash(key: str) -> int:
+    # Stable across processes (str hash() is randomized per interpreter).
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class _NamedMutex:
+    def __init__(self, name: str):
+        import ctypes
+        from ctypes import wintypes
+        self._k32 = ctypes.WinDLL("kernel32", use_last_error=True)
+        self._k32.CreateMutexW.restype = wintypes.HANDLE
+        self._k32.CreateMutexW.argtypes = [ctypes.c_void_p, wintypes.BOOL, wintypes.LPCWSTR]
+        self._k32.WaitForSingleObject.argtypes = [wintypes.HANDLE, wintypes.DWORD]
+        self._k32.ReleaseMutex.argtypes = [wintypes.HANDLE]
+        self._h = self._k32.CreateMutexW(None, False, name)
+        if not self._h:
+            raise ctypes.WinError(ctypes.get_last_error())
+
+    def __enter__(self):
+        self._k32.WaitForSingleObject(self._h, 0xFFFFFFFF)
+
+    def __exit__(self, *exc):
+        self._k32.ReleaseMutex(self._h)
+
+
+class _FileLock:
+    # flock() excludes other processes only; the thread lock covers this one.
+    # A forked child shares the parent's open file, and flock() wouldn't tell
+    # them apart, so each process opens the file for itself.
+    def __init__(self, path: str):
+        import fcntl
+        self._fcntl = fcntl
+        self.path = path
+        self._pid = None
+
+    def __enter__(self):
+        if self._pid != os.getpid():
+            self._f = open(self.path, "a+b")
+            self._threads = threading.Lock()
+            self._pid = os.getpid()
+        self._threads.acquire()
+        self._fcntl.flock(self._f, self._fcntl.LOCK_EX)
+
+    def __exit__(self, *exc):
+        self._fcntl.flock(self._f, self._fcntl.LOCK_UN)
+        self._threads.release()
+
+
+def _lock_path(name: str) -> str:
+    return os.path.join(tempfile.gettempdir(), f"aidy-{name.strip('/')}.lock")
+
+
+def _named_lock(name: str):
+    # Found by the shared block's name, so forked workers and ones uvicorn spawns
+    # (Windows) all end up on the same lock.
+    if sys.platform == "win32":
+        return _NamedMutex("Local\\aidy-" + name)
+    return _FileLock(_lock_path(name))
+
+
+# Prediction cache in a shared memory block, visible to every server worker.
+# Direct-mapped: a key lives in slot hash % slots and a colliding put simply
+# overwrites it. Each slot has a sequence number that is odd while it's being
+# written; readers don't retry, a torn or changed slot just reads as a miss.
+# Writers take one cross-process lock, so two workers filling the same slot
+# can't interleave into an entry that looks complete.
+class SharedCache:
+    def __init__(self, shm: shared_memory.SharedMemory, owner: bool, lock):
+        self.shm = shm
+        self.owner = owner
+        self.lock = lock
+        magic, self.slots, self.slot_size = HEADER.unpack_from(shm.buf, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{shm.name} is not an Aidy shared cache")
+        self.name = shm.name
+        self.hits = 0
+        self.misses = 0
+        self.too_big = 0
+
+    @classmethod
+    def create(cls, slots: int = 4096, slot_size: int = 1024) -> "SharedCache":
+        shm = shared_memory.SharedMemory(create=True, size=HEADER.size + slots * slot_size)
+        shm.buf[: HEADER.size + slots * slot_size] = bytes(HEADER.size + slots * slot_size)
+        HEADER.pack_into(shm.buf, 0, MAGIC, slots, slot_size)
+        return cls(shm, owner=True, lock=_named_lock(shm.name))
+
+    @classmethod
+    def attach(cls, name: str) -> "SharedCache":
+        return cls(shared_memory.SharedMemory(name=name), owner=False, lock=_named_lock(name))
+
+    def _offset(self, h: int) -> int:
+        return HEADER.size + (h % self.slots) * self.slot_size
+
+    def get(self, key: str):
+        h = _key_hash(key)
+        off = self._offset(h)
+        buf = self.shm.buf
+        seq, kh, n = SLOT_HEADER.unpack_from(buf, off)
+        if seq & 1 or kh != h or not n:
+            self.misses += 1
+            return None
+        data = bytes(buf[off + SLOT_HEADER.size: off + SLOT_HEADER.size + n])
+        if SLOT_HEADER.unpack_from(buf, off)[0] != seq:
+            self.misses += 1
+            return None
+        try:
+            item = json.loads(data)
+        except ValueError:
+            self.misses += 1
+            return None
+        if item.get("k") != key:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return item.get("v")
+
+    def put(self, key: str, value) -> bool:
+        data = json.dumps({"k": key, "v": value}, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        if len(data) > self.slot_size - SLOT_HEADER.size:
+            self.too_big += 1
+            return False
+        h = _key_hash(key)
+        off = self._offset(h)
+        buf = self.shm.buf
+        with self.lock:
+            seq = SLOT_HEADER.unpack_from(buf, off)[0] | 1  # odd: write in progress
+            SLOT_HEADER.pack_into(buf, off, seq, 0, 0)
+            buf[off + SLOT_HEADER.size: off + SLOT_HEADER.size + len(data)] = data
+            SLOT_HEADER.pack_into(buf, off, seq, h, len(data))
+            SLOT_HEADER.pack_into(buf, off, seq + 1, h, len(data))
+        return True
+
+    def used(self) -> int:
+        buf = self.shm.buf
+        return sum(1 for i in range(self.slots) if SLOT_HEADER.unpack_from(buf, HEADER.size + i * self.slot_size)[2])
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "name": self.name,
+            "slots": self.slots,
+            "used": self.used(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
+
+    def close(self):
+        self.shm.close()
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+            if isinstance(self.lock, _FileLock):
+                try:
+                    os.remove(self.lock.path)
+                except OSError:
+                    pass
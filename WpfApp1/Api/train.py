@@ -0,0 +1,346 @@
+import os
+import csv
+import json
+import time
+import shutil
+import hashlib
+import argparse
+
+import numpy as np
+import joblib
+from sklearn.linear_model import LogisticRegression
+
+from linear_head import HEAD_FILE, export_head
+from lexical import (
+    LEXICAL_FILE,
+    LEXICAL_C,
+    LEXICAL_MIN_CONFIDENCE,
+    LEXICAL_MIN_MARGIN,
+    LEXICAL_EXCLUDED_INTENTS,
+    NGRAM_RANGE,
+    LexicalModel,
+    fit_lexical,
+    export_lexical,
+)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ART_DIR = os.path.join(BASE_DIR, "aidy_intent_model")
+CSV_PATH = os.path.join(os.path.dirname(BASE_DIR), "commands.csv")
+EMB_CACHE_DIR = os.path.join(BASE_DIR, "emb_cache")
+
+DEFAULT_ENCODER = "all-MiniLM-L6-v2"
+KEEP_VERSIONS = 5
+HOLDOUT_EVERY = 5     # ~1/5 of phrases held out for accuracy (classes with >= 3 phrases)
+LATENCY_SAMPLES = 20
+
+
+def _norm(s: str | None) -> str:
+    if not s:
+        return ""
+    return " ".join(str(s).strip().split()).lower()
+
+
+def _sha1(s: str) -> str:
+    return hashlib.sha1(s.encode("utf-8")).hexdigest()
+
+
+def load_dataset(path: str):
+    rows = []
+    seen = set()
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        for row in csv.reader(f):
+            if len(row) < 2:
+                continue
+            text, intent = _norm(row[0].strip('"').strip("'")), _norm(row[1])
+            if not text or not intent or (text == "command" and intent == "intent"):
+                continue
+            if text in seen:
+                continue
+            seen.add(text)
+            rows.append((text, intent))
+    return rows
+
+
+def current_version(art_dir: str) -> str | None:
+    try:
+        with open(os.path.join(art_dir, "CURRENT"), "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def _write_atomic(path: str, data: str):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+# Phrase embeddings keyed by sha1(normalized phrase), one file per encoder, so a
+# retrain only encodes rows that are new or changed.
+class EmbeddingCache:
+    def __init__(self, cache_dir: str, encoder_name: str):
+        self.path = os.path.join(cache_dir, _sha1(encoder_name)[:12] + ".npz")
+        self.vectors: dict[str, np.ndarray] = {}
+        self.dirty = False
+        if os.path.exists(self.path):
+            try:
+                with np.load(self.path, allow_pickle=False) as z:
+                    for k, v in zip(z["keys"], z["vectors"]):
+                        self.vectors[str(k)] = v
+            except Exception as e:
+                print(f"Embedding cache unreadable, starting over: {e}")
+                self.vectors = {}
+
+    def encode(self, encoder, texts: list) -> tuple:
+        keys = [_sha1(t) for t in texts]
+        missing = sorted({t for t, k in zip(texts, keys) if k not in self.vectors})
+        if missing:
+            embs = encoder.encode(missing, normalize_embeddings=True, batch_size=64)
+            for t, e in zip(missing, embs):
+                self.vectors[_sha1(t)] = np.asarray(e, dtype=np.float32)
+            self.dirty = True
+        return np.stack([self.vectors[k] for k in keys]), len(missing)
+
+    def prune(self, texts: list):
+        keep = {_sha1(t) for t in texts}
+        if set(self.vectors) - keep:
+            self.vectors = {k: v for k, v in self.vectors.items() if k in keep}
+            self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        keys = sorted(self.vectors)
+        tmp = self.path + ".tmp.npz"
+        np.savez(tmp, keys=np.array(keys), vectors=np.stack([self.vectors[k] for k in keys]))
+        os.replace(tmp, self.path)
+        self.dirty = False
+
+
+def split_holdout(rows):
+    by_intent = {}
+    for text, intent in rows:
+        by_intent.setdefault(intent, []).append(text)
+    train, test = [], []
+    for text, intent in rows:
+        held = len(by_intent[intent]) >= 3 and int(_sha1(text)[:8], 16) % HOLDOUT_EVERY == 0
+        (test if held else train).append((text, intent))
+    return train, test
+
+
+def fit(X, y, C: float):
+    clf = LogisticRegression(C=C, max_iter=2000)
+    clf.fit(X, y)
+    return clf
+
+
+def lexical_gate(proba: np.ndarray, classes: np.ndarray, excluded_ids: list) -> tuple:
+    # (predicted column, answered by the first stage?) per row, as app.py gates it.
+    top = np.sort(proba, axis=1)
+    col = proba.argmax(axis=1)
+    ok = (top[:, -1] >= LEXICAL_MIN_CONFIDENCE) & ((top[:, -1] - top[:, -2]) >= LEXICAL_MIN_MARGIN)
+    ok &= ~np.isin(classes[col], excluded_ids)
+    return col, ok
+
+
+def measure_latency(encoder, clf, lexical, texts: list) -> dict:
+    sample = texts[:LATENCY_SAMPLES]
+    enc_ms, clf_ms, lex_ms = [], [], []
+    for t in sample:
+        t0 = time.perf_counter()
+        emb = encoder.encode([t], normalize_embeddings=True)
+        t1 = time.perf_counter()
+        clf.predict_proba(emb)
+        t2 = time.perf_counter()
+        lexical.top2(t)
+        t3 = time.perf_counter()
+        enc_ms.append((t1 - t0) * 1000)
+        clf_ms.append((t2 - t1) * 1000)
+        lex_ms.append((t3 - t2) * 1000)
+    return {
+        "encode_ms_p50": round(float(np.median(enc_ms)), 3) if enc_ms else None,
+        "classify_ms_p50": round(float(np.median(clf_ms)), 3) if clf_ms else None,
+        "lexical_ms_p50": round(float(np.median(lex_ms)), 3) if lex_ms else None,
+    }
+
+
+def write_version(art_dir: str, version: str, clf, lexical_fit, texts: list, intents: list, encoder_name: str,
+                  manifest: dict) -> str:
+    # Everything goes into a fresh versions/<version> directory first; CURRENT is
+    # switched with a single os.replace, so readers never see a half-written model.
+    vdir = os.path.join(art_dir, "versions", version)
+    tmp = vdir + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    joblib.dump(clf, os.path.join(tmp, "classifier.joblib"))
+    export_head(clf, os.path.join(tmp, HEAD_FILE))
+    export_lexical(*lexical_fit, os.path.join(tmp, LEXICAL_FILE), texts)
+    with open(os.path.join(tmp, "id2intent.json"), "w", encoding="utf-8") as f:
+        json.dump({str(i): name for i, name in enumerate(intents)}, f, ensure_ascii=False, indent=2)
+    with open(os.path.join(tmp, "intent2id.json"), "w", encoding="utf-8") as f:
+        json.dump({name: i for i, name in enumerate(intents)}, f, ensure_ascii=False, indent=2)
+    with open(os.path.join(tmp, "encoder_name.txt"), "w", encoding="utf-8") as f:
+        f.write(encoder_name)
+    with open(os.path.join(tmp, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    shutil.rmtree(vdir, ignore_errors=True)
+    os.replace(tmp, vdir)
+    _write_atomic(os.path.join(art_dir, "CURRENT"), version + "\n")
+    return vdir
+
+
+def prune_versions(art_dir: str, keep: int):
+    vroot = os.path.join(art_dir, "versions")
+    if not os.path.isdir(vroot):
+        return
+    cur = current_version(art_dir)
+    names = sorted(d for d in os.listdir(vroot) if not d.endswith(".tmp"))
+    for name in names[: max(0, len(names) - keep)]:
+        if name != cur:
+            shutil.rmtree(os.path.join(vroot, name), ignore_errors=True)
+
+
+def export_existing(art_dir: str) -> str:
+    # Adds classifier.npz next to a classifier.joblib that predates train.py.
+    src = art_dir
+    cur = current_version(art_dir)
+    if cur and os.path.isdir(os.path.join(art_dir, "versions", cur)):
+        src = os.path.join(art_dir, "versions", cur)
+    clf = joblib.load(os.path.join(src, "classifier.joblib"))
+    out = os.path.join(src, HEAD_FILE)
+    head = export_head(clf, out)
+    print(f"Exported {head.mode} head {head.coef_t.shape[1]}x{head.coef_t.shape[0]} -> {out}")
+
+    # The lexical stage is cheap to fit, so it's trained here against the model's own intent ids.
+    with open(os.path.join(src, "intent2id.json"), "r", encoding="utf-8") as f:
+        intent2id = json.load(f)
+    rows = [(t, i) for t, i in load_dataset(CSV_PATH) if i in intent2id]
+    texts = [t for t, _ in rows]
+    lex_out = os.path.join(src, LEXICAL_FILE)
+    lex = export_lexical(*fit_lexical(texts, [intent2id[i] for _, i in rows]), lex_out, texts)
+    print(f"Exported lexical stage ({len(lex.vocab)} n-grams, {len(rows)} phrases) -> {lex_out}")
+    return out
+
+
+def train(csv_path: str = CSV_PATH, art_dir: str = ART_DIR, encoder_name: str | None = None,
+          C: float = 10.0, force: bool = False) -> dict:
+    t_start = time.perf_counter()
+    if not encoder_name:
+        try:
+            with open(os.path.join(art_dir, "encoder_name.txt"), "r", encoding="utf-8") as f:
+                encoder_name = f.read().strip()
+        except OSError:
+            encoder_name = DEFAULT_ENCODER
+
+    rows = load_dataset(csv_path)
+    if not rows:
+        raise SystemExit(f"No rows in {csv_path}")
+    intents = sorted({intent for _, intent in rows})
+    intent2id = {name: i for i, name in enumerate(intents)}
+
+    data_hash = _sha1(json.dumps([encoder_name, C, LEXICAL_C, NGRAM_RANGE, rows]))[:10]
+    cur = current_version(art_dir)
+    if not force and cur and cur.endswith("-" + data_hash):
+        print(f"Up to date: {cur}")
+        return {"version": cur, "skipped": True}
+
+    from sentence_transformers import SentenceTransformer
+    t0 = time.perf_counter()
+    encoder = SentenceTransformer(encoder_name)
+    load_sec = time.perf_counter() - t0
+
+    texts = [t for t, _ in rows]
+    cache = EmbeddingCache(EMB_CACHE_DIR, encoder_name)
+    t0 = time.perf_counter()
+    X, n_new = cache.encode(encoder, texts)
+    encode_sec = time.perf_counter() - t0
+    cache.prune(texts)
+    cache.save()
+    y = np.array([intent2id[i] for _, i in rows])
+
+    train_rows, test_rows = split_holdout(rows)
+    index = {t: n for n, t in enumerate(texts)}
+    holdout = {}
+    if test_rows:
+        tr = [index[t] for t, _ in train_rows]
+        te = [index[t] for t, _ in test_rows]
+        clf = fit(X[tr], y[tr], C)
+        pred = clf.predict(X[te])
+        vec, lclf = fit_lexical([texts[i] for i in tr], y[tr])
+        excluded = [intent2id[i] for i in LEXICAL_EXCLUDED_INTENTS if i in intent2id]
+        lcol, cheap = lexical_gate(lclf.predict_proba(vec.transform([texts[i] for i in te])), lclf.classes_, excluded)
+        lpred = lclf.classes_[lcol]
+        cascade = np.where(cheap, lpred, pred)
+        holdout = {
+            "holdout_n": len(te),
+            "holdout_accuracy": round(float(np.mean(pred == y[te])), 4),
+            "lexical_coverage": round(float(np.mean(cheap)), 4),
+            "lexical_accuracy": round(float(np.mean(lpred[cheap] == y[te][cheap])), 4) if cheap.any() else None,
+            "cascade_accuracy": round(float(np.mean(cascade == y[te])), 4),
+            "holdout_errors": [
+                {"text": texts[i], "expected": intents[y[i]], "got": intents[int(p)]}
+                for i, p in zip(te, pred) if int(p) != y[i]
+            ],
+        }
+
+    t0 = time.perf_counter()
+    clf = fit(X, y, C)
+    fit_sec = time.perf_counter() - t0
+    train_acc = float(np.mean(clf.predict(X) == y))
+    lexical_fit = fit_lexical(texts, y)
+
+    version = time.strftime("%Y%m%d-%H%M%S") + "-" + data_hash
+    manifest = {
+        "version": version,
+        "encoder": encoder_name,
+        "csv": os.path.basename(csv_path),
+        "phrases": len(rows),
+        "intents": len(intents),
+        "C": C,
+        "lexical_C": LEXICAL_C,
+        "lexical_gate": [LEXICAL_MIN_CONFIDENCE, LEXICAL_MIN_MARGIN],
+        "encoded_new": n_new,
+        "encoded_cached": len(rows) - n_new,
+        "encoder_load_sec": round(load_sec, 3),
+        "encode_sec": round(encode_sec, 3),
+        "fit_sec": round(fit_sec, 3),
+        "train_accuracy": round(train_acc, 4),
+        **holdout,
+    }
+    vdir = write_version(art_dir, version, clf, lexical_fit, texts, intents, encoder_name, manifest)
+    manifest.update(measure_latency(encoder, clf, LexicalModel.load(os.path.join(vdir, LEXICAL_FILE)), texts))
+    _write_atomic(os.path.join(vdir, "manifest.json"), json.dumps(manifest, ensure_ascii=False, indent=2))
+    prune_versions(art_dir, KEEP_VERSIONS)
+    manifest["total_sec"] = round(time.perf_counter() - t_start, 3)
+    return manifest
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Train the Aidy intent classifier from commands.csv")
+    ap.add_argument("--csv", default=CSV_PATH)
+    ap.add_argument("--out", default=ART_DIR)
+    ap.add_argument("--encoder", default=None, help="SentenceTransformer name (default: current encoder_name.txt)")
+    ap.add_argument("--C", type=float, default=10.0)
+    ap.add_argument("--force", action="store_true", help="retrain even if the dataset is unchanged")
+    ap.add_argument("--export-head", action="store_true", help="only write classifier.npz / lexical.npz for the current model")
+    args = ap.parse_args(argv)
+
+    if args.export_head:
+        export_existing(args.out)
+        return
+
+    m = train(args.csv, args.out, args.encoder, args.C, args.force)
+    if m.get("skipped"):
+        return
+    print(json.dumps({k: v for k, v in m.items() if k != "holdout_errors"}, indent=2))
+    for e in m.get("holdout_errors", []):
+        print(f'  miss: "{e["text"]}" -> {e["got"]} (expected {e["expected"]})')
+    print(f"Model {m['version']} -> {args.out} (CURRENT)")
+
+
+if __name__ == "__main__":
+    main()
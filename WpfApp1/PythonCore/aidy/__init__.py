@@ -1,3 +1,9 @@
-﻿from .assistant import Aidy
+﻿__all__ = ["Aidy"]
 
-__all__ = ["Aidy"]
+
+def __getattr__(name):
+    # Lazy so tools like `python -m aidy.events` don't pull in the audio stack.
+    if name == "Aidy":
+        from .assistant import Aidy
+        return Aidy
+    raise AttributeError(name)
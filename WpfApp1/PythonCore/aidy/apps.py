@@ -4,6 +4,18 @@ import time
 import subprocess
 
 from .logui import info, warn
+from .procs import PROCESS_TABLE, wait_for_exit
+
+CLOSE_GRACE_SEC = 1.5
+CLOSE_FORCE_WAIT_SEC = 1.0
+
+# close_app results
+CLOSED = "closed"
+NOT_RUNNING = "not_running"
+CLOSE_FAILED = "failed"
+
+# Launchers that must never be guessed as the app's own process.
+NEVER_GUESS_PROCESSES = {"explorer.exe", "cmd.exe", "powershell.exe"}
 
 
 def extract_app_name(text: str) -> str:
@@ -74,12 +86,39 @@ def extract_close_app_name(text: str) -> str:
     return t
 
 
-def find_app(apps: list, name: str):
+class AppIndex:
+    def __init__(self, apps: list):
+        self.apps = list(apps)
+        self.by_alias = {}
+        self.by_id = {}
+        for a in self.apps:
+            for al in a["aliases"]:
+                self.by_alias.setdefault(al, a)
+            self.by_id.setdefault(a["id"], a)
+
+    def __iter__(self):
+        return iter(self.apps)
+
+    def __len__(self):
+        return len(self.apps)
+
+
+def find_app(apps, name: str):
     q = (name or "").strip().lower()
     q = " ".join(q.split())
     if not q:
         return None
 
+    if isinstance(apps, AppIndex):
+        a = apps.by_alias.get(q) or apps.by_id.get(q)
+        if a:
+            return a
+        for a in apps:
+            for al in a["aliases"]:
+                if al and (al in q or q in al):
+                    return a
+        return None
+
     for a in apps:
         if q in a["aliases"]:
             return a
@@ -132,19 +171,76 @@ def close_app_by_process(proc_name: str, force: bool = False) -> bool:
         return False
 
 
-def close_app(app: dict) -> bool:
-    proc = (app.get("process") or "").strip()
+def close_pids(pids, force: bool = False) -> bool:
+    pids = [str(p) for p in pids]
+    if not pids:
+        return False
+    try:
+        args = ["taskkill"]
+        for pid in pids:
+            args += ["/PID", pid]
+        if force:
+            args.append("/F")
+        subprocess.run(args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+        return True
+    except Exception:
+        return False
+
+
+def resolve_process_name(app: dict) -> str:
+    proc = (app.get("process") or "").strip().strip('"')
     if proc:
-        ok = close_app_by_process(proc, force=False)
-        time.sleep(0.15)
-        ok2 = close_app_by_process(proc, force=True)
-        return ok or ok2
-
-    fallback = (app.get("id") or "").strip()
-    if fallback:
-        ok = close_app_by_process(fallback + ".exe", force=False)
-        time.sleep(0.15)
-        ok2 = close_app_by_process(fallback + ".exe", force=True)
-        return ok or ok2
-
-    return False
+        return proc
+
+    # No explicit process: only accept a guess that is actually running.
+    guesses = []
+    if (app.get("type") or "").lower() == "exe":
+        exe = os.path.basename((app.get("target") or "").strip().strip('"'))
+        if exe.lower().endswith(".exe"):
+            guesses.append(exe)
+    app_id = (app.get("id") or "").strip()
+    if app_id:
+        guesses.append(app_id + ".exe")
+
+    for g in guesses:
+        if g.lower() in NEVER_GUESS_PROCESSES:
+            continue
+        if PROCESS_TABLE.is_running(g):
+            return g
+    return ""
+
+
+# on_closing runs once the app is known to be running, before anything is
+# closed, so the caller can announce it without a second process snapshot.
+def close_app(app: dict, on_closing=None) -> str:
+    t0 = time.perf_counter()
+    PROCESS_TABLE.refresh(force=True)
+
+    proc = resolve_process_name(app)
+    if not proc:
+        info(f"Close: {app.get('id')} is not running")
+        return NOT_RUNNING
+
+    pids = PROCESS_TABLE.pids(proc)
+    if not pids:
+        info(f"Close: {proc} is not running")
+        return NOT_RUNNING
+
+    if on_closing is not None:
+        on_closing()
+    close_app_by_process(proc, force=False)
+    alive = wait_for_exit(pids, CLOSE_GRACE_SEC)
+
+    forced = bool(alive)
+    if alive:
+        close_pids(alive, force=True)
+        alive = wait_for_exit(alive, CLOSE_FORCE_WAIT_SEC)
+
+    PROCESS_TABLE.invalidate()
+    ms = (time.perf_counter() - t0) * 1000.0
+    if alive:
+        warn(f"Close: {proc} still running after {ms:.0f} ms ({len(alive)} left)")
+        return CLOSE_FAILED
+
+    info(f"Close: {proc} closed in {ms:.0f} ms ({len(pids)} procs, forced={forced})")
+    return CLOSED
@@ -1,9 +1,8 @@
 ﻿import os
 import sys
 import json
+import math
 import time
-import zipfile
-import urllib.request
 import csv
 import audioop
 import ctypes
@@ -39,6 +38,7 @@ class MockRecognizer:
 
 from .config import (
     API_URL,
+    API_BATCH_URL,
     WAKE_KEYWORDS,
     is_wake_phrase,
     SAMPLE_RATE,
@@ -46,6 +46,12 @@ from .config import (
     FRAME_MS,
     VAD_START_THRESHOLD,
     VAD_SILENCE_MS,
+    VOSK_MODEL,
+    ASR_ALTERNATIVES,
+    ASR_TEMPERATURE,
+    ASR_WEIGHT,
+    BARGE_IN_THRESHOLD,
+    BARGE_IN_FRAMES,
     CONFIRM_GRAMMAR_PHRASES,
     WINDOW_SWITCH_GRAMMAR,
     WINDOW_SWITCH_LEFT,
@@ -54,15 +60,18 @@ from .config import (
     WINDOW_SWITCH_CANCEL,
     VOICE_RESPONSES,
 )
-from .logui import ui_state, ui_command, debug, info, warn, error, UI_MODE, LOG_LEVEL
+from .logui import ui_state, ui_command, ui_partial, ui_metric, debug, info, warn, error, fatal, UI_MODE, LOG_LEVEL
 from .voice import Voice
 from .apps import (
+    AppIndex,
     load_apps_config,
     extract_app_name,
     extract_close_app_name,
     find_app,
     launch_app,
     close_app,
+    CLOSED,
+    NOT_RUNNING,
 )
 from .system import (
     run_powershell_hidden,
@@ -74,7 +83,13 @@ from .system import (
     set_volume_percent,
     volume_steps,
 )
-from .intent_api import start_local_intent_api, IntentAPI
+from .intent_api import IntentServer, IntentAPI, LocalMatcher
+from .shell import shutdown_hosts
+from .watch import FileWatcher
+from .trace import TRACER
+from .profiling import Profiler, profile_dir
+from .vosk_models import ModelManager
+from .startup import StartupGraph
 
 
 COMMANDS = {
@@ -94,14 +109,19 @@ COMMANDS = {
 }
 
 
-def load_command_phrases(base_dir: str):
-    candidates = [
+def command_csv_candidates(base_dir: str):
+    return [
         os.path.join(base_dir, "commands.csv"),
         os.path.join(base_dir, "intents.csv"),
         os.path.join(base_dir, "dataset.csv"),
     ]
 
-    phrases = set()
+
+def load_command_intents(base_dir: str) -> dict:
+    # phrase -> intent from the first usable csv; the phrases double as the grammar.
+    candidates = command_csv_candidates(base_dir)
+
+    phrases = {}
     used_file = None
 
     for path in candidates:
@@ -117,7 +137,7 @@ def load_command_phrases(base_dir: str):
                         continue
                     cmd = (row[0] if len(row) >= 1 else "").strip().strip('"').strip("'").lower()
                     if cmd:
-                        phrases.add(cmd)
+                        phrases[cmd] = (row[1] if len(row) >= 2 else "").strip().lower()
 
             if phrases:
                 used_file = os.path.basename(path)
@@ -126,16 +146,36 @@ def load_command_phrases(base_dir: str):
             warn(f"CSV read failed ({os.path.basename(path)}): {e}")
 
     if not phrases:
-        phrases = set(COMMANDS.keys()) | {"volume up", "volume down"}
+        phrases = {p: p for p in list(COMMANDS.keys()) + ["volume up", "volume down"]}
         warn(f"No CSV dataset рядом с Aidy.py. Using {len(phrases)} phrases from built-ins.")
     else:
         info(f"Command phrases loaded: {len(phrases)} (from {used_file})")
 
-    return sorted(phrases)
+    return phrases
+
+
+def asr_hypotheses(r: dict) -> list:
+    # Vosk result -> [(text, posterior)], best first. Alternatives with the same
+    # words (different alignments) are merged; without SetMaxAlternatives the
+    # result is a plain {"text": ...}.
+    alts = r.get("alternatives")
+    if alts is None:
+        t = (r.get("text") or "").strip().lower()
+        return [(t, 1.0)] if t else []
+
+    scored = [((a.get("text") or "").strip().lower(), float(a.get("confidence", 0.0))) for a in alts]
+    scored = [(t, c) for t, c in scored if t]
+    if not scored:
+        return []
+    top = max(c for _, c in scored)
+    mass = {}
+    for t, c in scored:
+        mass[t] = mass.get(t, 0.0) + math.exp((c - top) / ASR_TEMPERATURE)
+    z = sum(mass.values())
+    return sorted(((t, m / z) for t, m in mass.items()), key=lambda h: -h[1])
 
 
 class Aidy:
-    DEAFEN_MS_AFTER_TTS = 650
     FLUSH_MS = 250
     _SHORT_PATH_ENABLED = True
 
@@ -163,17 +203,45 @@ class Aidy:
         for _ in range(max(1, frames)):
             self.stream.read(CHUNK_SAMPLES, exception_on_overflow=False)
 
-    def _deafen_after_speak(self, ms: int | None = None):
+    def _read_frame(self) -> bytes:
+        if self._preroll:
+            return self._preroll.pop(0)
+        if self.stream is None:
+            return b'\x00' * (CHUNK_SAMPLES * 2)  # Mock silence data
+        data = self.stream.read(CHUNK_SAMPLES, exception_on_overflow=False)
+        return self.voice.clean_capture(data)
+
+    def _listen_through_speech(self) -> bool:
+        # Prompts play on the speech thread. Before listening, keep reading the mic
+        # while a prompt is still playing; loud input cuts it short (barge-in) and is
+        # kept as pre-roll for whoever listens next.
+        if not self.voice.speaking():
+            return False
         if not self.stream:
-            return
-        if ms is None:
-            ms = self.DEAFEN_MS_AFTER_TTS
+            self.voice.wait()
+            return False
 
-        self._flush_audio(self.FLUSH_MS)
+        loud = []
+        while self.voice.speaking():
+            if self.voice.echo_covers_speech():
+                # Echo suppression removes the prompt from the mic; recognition can
+                # run right away and barge-in is handled by the listeners.
+                return False
+            data = self.stream.read(CHUNK_SAMPLES, exception_on_overflow=False)
+            if audioop.rms(data, 2) >= BARGE_IN_THRESHOLD:
+                loud.append(data)
+                if len(loud) >= BARGE_IN_FRAMES:
+                    self.voice.cancel()
+                    self._preroll = loud
+                    info("Barge-in: prompt interrupted")
+                    return True
+            else:
+                loud = []
 
-        end = time.time() + (ms / 1000.0)
-        while time.time() < end:
-            self.stream.read(CHUNK_SAMPLES, exception_on_overflow=False)
+        # Tail of our own prompt is still in the input buffer.
+        if not self.voice.echo_covers_speech():
+            self._flush_audio(self.FLUSH_MS)
+        return False
 
     def __init__(self, base_dir: str | None = None):
         if base_dir:
@@ -181,49 +249,111 @@ class Aidy:
         else:
             self.base_dir = os.path.dirname(os.path.abspath(__file__))
 
-        self.model_path = os.path.join(self.base_dir, "vosk-model-small-en-us-0.15")
-        self.model_url = "https://alphacephei.com/vosk/models/vosk-model-small-en-us-0.15.zip"
+        self._t_start = time.perf_counter()
+        self._wake_live = False
+        self.profiler = Profiler(profile_dir(self.base_dir))
 
-        model_file = os.path.join(self.model_path, "am", "final.mdl")
-        if not os.path.exists(model_file):
-            info("Vosk model missing -> downloading...")
-            zip_path = os.path.join(self.base_dir, "vosk_model.zip")
-            try:
-                urllib.request.urlretrieve(self.model_url, zip_path)
-                with zipfile.ZipFile(zip_path, "r") as z:
-                    z.extractall(self.base_dir)
-                # os.remove(zip_path)
-                info("Vosk model downloaded")
-            except Exception as e:
-                warn(f"Failed to download Vosk model: {e}")
-
-        try:
-            model_path = self._short_path(self.model_path)
-            self.model = vosk.Model(model_path)
-        except Exception as e:
-            warn(f"Failed to load Vosk model: {e}")
-            self.model = None
+        # Found/verified/extracted and loaded in the background; wait_for_wake
+        # holds off until it's ready.
+        self.model = None
+        self.models = ModelManager(self.base_dir, VOSK_MODEL, open_path=self._short_path)
+        self.models.on_ready(self._on_model_ready)
+        self.models.start()
 
-        self.command_phrases = load_command_phrases(self.base_dir)
-        self.command_phrases = sorted(
-            set(self.command_phrases) | set(CONFIRM_GRAMMAR_PHRASES) | set(WINDOW_SWITCH_GRAMMAR)
-        )
-
-        self.apps = load_apps_config(self.base_dir)
+        self.stream = None
+        self._preroll = []
+
+        # Started first: the encoder takes longest to load. Until it's ready,
+        # commands that need it are routed locally.
+        self.intent_server = IntentServer(self.base_dir)
+        self.intent_server.on_state(self._on_intent_server_state)
+        self.intent_server.start()
+        self.api = IntentAPI(API_URL, batch_url=API_BATCH_URL)
+        self.hypotheses = []
+        self.wake_recognizer = None
+        self.window_switch_active = False
+        self.window_switch_silence_hits = 0
 
+        self.startup = StartupGraph()
+        self.startup.step("audio", self._init_audio)
+        self.startup.step("phrases", lambda: self._set_command_phrases(load_command_intents(self.base_dir)))
+        self.startup.step("apps", lambda: setattr(self, "apps", AppIndex(load_apps_config(self.base_dir))))
+        self.startup.step("voice", self._init_voice)
+        self.startup.step("watcher", self._init_watcher, after=("phrases", "apps", "voice"))
+        self.startup.step("prerender", self._prerender_prompts, after=("apps", "voice"))
+        self.startup.run()
+
+    def _init_audio(self):
+        # Opened first so the mic is live by the time the model is.
         self.audio = pyaudio.PyAudio()
-        self.stream = None
+        self.start_stream()
 
+    def _init_voice(self):
+        try:
+            import comtypes
+            comtypes.CoInitialize()   # pyttsx3/SAPI on this startup thread
+        except Exception:
+            pass
         self.voice = Voice(self.base_dir)
-        ok = start_local_intent_api(self.base_dir)
-        if not ok:
-            warn("Local Intent API not started. Will try anyway.")
-        self.api = IntentAPI(API_URL)
 
-        self.wake_recognizer = self._new_wake_recognizer() if self.model is not None else None
-
-        self.window_switch_active = False
-        self.window_switch_silence_hits = 0
+    def _init_watcher(self):
+        self.watcher = FileWatcher(interval=1.0)
+        self.watcher.watch(os.path.join(self.base_dir, "apps.json"), self._reload_apps)
+        for path in command_csv_candidates(self.base_dir):
+            self.watcher.watch(path, self._reload_command_phrases)
+        self.watcher.watch(self.voice.voice_dir, self.voice.refresh_index)
+
+    def _prerender_prompts(self):
+        self.voice.prerender(list(VOICE_RESPONSES.values()) + self._app_phrases())
+
+    def _on_intent_server_state(self, state: str, detail: str):
+        ui_metric("intent_api.state", IntentServer.STATE_CODES.get(state, -1), state=state, detail=detail)
+        if state in ("ready", "external"):
+            info(f"Intent API: {state}")
+        elif state in ("down", "failed", "unhealthy"):
+            warn(f"Intent API: {state} ({detail}); routing commands locally")
+
+    def _on_model_ready(self, model):
+        # Recognizers are built per wake/listen, so the next one uses this model.
+        self.model = model
+
+    def switch_model(self, size: str) -> bool:
+        return self.models.switch(size)
+
+    def _app_phrases(self):
+        out = []
+        for a in self.apps:
+            out += [f"Opening {a['id']}", f"Closing {a['id']}"]
+        return out
+
+    def _set_command_phrases(self, intents: dict):
+        self.command_intents = intents
+        self.api.fallback = LocalMatcher(intents)
+        phrases = sorted(set(intents) | set(CONFIRM_GRAMMAR_PHRASES) | set(WINDOW_SWITCH_GRAMMAR))
+        # One assignment, so a recognizer built mid-reload sees either the old or the new grammar.
+        self._grammar = (phrases, json.dumps(phrases), frozenset(phrases))
+
+    @property
+    def command_phrases(self):
+        return self._grammar[0]
+
+    def _reload_apps(self, path: str):
+        t0 = time.perf_counter()
+        apps = load_apps_config(self.base_dir)
+        if not apps and len(self.apps):
+            warn("Reload: apps.json gave no apps, keeping previous config")
+            return
+        self.apps = AppIndex(apps)
+        self.voice.prerender(self._app_phrases())
+        info(f"Reload: apps.json -> {len(apps)} apps in {(time.perf_counter() - t0) * 1000:.1f} ms")
+
+    def _reload_command_phrases(self, path: str):
+        t0 = time.perf_counter()
+        self._set_command_phrases(load_command_intents(self.base_dir))
+        info(
+            f"Reload: {os.path.basename(path)} -> {len(self.command_phrases)} grammar phrases "
+            f"in {(time.perf_counter() - t0) * 1000:.1f} ms"
+        )
 
     def start_stream(self):
         if self.stream is not None:
@@ -259,9 +389,11 @@ class Aidy:
     def _new_command_recognizer(self):
         if self.model is None or self.stream is None:
             return MockRecognizer(is_wake=False)
-        grammar = json.dumps(self.command_phrases)
+        grammar = self._grammar[1]
         rec = vosk.KaldiRecognizer(self.model, SAMPLE_RATE, grammar)
         rec.SetWords(True)
+        if ASR_ALTERNATIVES > 1:
+            rec.SetMaxAlternatives(ASR_ALTERNATIVES)
         return rec
 
     def _key_down(self, vk: int):
@@ -298,7 +430,6 @@ class Aidy:
 
         ui_state("SPEAKING")
         self.voice.play_or_tts("window_switch_mode", "Say left or right. Say done to select.")
-        self._deafen_after_speak()
         ui_state("IDLE")
 
     def window_switch_step(self, direction: str):
@@ -321,107 +452,185 @@ class Aidy:
         ui_state("SPEAKING")
         if cancel:
             self.voice.play_or_tts("window_switch_cancel", "Cancelled.")
-            self._deafen_after_speak()
         else:
             self.voice.play_or_tts("window_switch_done", "Done.")
-            self._deafen_after_speak()
         ui_state("IDLE")
 
     def wait_for_wake(self):
+        if self.model is None and self.models.busy():
+            ui_state("STARTING")
+            info(f"Wake: waiting for speech model ({self.models.state})...")
+            self.models.wait()
+
         ui_state("LISTENING")
         info("Wake: listening...")
 
         self.wake_recognizer = self._new_wake_recognizer()
+        if not self._wake_live:
+            self._wake_live = True
+            ms = (time.perf_counter() - self._t_start) * 1000.0
+            ui_metric("startup.wake_live", round(ms, 1))
+            info(f"Startup: listening for wake word {ms:.0f} ms after start")
 
         last_logged = ""
         last_log_t = 0.0
 
-        while True:
-            if self.stream:
-                data = self.stream.read(CHUNK_SAMPLES, exception_on_overflow=False)
-            else:
-                data = b'\x00' * (CHUNK_SAMPLES * 2)  # Mock silence data
-
-            if self.wake_recognizer.AcceptWaveform(data):
-                r = json.loads(self.wake_recognizer.Result())
-                text = (r.get("text", "") or "").lower().strip()
-                text = " ".join(text.split())
-                if not text:
-                    continue
+        self._listen_through_speech()
 
-                now = time.time()
-                if text != last_logged or (now - last_log_t) > 1.0:
-                    info(f'Wake Heard: "{text}"')
-                    last_logged = text
-                    last_log_t = now
+        while True:
+            data = self._read_frame()
+
+            with self.profiler.section("audio.wake"):
+                t_accept = time.perf_counter()
+                if self.wake_recognizer.AcceptWaveform(data):
+                    r = json.loads(self.wake_recognizer.Result())
+                    text = (r.get("text", "") or "").lower().strip()
+                    text = " ".join(text.split())
+                    if not text:
+                        continue
 
-                if is_wake_phrase(text):
-                    ui_state("PROCESSING")
-                    info(f'Wake detected: "{text}"')
-                    self.voice.play_or_tts("wake", "I am here, sir")
-                    self._deafen_after_speak()
-                    return
+                    now = time.time()
+                    if text != last_logged or (now - last_log_t) > 1.0:
+                        info(f'Wake Heard: "{text}"')
+                        last_logged = text
+                        last_log_t = now
+
+                    if is_wake_phrase(text):
+                        if self.voice.speaking():
+                            self.voice.cancel()
+                            info("Barge-in: wake word during prompt")
+                        TRACER.new_utterance()
+                        TRACER.record("wake.detect", t_accept, time.perf_counter())
+                        ui_state("PROCESSING")
+                        info(f'Wake detected: "{text}"')
+                        self.voice.play_or_tts("wake", "I am here, sir")
+                        return
 
     def listen_command_vosk(self, max_seconds=6, min_listen_ms=2000):
         ui_state("LISTENING")
         info("Command: listening...")
 
+        if TRACER.utterance is None:
+            TRACER.new_utterance()
+        t_listen = time.perf_counter()
+
         rec = self._new_command_recognizer()
 
+        self._listen_through_speech()
+        TRACER.begin("vad.wait")
+
         started = False
         silence_ms = 0
         start_time = time.time()
         best_final = ""
+        best_hyps = []
+        last_partial = ""
+        self.hypotheses = []
 
         while time.time() - start_time < max_seconds:
-            if self.stream is None:
-                data = b'\x00' * (CHUNK_SAMPLES * 2)
-            else:
-                data = self.stream.read(CHUNK_SAMPLES, exception_on_overflow=False)
-            rms = audioop.rms(data, 2)
-
-            elapsed_ms = int((time.time() - start_time) * 1000)
-
-            if not started:
-                if rms >= VAD_START_THRESHOLD:
-                    started = True
-                    silence_ms = 0
-                    debug(f"VAD: start (rms={rms})")
-                else:
-                    if elapsed_ms < min_listen_ms:
-                        continue
-            else:
-                if rms < VAD_START_THRESHOLD:
-                    silence_ms += FRAME_MS
+            data = self._read_frame()
+            with self.profiler.section("audio.listen"):
+                rms = audioop.rms(data, 2)
+
+                elapsed_ms = int((time.time() - start_time) * 1000)
+
+                if not started:
+                    if rms >= VAD_START_THRESHOLD:
+                        started = True
+                        silence_ms = 0
+                        debug(f"VAD: start (rms={rms})")
+                        TRACER.end("vad.wait")
+                        TRACER.begin("vad.speech")
+                        if self.voice.speaking():
+                            self.voice.cancel()
+                            info("Barge-in: speech during prompt")
+                    else:
+                        if elapsed_ms < min_listen_ms:
+                            continue
                 else:
-                    silence_ms = 0
-
-            if rec.AcceptWaveform(data):
-                r = json.loads(rec.Result())
-                t = (r.get("text") or "").strip().lower()
-                if t:
-                    best_final = t
-
-            if started and silence_ms >= VAD_SILENCE_MS:
-                debug("VAD: stop (silence)")
-                break
+                    if rms < VAD_START_THRESHOLD:
+                        silence_ms += FRAME_MS
+                    else:
+                        silence_ms = 0
+
+                if rec.AcceptWaveform(data):
+                    hyps = asr_hypotheses(json.loads(rec.Result()))
+                    if hyps:
+                        best_hyps = hyps
+                        best_final = hyps[0][0]
+                elif UI_MODE:
+                    p = (json.loads(rec.PartialResult()).get("partial") or "").strip().lower()
+                    if p and p != last_partial:
+                        last_partial = p
+                        ui_partial(p)
+
+                if started and silence_ms >= VAD_SILENCE_MS:
+                    debug("VAD: stop (silence)")
+                    break
+
+        TRACER.end("vad.wait")
+        TRACER.end("vad.speech")
 
         if not best_final:
-            r = json.loads(rec.FinalResult())
-            best_final = (r.get("text") or "").strip().lower()
+            with TRACER.span("asr.final"):
+                best_hyps = asr_hypotheses(json.loads(rec.FinalResult()))
+            best_final = best_hyps[0][0] if best_hyps else ""
+        TRACER.record("listen.total", t_listen, time.perf_counter())
 
         if not best_final:
             ui_state("IDLE")
             warn("Command: empty")
             self.voice.play_or_tts("not_heard", "I didn't catch that")
-            self._deafen_after_speak()
+            TRACER.end_utterance("empty")
             return None
 
+        # An exact grammar phrase on top is dispatched as heard; otherwise the
+        # alternatives are rescored with the intent model in process_command.
+        if len(best_hyps) > 1 and best_final not in self._grammar[2]:
+            self.hypotheses = best_hyps
+            debug("N-best: " + ", ".join(f"{t!r} {p:.2f}" for t, p in best_hyps))
+
         ui_command(best_final)
         info(f"Heard: \"{best_final}\"")
         return best_final
 
     def process_command(self, text: str):
+        with TRACER.span("command.total"), self.profiler.section("command"):
+            ok = self._process_command(text)
+        TRACER.end_utterance("ok" if ok else "failed")
+        return ok
+
+    def _best_hypothesis(self, hyps: list):
+        # One batched intent call for all transcripts; (text, result) of the best
+        # ASR_WEIGHT * log(asr posterior) + log(intent confidence).
+        results = self.api.get_intents([t for t, _ in hyps])
+        best = None
+        for (t, p), result in zip(hyps, results):
+            if not result or not (result.get("intent") or "").strip():
+                continue
+            confidence = float(result.get("confidence", 0) or 0)
+            if confidence <= 0 or p <= 0:
+                continue
+            score = ASR_WEIGHT * math.log(p) + math.log(confidence)
+            if best is None or score > best[0]:
+                best = (score, t, result)
+        if best is None:
+            return hyps[0][0], results[0]
+        return best[1], best[2]
+
+    def _route_locally(self, texts: list):
+        # Intent API not up: match against the dataset phrases, any N-best transcript.
+        for t in texts:
+            result = self.api.match_locally(t)
+            if result:
+                return t, result
+        debug(f"Local route: no match for \"{texts[0]}\" (API {self.intent_server.state})")
+        return texts[0], None
+
+    def _process_command(self, text: str):
+        hyps = self.hypotheses if self.hypotheses and self.hypotheses[0][0] == text else []
+        self.hypotheses = []
+
         if self.window_switch_active:
             t = (text or "").strip().lower()
 
@@ -447,7 +656,6 @@ class Aidy:
 
             ui_state("SPEAKING")
             self.voice.play_or_tts("window_switch_help", "Left or right, sir. Say done.")
-            self._deafen_after_speak()
             ui_state("IDLE")
             return False
 
@@ -459,18 +667,19 @@ class Aidy:
             if not app:
                 ui_state("WARNING")
                 self.voice.play_or_tts("app_not_found", "I couldn't find that app")
-                self._deafen_after_speak()
                 ui_state("IDLE")
                 return False
 
-            ui_state("SPEAKING")
-            self.voice.play_or_tts("close_app", f"Closing {app['id']}")
-            self._deafen_after_speak()
-
             ui_state("EXECUTING")
-            ok = close_app(app)
+            result = close_app(app, on_closing=lambda: self.voice.play_or_tts("close_app", f"Closing {app['id']}"))
 
-            if ok:
+            if result == NOT_RUNNING:
+                ui_state("WARNING")
+                self.voice.play_or_tts("app_not_running", f"{app['id']} isn't running")
+                ui_state("IDLE")
+                return False
+
+            if result == CLOSED:
                 ui_state("SUCCESS")
                 time.sleep(3.18)
                 ui_state("IDLE")
@@ -478,7 +687,6 @@ class Aidy:
 
             ui_state("ERROR")
             self.voice.play_or_tts("close_app_fail", "Sorry, I couldn't close it")
-            self._deafen_after_speak()
             time.sleep(0.18)
             ui_state("IDLE")
             return False
@@ -490,7 +698,6 @@ class Aidy:
             response = VOICE_RESPONSES.get(t0, f"Executing {t0}")
             ui_state("SPEAKING")
             self.voice.play_or_tts(t0.replace(" ", "_"), response)
-            self._deafen_after_speak()
 
             ui_state("EXECUTING")
             info(f"Exec: {t0}")
@@ -504,7 +711,6 @@ class Aidy:
                 ui_state("ERROR")
                 error(f"Exec failed: {e}")
                 self.voice.play_or_tts("exec_error", "Sorry, something went wrong")
-                self._deafen_after_speak()
                 time.sleep(0.18)
                 ui_state("IDLE")
                 return False
@@ -512,7 +718,6 @@ class Aidy:
         if t0 in ("volume up", "sound up", "increase volume", "louder", "make it louder"):
             ui_state("SPEAKING")
             self.voice.play_or_tts("volume_up", VOICE_RESPONSES.get("volume up", "Turning it up"))
-            self._deafen_after_speak()
             ui_state("EXECUTING")
             volume_steps(up=True, steps=6)
             ui_state("SUCCESS")
@@ -523,7 +728,6 @@ class Aidy:
         if t0 in ("volume down", "sound down", "decrease volume", "quieter", "make it quieter"):
             ui_state("SPEAKING")
             self.voice.play_or_tts("volume_down", VOICE_RESPONSES.get("volume down", "Turning it down"))
-            self._deafen_after_speak()
             ui_state("EXECUTING")
             volume_steps(up=False, steps=6)
             ui_state("SUCCESS")
@@ -534,7 +738,6 @@ class Aidy:
         if t0 in ("brightness up", "increase brightness", "brighten screen", "make screen brighter"):
             ui_state("SPEAKING")
             self.voice.play_or_tts("brightness_up", VOICE_RESPONSES.get("brightness up", "Making it brighter"))
-            self._deafen_after_speak()
             ui_state("EXECUTING")
             COMMANDS["brightness up"]()
             ui_state("SUCCESS")
@@ -545,7 +748,6 @@ class Aidy:
         if t0 in ("brightness down", "decrease brightness", "dim screen", "make screen darker"):
             ui_state("SPEAKING")
             self.voice.play_or_tts("brightness_down", VOICE_RESPONSES.get("brightness down", "Making it dimmer"))
-            self._deafen_after_speak()
             ui_state("EXECUTING")
             COMMANDS["brightness down"]()
             ui_state("SUCCESS")
@@ -558,7 +760,6 @@ class Aidy:
         if app:
             ui_state("SPEAKING")
             self.voice.play_or_tts("open_app", f"Opening {app['id']}")
-            self._deafen_after_speak()
 
             ui_state("EXECUTING")
             ok = launch_app(app)
@@ -578,7 +779,6 @@ class Aidy:
 
                 ui_state("ERROR")
                 self.voice.play_or_tts("open_app_fail", "Sorry, I couldn't open it")
-                self._deafen_after_speak()
                 time.sleep(0.18)
                 ui_state("IDLE")
                 return False
@@ -590,7 +790,6 @@ class Aidy:
             if app:
                 ui_state("SPEAKING")
                 self.voice.play_or_tts("open_app", f"Opening {app['id']}")
-                self._deafen_after_speak()
 
                 ui_state("EXECUTING")
                 ok = launch_app(app)
@@ -611,7 +810,6 @@ class Aidy:
 
                     ui_state("ERROR")
                     self.voice.play_or_tts("open_app_fail", "Sorry, I couldn't open it")
-                    self._deafen_after_speak()
                     time.sleep(0.18)
                     ui_state("IDLE")
                     return False
@@ -624,11 +822,24 @@ class Aidy:
         ui_state("PROCESSING")
         info("Intent: sending to API...")
 
-        result = self.api.get_intent(text)
+        with TRACER.span("intent.api") as sp:
+            if self.intent_server is not None and not self.intent_server.available():
+                text, result = self._route_locally([text] + [t for t, _ in hyps[1:]])
+                sp.args["stage"] = "local"
+            elif hyps:
+                picked, result = self._best_hypothesis(hyps)
+                sp.args["hypotheses"] = len(hyps)
+                if picked != text:
+                    info(f"N-best: \"{text}\" -> \"{picked}\"")
+                    text = picked
+            else:
+                result = self.api.get_intent(text)
+            if result:
+                sp.args.update({k: result[k] for k in ("stage", "encode_ms", "classify_ms", "lexical_ms", "cached") if k in result})
+        debug(f"Intent cache: {self.api.stats()}")
         if not result:
             ui_state("OFFLINE")
             self.voice.play_or_tts("offline", "Sorry, I couldn't connect to the server")
-            self._deafen_after_speak()
             ui_state("IDLE")
             return False
 
@@ -640,7 +851,6 @@ class Aidy:
         if confidence < 0.4:
             ui_state("WARNING")
             self.voice.play_or_tts("not_sure", "I'm not sure what you mean")
-            self._deafen_after_speak()
             ui_state("IDLE")
             return False
 
@@ -654,7 +864,6 @@ class Aidy:
                 steps = 6
                 ui_state("SPEAKING")
                 self.voice.play_or_tts(intent.replace(" ", "_"), VOICE_RESPONSES.get(intent, "Adjusting volume"))
-                self._deafen_after_speak()
                 ui_state("EXECUTING")
                 volume_steps(up, steps)
                 ui_state("SUCCESS")
@@ -665,7 +874,6 @@ class Aidy:
             if wants_absolute:
                 ui_state("SPEAKING")
                 self.voice.play_or_tts("set_volume", f"Setting volume to {n} percent")
-                self._deafen_after_speak()
                 ui_state("EXECUTING")
                 ok = set_volume_percent(n)
                 if not ok:
@@ -678,7 +886,6 @@ class Aidy:
             steps = max(1, n)
             ui_state("SPEAKING")
             self.voice.play_or_tts(intent.replace(" ", "_"), VOICE_RESPONSES.get(intent, "Adjusting volume"))
-            self._deafen_after_speak()
             ui_state("EXECUTING")
             volume_steps(up, steps)
             ui_state("SUCCESS")
@@ -698,13 +905,11 @@ class Aidy:
             if not app:
                 ui_state("WARNING")
                 self.voice.play_or_tts("app_not_found", "I couldn't find that app")
-                self._deafen_after_speak()
                 ui_state("IDLE")
                 return False
 
             ui_state("SPEAKING")
             self.voice.play_or_tts("open_app", f"Opening {app['id']}")
-            self._deafen_after_speak()
 
             ui_state("EXECUTING")
             ok = launch_app(app)
@@ -723,7 +928,6 @@ class Aidy:
                         return True
                 ui_state("ERROR")
                 self.voice.play_or_tts("open_app_fail", "Sorry, I couldn't open it")
-                self._deafen_after_speak()
                 time.sleep(0.18)
                 ui_state("IDLE")
                 return False
@@ -735,18 +939,19 @@ class Aidy:
             if not app:
                 ui_state("WARNING")
                 self.voice.play_or_tts("app_not_found", "I couldn't find that app")
-                self._deafen_after_speak()
                 ui_state("IDLE")
                 return False
 
-            ui_state("SPEAKING")
-            self.voice.play_or_tts("close_app", f"Closing {app['id']}")
-            self._deafen_after_speak()
-
             ui_state("EXECUTING")
-            ok = close_app(app)
+            result = close_app(app, on_closing=lambda: self.voice.play_or_tts("close_app", f"Closing {app['id']}"))
 
-            if ok:
+            if result == NOT_RUNNING:
+                ui_state("WARNING")
+                self.voice.play_or_tts("app_not_running", f"{app['id']} isn't running")
+                ui_state("IDLE")
+                return False
+
+            if result == CLOSED:
                 ui_state("SUCCESS")
                 time.sleep(0.18)
                 ui_state("IDLE")
@@ -754,7 +959,6 @@ class Aidy:
             else:
                 ui_state("ERROR")
                 self.voice.play_or_tts("close_app_fail", "Sorry, I couldn't close it")
-                self._deafen_after_speak()
                 time.sleep(0.18)
                 ui_state("IDLE")
                 return False
@@ -763,7 +967,6 @@ class Aidy:
             response = VOICE_RESPONSES.get(intent, f"Executing {intent}")
             ui_state("SPEAKING")
             self.voice.play_or_tts(intent.replace(" ", "_"), response)
-            self._deafen_after_speak()
 
             ui_state("EXECUTING")
             info(f"Exec: {intent}")
@@ -779,7 +982,6 @@ class Aidy:
                 ui_state("ERROR")
                 error(f"Exec failed: {e}")
                 self.voice.play_or_tts("exec_error", "Sorry, something went wrong")
-                self._deafen_after_speak()
                 time.sleep(0.18)
                 ui_state("IDLE")
                 return False
@@ -787,7 +989,6 @@ class Aidy:
         ui_state("WARNING")
         warn(f"Intent not implemented: {intent}")
         self.voice.play_or_tts("not_implemented", "I don't know how to do that yet")
-        self._deafen_after_speak()
         ui_state("IDLE")
         return False
 
@@ -797,18 +998,22 @@ class Aidy:
         info(f"API: {API_URL}")
         info(f"Grammar phrases: {len(self.command_phrases)}")
 
-        if self.model is None:
+        if self.model is None and not self.models.busy():
             ui_state("ERROR")
-            error("Vosk model not loaded")
+            error(f"Vosk model not loaded: {self.models.error}")
             ui_state("IDLE")
             # return  # Allow to continue without model for demo
+        elif self.model is None:
+            info(f"Vosk model: {self.models.name} {self.models.state} in background")
 
         ui_state("STARTING")
-        ui_state("SPEAKING")
-        self.voice.tts_blocking("Aidy is ready")
+        # Not blocking: wait_for_wake listens through the prompt like any other.
+        self.voice.play_or_tts("ready", "Aidy is ready")
 
         try:
             self.start_stream()
+            self.watcher.start()
+            self.profiler.start()
             ui_state("LISTENING")
 
             while True:
@@ -836,9 +1041,16 @@ class Aidy:
             self.voice.tts_blocking("Goodbye")
         except Exception as e:
             ui_state("ERROR")
-            error(f"Fatal: {e}")
+            fatal(f"Fatal: {e}")
         finally:
             ui_state("IDLE")
+            self.watcher.stop()
+            self.voice.close()
             self.stop_stream()
             self.audio.terminate()
+            shutdown_hosts()
+            self.intent_server.stop()
+            TRACER.close()
+            self.profiler.close()
+            info(f"Intent cache: {self.api.stats()}")
             info("AIDY stopped")
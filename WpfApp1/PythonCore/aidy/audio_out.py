@@ -0,0 +1,313 @@
+import time
+import wave
+import audioop
+import threading
+
+from .logui import debug, warn
+
+OUTPUT_RATE = 44100
+BLOCK_FRAMES = 1024
+SAMPLE_WIDTH = 2
+
+
+def to_output_pcm(clip) -> bytes | None:
+    # Mono 16-bit PCM at OUTPUT_RATE, converted once and cached on the clip.
+    pcm = getattr(clip, "_out_pcm", None)
+    if pcm is not None:
+        return pcm
+    if not getattr(clip, "pcm", None):
+        return None
+
+    pcm = clip.pcm
+    width = clip.sampwidth
+    if width == 1:
+        pcm = audioop.bias(pcm, 1, -128)   # 8-bit WAV is unsigned, audioop expects signed
+    if width != SAMPLE_WIDTH:
+        pcm = audioop.lin2lin(pcm, width, SAMPLE_WIDTH)
+    if clip.channels == 2:
+        pcm = audioop.tomono(pcm, SAMPLE_WIDTH, 0.5, 0.5)
+    elif clip.channels != 1:
+        return None
+    if clip.sample_rate != OUTPUT_RATE:
+        pcm, _ = audioop.ratecv(pcm, SAMPLE_WIDTH, 1, clip.sample_rate, OUTPUT_RATE, None)
+
+    clip._out_pcm = pcm
+    return pcm
+
+
+class Playback:
+    def __init__(self, pcm: bytes | None, priority: int = 0, rate: int = OUTPUT_RATE, duration: float | None = None):
+        self.pcm = pcm
+        self.priority = priority
+        self.pos = 0
+        self.duration = duration if duration is not None else len(pcm or b"") / float(SAMPLE_WIDTH * rate)
+        self.queued_at = time.monotonic()
+        self.started_at = None
+        self.finished_at = None
+        self.cancelled = False
+        self._done = threading.Event()
+
+    def _finish(self, cancelled: bool = False):
+        if self._done.is_set():
+            return
+        self.cancelled = cancelled
+        self.finished_at = time.monotonic()
+        self._done.set()
+
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def wait(self, timeout: float | None = None) -> bool:
+        return self._done.wait(timeout)
+
+    def cancel(self):
+        self._finish(cancelled=True)
+
+    def elapsed(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        end = self.finished_at if self.finished_at is not None else time.monotonic()
+        return end - self.started_at
+
+
+class Mixer:
+    def __init__(self, rate: int = OUTPUT_RATE):
+        self.rate = rate
+        self._active: list[Playback] = []
+        self._lock = threading.Lock()
+        self.blocks = 0
+
+    def play(self, pcm: bytes, priority: int = 0, exclusive: bool = False) -> Playback:
+        pb = Playback(pcm, priority, self.rate)
+        with self._lock:
+            if exclusive:
+                # Exclusive prompts cut everything at the same or lower priority.
+                for other in self._active:
+                    if other.priority <= priority:
+                        other.cancel()
+            self._active = [p for p in self._active if not p.done()]
+            self._active.append(pb)
+        return pb
+
+    def stop_all(self):
+        with self._lock:
+            for p in self._active:
+                p.cancel()
+            self._active = []
+
+    def busy(self) -> bool:
+        with self._lock:
+            return any(not p.done() for p in self._active)
+
+    def read(self, frames: int) -> bytes:
+        nbytes = frames * SAMPLE_WIDTH
+        out = bytes(nbytes)
+        now = time.monotonic()
+        with self._lock:
+            alive = []
+            for p in self._active:
+                if p.done():
+                    continue
+                if p.started_at is None:
+                    p.started_at = now
+                chunk = p.pcm[p.pos: p.pos + nbytes]
+                p.pos += len(chunk)
+                if len(chunk) < nbytes:
+                    chunk += bytes(nbytes - len(chunk))
+                out = audioop.add(out, chunk, SAMPLE_WIDTH)
+                if p.pos >= len(p.pcm):
+                    p._finish()
+                else:
+                    alive.append(p)
+            self._active = alive
+            self.blocks += 1
+        return out
+
+
+class PyAudioSink:
+    def __init__(self, mixer: Mixer):
+        self.mixer = mixer
+        self._pa = None
+        self._stream = None
+
+    def start(self):
+        if self._stream is not None:
+            return
+        import pyaudio
+
+        def callback(in_data, frame_count, time_info, status):
+            return self.mixer.read(frame_count), pyaudio.paContinue
+
+        self._pa = pyaudio.PyAudio()
+        self._stream = self._pa.open(
+            format=pyaudio.paInt16,
+            channels=1,
+            rate=self.mixer.rate,
+            output=True,
+            frames_per_buffer=BLOCK_FRAMES,
+            stream_callback=callback,
+        )
+        self._stream.start_stream()
+        debug("Audio out: PyAudio stream started")
+
+    def close(self):
+        if self._stream is not None:
+            try:
+                self._stream.stop_stream()
+                self._stream.close()
+            except Exception:
+                pass
+            self._stream = None
+        if self._pa is not None:
+            self._pa.terminate()
+            self._pa = None
+
+
+# Pulls blocks from the mixer on its own clock. With a path it records the output
+# to a WAV file; realtime=False drains as fast as possible (for tests).
+class NullSink:
+    def __init__(self, mixer: Mixer, path: str | None = None, realtime: bool = True):
+        self.mixer = mixer
+        self.path = path
+        self.realtime = realtime
+        self._wav = None
+        self._thread = None
+        self._stop = threading.Event()
+        self.frames_written = 0
+
+    def start(self):
+        if self._thread is not None:
+            return
+        if self.path:
+            self._wav = wave.open(self.path, "wb")
+            self._wav.setnchannels(1)
+            self._wav.setsampwidth(SAMPLE_WIDTH)
+            self._wav.setframerate(self.mixer.rate)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="aidy-audio-null", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        block_sec = BLOCK_FRAMES / float(self.mixer.rate)
+        next_t = time.monotonic()
+        while not self._stop.is_set():
+            busy = self.mixer.busy()
+            data = self.mixer.read(BLOCK_FRAMES)
+            if self._wav is not None and busy:
+                self._wav.writeframes(data)
+            self.frames_written += BLOCK_FRAMES
+            if self.realtime or not busy:
+                next_t += block_sec
+                delay = next_t - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    next_t = time.monotonic()
+
+    def close(self):
+        self._stop.set()
+        t, self._thread = self._thread, None
+        if t is not None:
+            t.join(timeout=1.0)
+        if self._wav is not None:
+            self._wav.close()
+            self._wav = None
+
+
+class MciBackend:
+    # The original winmm MCI path: one clip at a time, opened from its file.
+    POLL_SEC = 0.03
+
+    def __init__(self, alias: str = "aidyvoice"):
+        from .voice import play_audio_async, mci, mci_status
+        self.alias = alias
+        self._play = play_audio_async
+        self._mci = mci
+        self._status = mci_status
+        self._current = None
+
+    def start(self):
+        pass
+
+    def play_clip(self, clip, priority: int = 0, exclusive: bool = False) -> Playback | None:
+        self.stop()
+        if not self._play(clip.path, alias=self.alias):
+            return None
+        pb = Playback(None, priority, duration=getattr(clip, "duration", 0.0) or None)
+        pb.started_at = time.monotonic()
+        self._current = pb
+        threading.Thread(target=self._watch, args=(pb,), daemon=True).start()
+        return pb
+
+    def _watch(self, pb: Playback):
+        while not pb.done():
+            time.sleep(self.POLL_SEC)
+            if pb.done():
+                return
+            if self._status(self.alias, "mode") != "playing":
+                pb._finish()
+
+    def stop(self):
+        pb, self._current = self._current, None
+        if pb is not None and not pb.done():
+            self._mci(f"stop {self.alias}")
+            pb.cancel()
+
+    def close(self):
+        self.stop()
+        self._mci(f"close {self.alias}")
+
+
+class AudioOutput:
+    def __init__(self, kind: str = "mixer"):
+        self.kind = kind
+        self.mixer = Mixer()
+        self.sink = None
+        self.mci = None
+
+        mode = kind.lower()
+        if mode == "mci":
+            self.mci = MciBackend()
+        elif mode == "null":
+            self.sink = NullSink(self.mixer)
+        elif mode.startswith("file:"):
+            self.sink = NullSink(self.mixer, path=kind[len("file:"):])
+        else:
+            self.sink = PyAudioSink(self.mixer)
+
+    def _mci_backend(self):
+        if self.mci is None:
+            self.mci = MciBackend()
+        return self.mci
+
+    # exclusive=True cuts playbacks at the same or lower priority; otherwise the
+    # clip is mixed over whatever is playing.
+    def play_clip(self, clip, priority: int = 0, exclusive: bool = False) -> Playback | None:
+        pcm = to_output_pcm(clip) if self.sink is not None else None
+        if pcm is None:
+            # MP3 or MCI mode.
+            try:
+                return self._mci_backend().play_clip(clip, priority, exclusive)
+            except Exception as e:
+                warn(f"Audio out (mci) failed: {e}")
+                return None
+
+        try:
+            self.sink.start()
+        except Exception as e:
+            warn(f"Audio out ({self.kind}) failed, falling back to MCI: {e}")
+            self.sink = None
+            return self._mci_backend().play_clip(clip, priority, exclusive)
+        return self.mixer.play(pcm, priority=priority, exclusive=exclusive)
+
+    def stop(self):
+        self.mixer.stop_all()
+        if self.mci is not None:
+            self.mci.stop()
+
+    def close(self):
+        self.stop()
+        if self.sink is not None:
+            self.sink.close()
+        if self.mci is not None:
+            self.mci.close()
@@ -0,0 +1,365 @@
+import os
+import csv
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+
+from . import logui
+from . import assistant
+from .apps import AppIndex, load_apps_config, CLOSED
+from .profiling import Profiler
+from .trace import percentile
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+
+ROUTES = ("window_switch", "close", "commands", "tuple", "app", "switch", "api")
+
+UNKNOWN_TEXT = [
+    "what is the weather like",
+    "tell me a joke",
+    "blue elephant seventeen",
+    "how are you today",
+    "remind me to call mom",
+    "",
+]
+
+VOLUME_VARIANTS = [
+    ("set volume to {n} percent", "volume up"),
+    ("volume to {n}", "volume up"),
+    ("turn the volume up {n}", "volume up"),
+    ("lower the volume by {n}", "volume down"),
+    ("volume {n}%", "volume down"),
+]
+
+WINDOW_SWITCH_WORDS = ["left", "right", "next", "previous", "done", "cancel", "banana"]
+
+
+class _NoSleepTime:
+    # Stands in for the time module inside the dispatcher: sleeps are skipped
+    # (and added up) so they don't count towards latency.
+    def __init__(self):
+        self.skipped = 0.0
+
+    def sleep(self, sec):
+        self.skipped += sec
+
+    def __getattr__(self, name):
+        return getattr(time, name)
+
+
+class StubVoice:
+    def __init__(self):
+        self.prompts = 0
+
+    def play_or_tts(self, key, text):
+        self.prompts += 1
+
+    def speaking(self):
+        return False
+
+    def cancel(self):
+        pass
+
+
+class StubIntentAPI:
+    # Dataset lookup in place of the encoder. With a cascade, the server's
+    # lexical first stage runs for real and answers when it clears its gate.
+    def __init__(self, intents: dict, cascade=None):
+        self.intents = intents
+        self.cascade = cascade
+        self.calls = 0
+        self.lexical = 0
+
+    def get_intent(self, text):
+        self.calls += 1
+        t = " ".join((text or "").lower().split())
+        if self.cascade is not None:
+            model, id2intent, min_conf, min_margin, excluded = self.cascade
+            col, p, m = model.top2(t)
+            intent = id2intent.get(str(int(model.classes_[col])), "")
+            if p >= min_conf and m >= min_margin and intent not in excluded:
+                self.lexical += 1
+                return {"text": t, "intent": intent, "confidence": p, "stage": "lexical"}
+        intent = self.intents.get(t, "")
+        return {"text": t, "intent": intent, "confidence": 0.9 if intent else 0.1, "stage": "encoder"}
+
+    def stats(self):
+        return {"calls": self.calls, "lexical": self.lexical}
+
+
+def load_cascade(base_dir: str):
+    # The intent server's first stage: Api/lexical.py with the current model's lexical.npz.
+    api_dir = os.path.join(base_dir, "Api")
+    art_dir = os.path.join(api_dir, "aidy_intent_model")
+    try:
+        with open(os.path.join(art_dir, "CURRENT"), "r", encoding="utf-8") as f:
+            version = f.read().strip()
+        if version and os.path.isdir(os.path.join(art_dir, "versions", version)):
+            art_dir = os.path.join(art_dir, "versions", version)
+    except OSError:
+        pass
+
+    if api_dir not in sys.path:
+        sys.path.insert(0, api_dir)
+    import lexical
+
+    with open(os.path.join(art_dir, "id2intent.json"), "r", encoding="utf-8") as f:
+        id2intent = json.load(f)
+    model = lexical.LexicalModel.load(os.path.join(art_dir, lexical.LEXICAL_FILE))
+    return model, id2intent, lexical.LEXICAL_MIN_CONFIDENCE, lexical.LEXICAL_MIN_MARGIN, lexical.LEXICAL_EXCLUDED_INTENTS
+
+
+def load_dataset(base_dir: str) -> dict:
+    out = {}
+    path = os.path.join(base_dir, "commands.csv")
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        for row in csv.reader(f):
+            if len(row) < 2 or row[0].strip().lower() == "command":
+                continue
+            cmd = " ".join(row[0].strip().strip('"').strip("'").lower().split())
+            if cmd:
+                out[cmd] = row[1].strip().lower()
+    return out
+
+
+def build_workload(dataset: dict, apps: AppIndex) -> list:
+    # (text, window_switch_active) pairs; the stub API knows the intent of every
+    # generated variant.
+    work = [(t, False) for t in dataset]
+    aliases = sorted({a.lower() for app in apps for a in app.get("aliases", [])})
+    for alias in aliases:
+        work += [(alias, False), (f"open {alias}", False), (f"launch {alias}", False), (f"close {alias}", False)]
+        dataset.setdefault(f"please open {alias}", "open app")
+        work.append((f"please open {alias}", False))
+    for n in (5, 20, 35, 80):
+        for fmt, intent in VOLUME_VARIANTS:
+            text = fmt.format(n=n)
+            dataset.setdefault(text, intent)
+            work.append((text, False))
+    work += [(t, False) for t in UNKNOWN_TEXT]
+    work += [("close notarealapp", False), ("open notarealapp", False)]
+    work += [(w, True) for w in WINDOW_SWITCH_WORDS]
+    return work
+
+
+class DispatchBench:
+    def __init__(self, base_dir: str, cascade: bool = False):
+        self.base_dir = base_dir
+        self.dataset = load_dataset(base_dir)
+        self.apps = AppIndex(load_apps_config(base_dir))
+        self.workload = build_workload(self.dataset, self.apps)
+        self.api = StubIntentAPI(self.dataset, load_cascade(base_dir) if cascade else None)
+        self.clock = _NoSleepTime()
+        self.os_calls = 0
+        self._launched = False
+        self.bot = self._make_bot()
+
+    def _os_action(self, *args, **kwargs):
+        self.os_calls += 1
+        return True
+
+    def _make_bot(self):
+        # Skips Aidy.__init__: no model, audio, TTS or intent server.
+        bot = assistant.Aidy.__new__(assistant.Aidy)
+        bot.base_dir = self.base_dir
+        bot.apps = self.apps
+        bot.voice = StubVoice()
+        bot.api = self.api
+        bot.hypotheses = []
+        bot.intent_server = None
+        bot.profiler = Profiler(None)
+        bot.window_switch_active = False
+        bot.window_switch_silence_hits = 0
+        bot._key_down = bot._key_up = bot._press = self._os_action
+        bot._open_default_browser = self._os_action
+        return bot
+
+    def _patch(self):
+        saved = {
+            name: getattr(assistant, name)
+            for name in ("time", "launch_app", "close_app", "volume_steps", "set_volume_percent")
+        }
+        saved_commands = dict(assistant.COMMANDS)
+        saved_level = logui.LOG_LEVEL
+
+        assistant.time = self.clock
+        assistant.launch_app = self._launch
+        assistant.close_app = self._close
+        assistant.volume_steps = self._os_action
+        assistant.set_volume_percent = self._os_action
+        for k in assistant.COMMANDS:
+            assistant.COMMANDS[k] = self._os_action
+        logui.LOG_LEVEL = "FATAL"
+
+        def restore():
+            for name, value in saved.items():
+                setattr(assistant, name, value)
+            assistant.COMMANDS.update(saved_commands)
+            logui.LOG_LEVEL = saved_level
+        return restore
+
+    def _launch(self, app):
+        self._launched = True
+        return self._os_action()
+
+    def _close(self, app, on_closing=None):
+        if on_closing is not None:
+            on_closing()
+        self._os_action()
+        return CLOSED
+
+    def _route(self, text: str, ws_active: bool, api_before: int) -> str:
+        # Mirrors the dispatcher's order; the API and launch routes are observed.
+        if ws_active:
+            return "window_switch"
+        t = (text or "").strip().lower()
+        if t.startswith(("close ", "quit ", "exit ", "kill ", "stop ")):
+            return "close"
+        t = " ".join(t.split())
+        if t in assistant.COMMANDS:
+            return "commands"
+        if self.api.calls > api_before:
+            return "api"
+        if self._launched:
+            return "app"
+        if t == "switch" or t.startswith("switch "):
+            return "switch"
+        return "tuple"
+
+    def run(self, rounds: int = 20, seed: int = 1) -> dict:
+        rng = random.Random(seed)
+        samples = {r: [] for r in ROUTES}
+        restore = self._patch()
+        bot = self.bot
+        try:
+            # Warm-up pass (AppIndex, regex and dict paths).
+            for text, ws in self.workload:
+                bot.window_switch_active = ws
+                bot.process_command(text)
+            self.clock.skipped = 0.0
+            self.api.calls = self.api.lexical = 0
+
+            t_start = time.perf_counter()
+            for _ in range(rounds):
+                items = list(self.workload)
+                rng.shuffle(items)
+                for text, ws in items:
+                    bot.window_switch_active = ws
+                    self._launched = False
+                    api_before = self.api.calls
+                    t0 = time.perf_counter()
+                    bot.process_command(text)
+                    dt = time.perf_counter() - t0
+                    samples[self._route(text, ws, api_before)].append(dt)
+            wall = time.perf_counter() - t_start
+        finally:
+            restore()
+            bot.window_switch_active = False
+
+        total = sum(len(v) for v in samples.values())
+        busy = sum(sum(v) for v in samples.values())
+        routes = {}
+        for name, xs in samples.items():
+            if not xs:
+                continue
+            us = [x * 1e6 for x in xs]
+            routes[name] = {
+                "n": len(xs),
+                "ops_per_sec": round(len(xs) / sum(xs), 1),
+                "mean_us": round(sum(us) / len(us), 1),
+                "p50_us": round(percentile(us, 0.5), 1),
+                "p90_us": round(percentile(us, 0.9), 1),
+                "p99_us": round(percentile(us, 0.99), 1),
+            }
+        return {
+            "machine": f"{platform.system()} {platform.machine()} py{platform.python_version()}",
+            "rounds": rounds,
+            "phrases": len(self.workload),
+            "commands": total,
+            "ops_per_sec": round(total / busy, 1) if busy else 0.0,
+            "wall_sec": round(wall, 3),
+            "sleep_skipped_sec": round(self.clock.skipped, 2),
+            "api_calls": self.api.calls,
+            "api_lexical_fraction": round(self.api.lexical / self.api.calls, 4) if self.api.calls else 0.0,
+            "cascade": self.api.cascade is not None,
+            "routes": routes,
+        }
+
+
+def format_report(res: dict) -> str:
+    lines = [
+        f"{res['commands']} commands ({res['phrases']} phrases x {res['rounds']} rounds) on {res['machine']}",
+        f"throughput {res['ops_per_sec']:.0f} cmd/s, wall {res['wall_sec']:.2f}s, sleeps skipped {res['sleep_skipped_sec']:.0f}s",
+        f"{'route':<14}{'n':>7}{'cmd/s':>11}{'mean':>10}{'p50':>10}{'p90':>10}{'p99':>10}  (us)",
+    ]
+    for name in ROUTES:
+        r = res["routes"].get(name)
+        if r:
+            lines.append(
+                f"{name:<14}{r['n']:>7}{r['ops_per_sec']:>11.0f}{r['mean_us']:>10.1f}"
+                f"{r['p50_us']:>10.1f}{r['p90_us']:>10.1f}{r['p99_us']:>10.1f}"
+            )
+    if res.get("cascade"):
+        lines.append(f"intent API: {res['api_calls']} calls, {res['api_lexical_fraction']:.0%} answered by the lexical stage")
+    return "\n".join(lines)
+
+
+def compare(res: dict, base: dict, tolerance: float) -> list:
+    # Per-route p50 and overall throughput must not be worse than the baseline.
+    problems = []
+    if res["ops_per_sec"] < base["ops_per_sec"] * (1.0 - tolerance):
+        problems.append(f"throughput {res['ops_per_sec']:.0f} < baseline {base['ops_per_sec']:.0f} cmd/s")
+    for name, b in base.get("routes", {}).items():
+        r = res["routes"].get(name)
+        if r is None:
+            continue
+        if r["p50_us"] > b["p50_us"] * (1.0 + tolerance):
+            problems.append(f"{name}: p50 {r['p50_us']:.1f}us > baseline {b['p50_us']:.1f}us")
+    return problems
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m aidy.bench", description="Benchmark Aidy.process_command dispatch")
+    ap.add_argument("--base-dir", default=os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+    ap.add_argument("--rounds", type=int, default=20)
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--baseline", default=BASELINE_PATH)
+    ap.add_argument("--save", action="store_true", help="record this run as the baseline")
+    ap.add_argument("--check", action="store_true", help="exit 1 if slower than the baseline")
+    ap.add_argument("--tolerance", type=float, default=0.15, help="allowed regression (0.15 = 15%%)")
+    ap.add_argument("--json", action="store_true")
+    ap.add_argument("--cascade", action="store_true", help="run the intent server's lexical first stage in the API stub")
+    args = ap.parse_args(argv)
+
+    res = DispatchBench(args.base_dir, cascade=args.cascade).run(rounds=args.rounds, seed=args.seed)
+    print(json.dumps(res, indent=2) if args.json else format_report(res))
+
+    if args.save:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(res, f, indent=2)
+            f.write("\n")
+        print(f"Baseline saved: {args.baseline}")
+        return 0
+
+    if args.check:
+        if not os.path.exists(args.baseline):
+            print(f"No baseline at {args.baseline} (run with --save)")
+            return 1
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            base = json.load(f)
+        if base.get("machine") != res["machine"]:
+            print(f"Note: baseline was recorded on {base.get('machine')}")
+        problems = compare(res, base, args.tolerance)
+        for p in problems:
+            print(f"REGRESSION {p}")
+        if problems:
+            return 1
+        print("OK: not slower than baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
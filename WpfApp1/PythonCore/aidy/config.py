@@ -1,4 +1,11 @@
-﻿API_URL = "http://127.0.0.1:8008/predict"
+﻿import os
+
+API_URL = "http://127.0.0.1:8008/predict"
+API_BATCH_URL = "http://127.0.0.1:8008/predict_batch"
+
+# Intent API worker processes. 1 = plain uvicorn; more runs Api/serve.py, which
+# loads the model once, forks the workers and shares one result cache.
+API_WORKERS = max(1, int(os.environ.get("AIDY_API_WORKERS", "1") or 1))
 
 WAKE_KEYWORDS = {
     "aidy",
@@ -35,12 +42,60 @@ def is_wake_phrase(text: str) -> bool:
     return False
 
 
+# Vosk speech model: AIDY_VOSK_MODEL is a size below or a model directory name.
+# Archives are taken from disk first (AIDY_VOSK_ARCHIVE, AIDY_VOSK_MIRROR if it's
+# a directory, <base>/<name>.zip); otherwise downloaded in the background from
+# AIDY_VOSK_MIRROR (a base URL) or alphacephei.com, unless AIDY_VOSK_DOWNLOAD=0.
+# Archives are checked before extracting against, in order: the SHA-256 pinned for
+# that model in VOSK_SHA256, a <archive>.sha256 file next to it, or (for downloads
+# from alphacephei.com) the MD5 published in its model-list.json.
+VOSK_MODELS = {
+    "small": "vosk-model-small-en-us-0.15",
+    "medium": "vosk-model-en-us-0.22-lgraph",
+    "large": "vosk-model-en-us-0.22",
+}
+VOSK_MODEL = os.environ.get("AIDY_VOSK_MODEL", "small").strip() or "small"
+VOSK_ARCHIVE = os.environ.get("AIDY_VOSK_ARCHIVE", "").strip()
+VOSK_MIRROR = os.environ.get("AIDY_VOSK_MIRROR", "").strip()
+
+
+# AIDY_VOSK_SHA256="name=hash,name=hash"; a bare hash pins AIDY_VOSK_MODEL only,
+# so switching to another size never checks its archive against this one.
+def _vosk_sha256(raw: str) -> dict:
+    out = {}
+    for item in raw.replace(";", ",").split(","):
+        name, sep, digest = item.strip().lower().rpartition("=")
+        if digest:
+            out[VOSK_MODELS.get(name.strip(), name.strip()) if sep else VOSK_MODELS.get(VOSK_MODEL, VOSK_MODEL)] = digest.strip()
+    return out
+
+
+VOSK_SHA256 = _vosk_sha256(os.environ.get("AIDY_VOSK_SHA256", ""))
+VOSK_DOWNLOAD = os.environ.get("AIDY_VOSK_DOWNLOAD", "1").strip().lower() not in ("0", "false", "no", "off")
+
 SAMPLE_RATE = 16000
 CHUNK_SAMPLES = 4000
 FRAME_MS = 250
 VAD_START_THRESHOLD = 250
 VAD_SILENCE_MS = 650
 
+# N-best command recognition. When the top transcript isn't an exact grammar
+# phrase, all alternatives go to the intent API in one batch and the winner is
+# picked by ASR_WEIGHT * log(asr posterior) + log(intent confidence).
+# At most 16: the API's /predict_batch refuses larger batches (BATCH_MAX).
+ASR_ALTERNATIVES = min(16, max(1, int(os.environ.get("AIDY_ASR_ALTERNATIVES", "5") or 1)))
+ASR_TEMPERATURE = float(os.environ.get("AIDY_ASR_TEMPERATURE", "1.0"))
+ASR_WEIGHT = float(os.environ.get("AIDY_ASR_WEIGHT", "0.5"))
+
+# Mic level that counts as the user talking over a prompt (well above VAD start,
+# so the prompt leaking into the mic doesn't trigger it).
+BARGE_IN_THRESHOLD = 900
+BARGE_IN_FRAMES = 1
+
+# Prompt playback: "mixer" (in-process PyAudio mixer), "mci" (winmm, one clip at a
+# time), "null" or "file:<path.wav>" (no device, for testing output timing).
+AUDIO_OUTPUT = os.environ.get("AIDY_AUDIO_OUT", "mixer").strip()
+
 
 DANGEROUS_INTENTS = {"shutdown", "restart"}
 
@@ -0,0 +1,144 @@
+import threading
+
+import numpy as np
+
+from .config import SAMPLE_RATE
+
+
+def clip_reference(clip) -> np.ndarray | None:
+    # Mono float32 at SAMPLE_RATE, cached on the clip.
+    ref = getattr(clip, "_echo_ref", None)
+    if ref is not None:
+        return ref
+    if not getattr(clip, "pcm", None) or clip.sampwidth != 2:
+        return None
+
+    x = np.frombuffer(clip.pcm, dtype="<i2").astype(np.float32)
+    if clip.channels > 1:
+        x = x[: len(x) - len(x) % clip.channels].reshape(-1, clip.channels).mean(axis=1)
+    if clip.sample_rate != SAMPLE_RATE and len(x):
+        n_out = int(round(len(x) * SAMPLE_RATE / float(clip.sample_rate)))
+        x = np.interp(
+            np.linspace(0, len(x) - 1, n_out, dtype=np.float64),
+            np.arange(len(x), dtype=np.float64),
+            x,
+        ).astype(np.float32)
+
+    clip._echo_ref = x
+    return x
+
+
+def best_lag(mic: np.ndarray, ref: np.ndarray):
+    # Lag into ref where mic correlates best, and the normalized score (0..1).
+    n = len(mic)
+    if len(ref) < n:
+        return 0, 0.0
+    nfft = 1 << (len(ref) + n - 1).bit_length()
+    corr = np.fft.irfft(np.fft.rfft(ref, nfft) * np.conj(np.fft.rfft(mic, nfft)), nfft)[: len(ref) - n + 1]
+
+    csum = np.concatenate(([0.0], np.cumsum(ref.astype(np.float64) ** 2)))
+    seg_energy = csum[n:] - csum[:-n]
+    # Near-silent stretches of the reference would otherwise score as perfect matches.
+    seg_energy = np.maximum(seg_energy, 0.05 * seg_energy.max())
+    denom = np.sqrt(np.maximum(seg_energy, 1e-9)) * (np.linalg.norm(mic) + 1e-9)
+    score = corr / denom
+
+    lag = int(np.argmax(score))
+    return lag, float(score[lag])
+
+
+# Removes our own prompt from the mic signal. The speech worker registers the
+# PCM it starts playing; each captured frame is matched against that reference
+# (delay found by cross-correlation), the scaled echo is subtracted and what is
+# left is gated when it is mostly echo residue.
+class EchoSuppressor:
+    MAX_LEAD_SEC = 0.25
+    MAX_DELAY_SEC = 0.6
+    MIN_SCORE = 0.3
+    RESIDUAL_GATE = 0.3
+    GATE_GAIN = 0.1
+
+    def __init__(self, sample_rate: int = SAMPLE_RATE):
+        self.sample_rate = sample_rate
+        self._lock = threading.Lock()
+        self._ref = None
+        self._ref_t0 = 0.0
+        self.delay_sec = None
+
+        self.frames = 0
+        self.frames_cleaned = 0
+
+    def start_reference(self, clip, t0: float) -> bool:
+        ref = clip_reference(clip)
+        with self._lock:
+            self._ref = ref
+            self._ref_t0 = t0
+        return ref is not None
+
+    def stop_reference(self, t_end: float | None = None):
+        # Playback ended at t_end (cut short or not): keep only what was played,
+        # so its room tail is still removed for MAX_DELAY_SEC; process() then
+        # drops the buffer. Without t_end the reference is dropped at once.
+        with self._lock:
+            if self._ref is None or t_end is None:
+                self._ref = None
+                return
+            played = max(0, int((t_end - self._ref_t0) * self.sample_rate))
+            self._ref = self._ref[:played]
+
+    def active(self, now: float) -> bool:
+        with self._lock:
+            ref, t0 = self._ref, self._ref_t0
+        if ref is None:
+            return False
+        return now < t0 + len(ref) / float(self.sample_rate) + self.MAX_DELAY_SEC
+
+    def process(self, frame: bytes, t_end: float) -> bytes:
+        with self._lock:
+            ref, t0 = self._ref, self._ref_t0
+            if ref is not None and t_end > t0 + len(ref) / float(self.sample_rate) + self.MAX_DELAY_SEC:
+                self._ref = ref = None
+        if ref is None:
+            return frame
+
+        mic = np.frombuffer(frame, dtype="<i2").astype(np.float32)
+        out = self.process_array(mic, ref, t_end - len(mic) / float(self.sample_rate) - t0)
+        if out is None:
+            return frame
+        return np.clip(out, -32768, 32767).astype("<i2").tobytes()
+
+    def process_array(self, mic: np.ndarray, ref: np.ndarray, offset_sec: float):
+        sr = self.sample_rate
+        n = len(mic)
+        self.frames += 1
+
+        lead = int(self.MAX_LEAD_SEC * sr)
+        delay = int(self.MAX_DELAY_SEC * sr)
+        start = int(round(offset_sec * sr)) - delay
+        end = start + n + delay + lead
+        if end <= 0 or start >= len(ref):
+            return None
+
+        window = np.zeros(end - start, dtype=np.float32)
+        a, b = max(0, start), min(len(ref), end)
+        window[a - start: b - start] = ref[a:b]
+        if not window.any():
+            return None
+
+        lag, score = best_lag(mic, window)
+        if score < self.MIN_SCORE:
+            return None
+
+        echo = window[lag: lag + n]
+        gain = float(np.dot(mic, echo) / (np.dot(echo, echo) + 1e-9))
+        gain = max(0.0, min(4.0, gain))
+        residual = mic - gain * echo
+
+        self.delay_sec = offset_sec - (start + lag) / float(sr)
+        self.frames_cleaned += 1
+
+        mic_rms = float(np.sqrt(np.mean(mic ** 2)) + 1e-9)
+        res_rms = float(np.sqrt(np.mean(residual ** 2)))
+        if res_rms < self.RESIDUAL_GATE * mic_rms:
+            residual *= self.GATE_GAIN
+        return residual
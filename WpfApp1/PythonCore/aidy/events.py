@@ -0,0 +1,204 @@
+import sys
+import json
+import time
+import queue
+import argparse
+import itertools
+import threading
+
+EVENT_TYPES = ("state", "command", "partial", "metric", "log")
+
+# Event types the UI reacts to; these are flushed as soon as they're written.
+URGENT_TYPES = {"state", "command"}
+
+LEVEL_SEVERITY = {"DEBUG": "debug", "INFO": "info", "WARN": "warn", "ERROR": "error", "FATAL": "fatal"}
+
+
+# Line-delimited JSON events for the UI bridge. emit() only enqueues; a writer
+# thread writes everything that's pending in one go and flushes right away for
+# urgent events, otherwise at most every FLUSH_INTERVAL.
+class EventWriter:
+    FLUSH_INTERVAL = 0.05
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+        self._seq = itertools.count(1)
+        self._seq_lock = threading.Lock()
+        self._q = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="aidy-events", daemon=True)
+        self._thread.start()
+
+        self.events = 0
+        self.flushes = 0
+
+    def emit(self, etype: str, sev: str = "info", **fields):
+        with self._seq_lock:
+            ev = {"seq": next(self._seq), "t": round(time.monotonic(), 6), "type": etype, "sev": sev}
+            ev.update(fields)
+            self._q.put(ev)
+        return ev
+
+    def _run(self):
+        last_flush = time.monotonic()
+        dirty = False
+        while True:
+            timeout = None
+            if dirty:
+                timeout = max(0.0, self.FLUSH_INTERVAL - (time.monotonic() - last_flush))
+            try:
+                ev = self._q.get(timeout=timeout)
+            except queue.Empty:
+                ev = None
+
+            batch = [] if ev is None else [ev]
+            while True:
+                try:
+                    batch.append(self._q.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = False
+            urgent = False
+            lines = []
+            for e in batch:
+                if e is None:
+                    stop = True
+                    continue
+                urgent = urgent or e["type"] in URGENT_TYPES
+                lines.append(json.dumps(e, ensure_ascii=False, separators=(",", ":")))
+
+            try:
+                if lines:
+                    self.stream.write("\n".join(lines) + "\n")
+                    self.events += len(lines)
+                    dirty = True
+                if dirty and (urgent or stop or time.monotonic() - last_flush >= self.FLUSH_INTERVAL):
+                    self.stream.flush()
+                    self.flushes += 1
+                    last_flush = time.monotonic()
+                    dirty = False
+            except Exception:
+                pass
+
+            if stop:
+                return
+
+    def close(self, timeout: float = 1.0):
+        self._q.put(None)
+        self._thread.join(timeout)
+
+
+def parse_line(line: str) -> dict | None:
+    # Accepts JSON events and the legacy "STATE:" / "COMMAND:" / plain log lines.
+    line = (line or "").strip()
+    if not line:
+        return None
+    if line.startswith("{"):
+        try:
+            ev = json.loads(line)
+        except ValueError:
+            return None
+        return ev if isinstance(ev, dict) and "type" in ev else None
+    if line.startswith("STATE:"):
+        return {"type": "state", "state": line[len("STATE:"):].strip().upper()}
+    if line.startswith("COMMAND:"):
+        return {"type": "command", "text": line[len("COMMAND:"):].strip()}
+    return {"type": "log", "sev": "info", "msg": line}
+
+
+def read_events(path: str):
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            ev = parse_line(line)
+            if ev is not None:
+                yield ev
+
+
+def format_event(ev: dict, t0: float | None = None) -> str:
+    t = ev.get("t")
+    rel = f"{t - t0:9.3f}s" if (t is not None and t0 is not None) else " " * 10
+    etype = ev.get("type", "?")
+    if etype == "state":
+        body = ev.get("state", "")
+    elif etype in ("command", "partial"):
+        body = f'"{ev.get("text", "")}"'
+    elif etype == "metric":
+        body = f'{ev.get("name", "")}={ev.get("value")}'
+    else:
+        body = ev.get("msg", "")
+    return f"{rel} #{ev.get('seq', '-'):<5} {etype:<8} {ev.get('sev', 'info'):<5} {body}"
+
+
+def replay(path: str, speed: float = 0.0, types: set | None = None, out=None):
+    out = out or sys.stdout
+    t0 = None
+    wall0 = time.monotonic()
+    for ev in read_events(path):
+        if types and ev.get("type") not in types:
+            continue
+        t = ev.get("t")
+        if t0 is None and t is not None:
+            t0 = t
+        if speed > 0 and t is not None and t0 is not None:
+            delay = (t - t0) / speed - (time.monotonic() - wall0)
+            if delay > 0:
+                time.sleep(delay)
+        out.write(format_event(ev, t0) + "\n")
+        out.flush()
+
+
+def summarize(path: str) -> dict:
+    counts = {}
+    states = []
+    first_t = last_t = None
+    last_seq = None
+    gaps = 0
+    for ev in read_events(path):
+        counts[ev.get("type")] = counts.get(ev.get("type"), 0) + 1
+        if ev.get("type") == "state":
+            states.append((ev.get("t"), ev.get("state")))
+        t = ev.get("t")
+        if t is not None:
+            first_t = t if first_t is None else first_t
+            last_t = t
+        seq = ev.get("seq")
+        if seq is not None and last_seq is not None and seq != last_seq + 1:
+            gaps += 1
+        if seq is not None:
+            last_seq = seq
+
+    state_time = {}
+    for (ta, sa), (tb, _) in zip(states, states[1:]):
+        if ta is not None and tb is not None:
+            state_time[sa] = round(state_time.get(sa, 0.0) + (tb - ta), 3)
+
+    return {
+        "events": sum(counts.values()),
+        "by_type": counts,
+        "duration_sec": None if first_t is None else round(last_t - first_t, 3),
+        "seq_gaps": gaps,
+        "time_in_state_sec": state_time,
+    }
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m aidy.events", description="Inspect Aidy UI event logs")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    rp = sub.add_parser("replay", help="print events, optionally with original timing")
+    rp.add_argument("path")
+    rp.add_argument("--speed", type=float, default=0.0, help="1.0 = real time, 0 = as fast as possible")
+    rp.add_argument("--type", action="append", choices=EVENT_TYPES, help="only these event types")
+
+    sp = sub.add_parser("summary", help="event counts, sequence gaps and time spent per state")
+    sp.add_argument("path")
+
+    args = ap.parse_args(argv)
+    if args.cmd == "replay":
+        replay(args.path, speed=args.speed, types=set(args.type or []))
+    else:
+        print(json.dumps(summarize(args.path), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -2,11 +2,16 @@
 import sys
 import socket
 import time
+import threading
+import difflib
 import subprocess
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
 
 import requests
 
-from .logui import warn, error
+from .logui import debug, info, warn, error
+from .config import API_WORKERS, DANGEROUS_INTENTS, WAKE_KEYWORDS
 
 
 def is_port_open(host: str, port: int, timeout=0.25) -> bool:
@@ -17,51 +22,569 @@ def is_port_open(host: str, port: int, timeout=0.25) -> bool:
         return False
 
 
-def start_local_intent_api(base_dir: str):
-    host, port = "127.0.0.1", 8008
-    if is_port_open(host, port):
-        return True
+# Runs the local intent API as a child process and keeps it up: waits for
+# /ready (not just an open port), sends its output to logs/intent_api.log and
+# restarts it with backoff when it exits or stops answering. Other code asks
+# available() instead of finding out through a request timeout.
+class IntentServer:
+    HOST = "127.0.0.1"
+    PORT = 8008
+    READY_TIMEOUT = 180.0     # first start loads the encoder
+    CHECK_INTERVAL = 2.0
+    MAX_FAILED_CHECKS = 3
+    BACKOFF_MIN = 1.0
+    BACKOFF_MAX = 60.0
+    STABLE_SEC = 60.0         # up this long -> backoff starts over
+    # Numeric codes for the UI, whose metric events only carry numbers.
+    STATE_CODES = {"stopped": 0, "starting": 1, "ready": 2, "external": 3, "unhealthy": 4, "down": 5, "failed": 6}
 
-    api_dir = os.path.join(base_dir, "Api")
-    app_py = os.path.join(api_dir, "app.py")
-    if not os.path.exists(app_py):
-        warn(f"Local API not found: {app_py}")
+    def __init__(self, base_dir: str, host: str = HOST, port: int = PORT):
+        self.base_dir = base_dir
+        self.host = host
+        self.port = port
+        self.api_dir = os.path.join(base_dir, "Api")
+        self.log_path = os.path.join(base_dir, "logs", "intent_api.log")
+        self.ready_url = f"http://{host}:{port}/ready"
+
+        self.state = "stopped"
+        self.proc = None
+        self.restarts = 0
+        self.last_exit = None
+        self.ready_sec = None
+        self._listeners = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    def on_state(self, fn):
+        self._listeners.append(fn)
+
+    def available(self) -> bool:
+        return self.state in ("ready", "external")
+
+    def status(self) -> dict:
+        return {
+            "state": self.state,
+            "pid": self.proc.pid if self.proc is not None else None,
+            "restarts": self.restarts,
+            "last_exit": self.last_exit,
+            "ready_sec": self.ready_sec,
+        }
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._supervise, name="intent-api", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        proc = self.proc
+        if proc is not None and proc.poll() is None:
+            proc.terminate()
+            try:
+                proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        self._set("stopped")
+
+    def _set(self, state: str, detail: str = ""):
+        if state == self.state:
+            return
+        self.state = state
+        debug(f"Intent API: {state}" + (f" ({detail})" if detail else ""))
+        for fn in self._listeners:
+            try:
+                fn(state, detail)
+            except Exception as e:
+                warn(f"Intent API state listener failed: {e}")
+
+    def _check_ready(self) -> bool:
+        try:
+            return requests.get(self.ready_url, timeout=1.0).status_code == 200
+        except requests.exceptions.RequestException:
+            return False
+
+    def _argv(self) -> list:
+        py = sys.executable
+        if API_WORKERS > 1:
+            return [py, "serve.py", "--workers", str(API_WORKERS), "--host", self.host, "--port", str(self.port)]
+        # No access log: the health checks alone would fill it.
+        return [py, "-m", "uvicorn", "app:app", "--host", self.host, "--port", str(self.port), "--no-access-log"]
+
+    def _spawn(self):
+        os.makedirs(os.path.dirname(self.log_path), exist_ok=True)
+        if os.path.exists(self.log_path):
+            os.replace(self.log_path, self.log_path + ".1")
+        log = open(self.log_path, "wb")
+        try:
+            self.proc = subprocess.Popen(
+                self._argv(),
+                cwd=self.api_dir,
+                env={**os.environ, "AIDY_WAKE_WORDS": ",".join(sorted(WAKE_KEYWORDS))},
+                stdin=subprocess.DEVNULL,
+                stdout=log,
+                stderr=subprocess.STDOUT,
+                creationflags=getattr(subprocess, "CREATE_NO_WINDOW", 0),
+            )
+        finally:
+            log.close()   # the child keeps its own handle
+
+    def _log_tail(self, lines: int = 5) -> str:
+        try:
+            with open(self.log_path, "r", encoding="utf-8", errors="replace") as f:
+                return " | ".join(l.rstrip() for l in f.readlines()[-lines:])
+        except Exception:
+            return ""
+
+    def _wait_ready(self) -> bool:
+        t0 = time.monotonic()
+        while not self._stop.is_set():
+            if self.proc.poll() is not None:
+                return False
+            if self._check_ready():
+                self.ready_sec = round(time.monotonic() - t0, 2)
+                return True
+            if time.monotonic() - t0 > self.READY_TIMEOUT:
+                warn(f"Intent API not ready after {self.READY_TIMEOUT:.0f}s, restarting it")
+                self.proc.kill()
+                self.proc.wait()
+                return False
+            self._stop.wait(0.25)
         return False
 
-    py = sys.executable
+    def _watch(self) -> str:
+        # Until the server goes away; returns why.
+        failed = 0
+        while not self._stop.wait(self.CHECK_INTERVAL):
+            if self.proc is not None and self.proc.poll() is not None:
+                return f"exited with {self.proc.returncode}"
+            if self._check_ready():
+                failed = 0
+                if self.state != "ready" and self.state != "external":
+                    self._set("ready" if self.proc is not None else "external")
+                continue
+            failed += 1
+            self._set("unhealthy", f"{failed} failed checks")
+            if failed >= self.MAX_FAILED_CHECKS:
+                if self.proc is not None:
+                    self.proc.kill()
+                    self.proc.wait()
+                return "stopped answering"
+        return "stopping"
 
-    try:
-        subprocess.Popen(
-            [py, "-m", "uvicorn", "app:app", "--host", host, "--port", str(port)],
-            cwd=api_dir,
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL,
-            creationflags=subprocess.CREATE_NO_WINDOW
-        )
-    except Exception as e:
-        warn(f"Failed to start local API: {e}")
+    def _supervise(self):
+        backoff = self.BACKOFF_MIN
+        while not self._stop.is_set():
+            if self.proc is None and is_port_open(self.host, self.port) and self._check_ready():
+                # Someone else runs the API (e.g. started by hand): watch it, don't own it.
+                self._set("external")
+                reason = self._watch()
+                if self._stop.is_set():
+                    return
+                warn(f"External intent API {reason}; starting our own")
+                self._set("down", reason)
+                continue
+
+            if not os.path.exists(os.path.join(self.api_dir, "app.py")):
+                warn(f"Local API not found: {self.api_dir}")
+                self._set("failed", "app.py missing")
+                return
+
+            self._set("starting")
+            try:
+                self._spawn()
+            except Exception as e:
+                warn(f"Failed to start local API: {e}")
+                self._set("failed", str(e))
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, self.BACKOFF_MAX)
+                continue
+
+            up_since = time.monotonic()
+            if self._wait_ready():
+                info(f"Intent API ready in {self.ready_sec:.1f}s (pid {self.proc.pid})")
+                self._set("ready")
+                reason = self._watch()
+            else:
+                reason = "exited while starting" if self.proc.poll() is not None else "not ready"
+            if self._stop.is_set():
+                return
+
+            self.last_exit = self.proc.poll()
+            if time.monotonic() - up_since > self.STABLE_SEC:
+                backoff = self.BACKOFF_MIN
+            self.restarts += 1
+            warn(f"Intent API {reason}; restart #{self.restarts} in {backoff:.0f}s. Log: {self._log_tail()}")
+            self._set("down", reason)
+            self.proc = None
+            if self._stop.wait(backoff):
+                return
+            backoff = min(backoff * 2, self.BACKOFF_MAX)
+
+
+def canonical_text(text: str) -> str:
+    t = (text or "").lower().strip()
+    t = "".join(ch if (ch.isalnum() or ch.isspace() or ch in "%'") else " " for ch in t)
+    return " ".join(t.split())
+
+
+class IntentCache:
+    def __init__(self, max_size=512, ttl=600.0, negative_ttl=20.0, min_confidence=0.4):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.min_confidence = min_confidence
+
+        self._items: OrderedDict[str, tuple] = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.saved_ms = 0.0
+
+    def get(self, key: str):
+        now = time.monotonic()
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            expires, result, cost_ms = item
+            if expires <= now:
+                del self._items[key]
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            if not self.is_positive(result):
+                self.negative_hits += 1
+            self.saved_ms += cost_ms
+            return result
+
+    def is_positive(self, result: dict) -> bool:
+        intent = (result.get("intent") or "").strip()
+        confidence = float(result.get("confidence", 0) or 0)
+        return bool(intent) and confidence >= self.min_confidence
+
+    def put(self, key: str, result: dict, cost_ms: float):
+        ttl = self.ttl if self.is_positive(result) else self.negative_ttl
+        with self._lock:
+            self._items[key] = (time.monotonic() + ttl, result, cost_ms)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def note_saved(self, ms: float):
+        with self._lock:
+            self.saved_ms += ms
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._items),
+                "hits": self.hits,
+                "negative_hits": self.negative_hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "saved_ms": round(self.saved_ms, 1),
+            }
+
+
+# Intent lookup without the API: exact dataset phrase, else the closest one by
+# difflib ratio (confidence = similarity). Dangerous intents only match exactly,
+# and a near match that differs by a negation or a prefix ("unlock" vs "lock")
+# is no match at all.
+class LocalMatcher:
+    MIN_SIMILARITY = 0.75
+    NEGATIONS = {"not", "no", "dont", "don't", "never", "un", "dis"}
+
+    def __init__(self, intents: dict):
+        self.intents = {canonical_text(p): i for p, i in intents.items() if i}
+        self.fuzzy = [p for p, i in self.intents.items() if i not in DANGEROUS_INTENTS]
+        self.hits = 0
+        self.misses = 0
+
+    def match(self, text: str):
+        key = canonical_text(text)
+        intent = self.intents.get(key)
+        score = 1.0
+        if intent is None and key:
+            best = difflib.get_close_matches(key, self.fuzzy, n=1, cutoff=self.MIN_SIMILARITY)
+            if best and not self._flips_meaning(key, best[0]):
+                intent = self.intents[best[0]]
+                score = difflib.SequenceMatcher(None, key, best[0]).ratio()
+        if intent is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return {"text": text, "intent": intent, "confidence": round(score, 4), "margin": round(score, 4), "stage": "local"}
+
+    def _flips_meaning(self, a: str, b: str) -> bool:
+        wa, wb = a.split(), b.split()
+        for op, i1, i2, j1, j2 in difflib.SequenceMatcher(None, wa, wb).get_opcodes():
+            if op == "equal":
+                continue
+            if self.NEGATIONS & set(wa[i1:i2] + wb[j1:j2]):
+                return True
+            for x, y in zip(wa[i1:i2], wb[j1:j2]):
+                short, long = sorted((x, y), key=len)
+                if len(short) >= 3 and short != long and long.endswith(short):
+                    return True
         return False
 
-    for _ in range(30):
-        if is_port_open(host, port):
-            return True
-        time.sleep(0.1)
+    def stats(self) -> dict:
+        return {"phrases": len(self.intents), "hits": self.hits, "misses": self.misses}
+
+
+# closed -> open after FAILURES failures in a row (a timeout or a 429/503 trips
+# it at once: the caller has already paid for it). While open, lookups go
+# straight to the local fallback and a background thread probes the API; a good
+# probe moves to half_open, where real requests go out hedged. Success there
+# closes the breaker, failure reopens it and the probe interval doubles.
+class CircuitBreaker:
+    FAILURES = 3
+    PROBE_MIN = 1.0
+    PROBE_MAX = 30.0
+
+    def __init__(self, probe):
+        self.probe = probe
+        self.state = "closed"
+        self.failures = 0
+        self.trips = 0
+        self.probes = 0
+        self.opened_at = None
+        self._interval = self.PROBE_MIN
+        self._hold = None
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        return self.state != "open"
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            if self.state != "closed":
+                info(f"Intent API breaker closed after {time.monotonic() - self.opened_at:.1f}s open")
+                self.state = "closed"
+                self._interval = self.PROBE_MIN
+
+    def record_failure(self, trip: bool = False, hold: float | None = None):
+        with self._lock:
+            self.failures += 1
+            if self.state == "open":
+                return
+            if not (trip or self.state == "half_open" or self.failures >= self.FAILURES):
+                return
+            if self.state == "half_open":
+                self._interval = min(self._interval * 2, self.PROBE_MAX)
+            self.state = "open"
+            self.trips += 1
+            self.opened_at = time.monotonic()
+            self._hold = hold
+            warn(f"Intent API breaker open (trip #{self.trips}, {self.failures} failures); using local fallback")
+        threading.Thread(target=self._probe_loop, name="intent-breaker", daemon=True).start()
 
-    warn("Local API did not open port 8008")
-    return False
+    def _probe_loop(self):
+        delay = self._interval if self._hold is None else max(self._hold, 0.05)
+        interval = self._interval
+        while self.state == "open":
+            time.sleep(delay)
+            self.probes += 1
+            if self.probe():
+                with self._lock:
+                    if self.state == "open":
+                        self.state = "half_open"
+                        debug("Intent API breaker half-open")
+                return
+            interval = min(interval * 2, self.PROBE_MAX)
+            delay = interval
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "trips": self.trips,
+            "failures": self.failures,
+            "probes": self.probes,
+            "open_sec": round(time.monotonic() - self.opened_at, 1) if self.state != "closed" and self.opened_at else 0.0,
+        }
 
 
 class IntentAPI:
-    def __init__(self, url: str):
+    TIMEOUT = 5.0
+    # Sent as X-Deadline-Ms: the server sheds work it can't answer in time
+    # (429/503 + Retry-After) instead of letting us wait out TIMEOUT.
+    DEADLINE_MS = 4000
+    DEFAULT_RETRY_AFTER = 5.0
+    MAX_RETRY_AFTER = 30.0
+    # Half-open: a second attempt goes out if the first hasn't answered (or has
+    # failed) within HEDGE_DELAY; attempts are capped at HEDGE_TIMEOUT.
+    HEDGE_DELAY = 0.25
+    HEDGE_TIMEOUT = 2.0
+
+    def __init__(self, url: str, cache: IntentCache | None = None, batch_url: str | None = None):
         self.url = url
+        self.batch_url = batch_url
+        self.ready_url = url.rsplit("/", 1)[0] + "/ready"
+        self.cache = cache if cache is not None else IntentCache()
+        self.breaker = CircuitBreaker(self._probe)
+        self.fallback: LocalMatcher | None = None
+        self._failure_cost_ms = 0.0
+        self.shed = 0
+        self.hedged = 0
+
+    def match_locally(self, text: str):
+        return self.fallback.match(text) if self.fallback is not None else None
 
     def get_intent(self, text: str):
+        key = canonical_text(text)
+        cached = self.cache.get(key) if key else None
+        if cached is not None:
+            debug(f"Intent cache hit: \"{key}\" {self.cache.stats()}")
+            return cached
+
+        if not self.breaker.allow():
+            # Don't wait out another failure: answer locally now.
+            self.cache.note_saved(self._failure_cost_ms)
+            return self.match_locally(text)
+
+        t0 = time.perf_counter()
+        result, retry_after, timed_out = self._post(text)
+        cost_ms = (time.perf_counter() - t0) * 1000.0
+
+        if result is None:
+            self._failed(cost_ms, retry_after, timed_out)
+            return self.match_locally(text)
+
+        self.breaker.record_success()
+        if key:
+            self.cache.put(key, result, cost_ms)
+        return result
+
+    def get_intents(self, texts: list) -> list:
+        # Several transcripts of one utterance; cache misses go out in one request.
+        keys = [canonical_text(t) for t in texts]
+        results = [self.cache.get(k) if k else None for k in keys]
+        missing = [i for i, r in enumerate(results) if r is None]
+        if not missing:
+            return results
+        if self.batch_url is None:
+            return [self.get_intent(t) if r is None else r for t, r in zip(texts, results)]
+
+        if not self.breaker.allow():
+            self.cache.note_saved(self._failure_cost_ms)
+            return [self.match_locally(t) if r is None else r for t, r in zip(texts, results)]
+
+        t0 = time.perf_counter()
+        fetched, retry_after, timed_out = self._post_batch([texts[i] for i in missing])
+        cost_ms = (time.perf_counter() - t0) * 1000.0
+
+        if fetched is None:
+            self._failed(cost_ms, retry_after, timed_out)
+            return [self.match_locally(t) if r is None else r for t, r in zip(texts, results)]
+
+        self.breaker.record_success()
+        for i, result in zip(missing, fetched):
+            results[i] = result
+            if keys[i] and result:
+                self.cache.put(keys[i], result, cost_ms / len(missing))
+        return results
+
+    def stats(self) -> dict:
+        out = self.cache.stats()
+        out["breaker"] = self.breaker.stats()
+        out["shed"] = self.shed
+        out["hedged"] = self.hedged
+        if self.fallback is not None:
+            out["fallback"] = self.fallback.stats()
+        return out
+
+    def _failed(self, cost_ms: float, retry_after: float | None, timed_out: bool):
+        self._failure_cost_ms = cost_ms
+        if retry_after is not None:
+            self.shed += 1
+        self.breaker.record_failure(trip=retry_after is not None or timed_out, hold=retry_after)
+
+    def _probe(self) -> bool:
+        try:
+            return requests.get(self.ready_url, timeout=1.0).status_code == 200
+        except requests.exceptions.RequestException:
+            return False
+
+    def _retry_after_sec(self, r) -> float:
         try:
-            r = requests.post(self.url, json={"text": text}, timeout=5)
+            sec = float(r.json().get("retry_after_ms")) / 1000.0
+        except Exception:
+            try:
+                sec = float(r.headers.get("Retry-After", self.DEFAULT_RETRY_AFTER))
+            except ValueError:
+                sec = self.DEFAULT_RETRY_AFTER
+        return min(max(sec, 0.0), self.MAX_RETRY_AFTER)
+
+    def _post(self, text: str):
+        return self._request(self.url, {"text": text})
+
+    def _post_batch(self, texts: list):
+        body, retry_after, timed_out = self._request(self.batch_url, {"texts": texts})
+        if body is None:
+            return None, retry_after, timed_out
+        results = body.get("results") or []
+        if len(results) != len(texts):
+            error(f"API error: {len(results)} results for {len(texts)} texts")
+            return None, None, False
+        return results, None, False
+
+    # Every attempt returns (body, retry_after, timed_out) rather than setting
+    # fields, so a hedged attempt that loses and finishes later can't change how
+    # the next request is judged.
+    def _request(self, url: str, payload: dict):
+        if self.breaker.state == "half_open":
+            return self._hedged(url, payload)
+        return self._send(url, payload, self.TIMEOUT)
+
+    def _hedged(self, url: str, payload: dict):
+        pool = ThreadPoolExecutor(max_workers=2)
+        try:
+            first = pool.submit(self._send, url, payload, self.HEDGE_TIMEOUT)
+            done, _ = wait([first], timeout=self.HEDGE_DELAY)
+            if done and first.result()[0] is not None:
+                return first.result()
+            self.hedged += 1
+            debug("Intent API half-open: hedging request")
+            attempts = [first, pool.submit(self._send, url, payload, self.HEDGE_TIMEOUT)]
+            retry_after, timed_out = None, False
+            for f in as_completed(attempts):
+                body, ra, to = f.result()
+                if body is not None:
+                    return body, None, False
+                if ra is not None:
+                    retry_after = max(retry_after or 0.0, ra)
+                timed_out = timed_out or to
+            return None, retry_after, timed_out
+        finally:
+            pool.shutdown(wait=False)
+
+    def _send(self, url: str, payload: dict, timeout: float):
+        try:
+            r = requests.post(
+                url,
+                json=payload,
+                headers={"X-Deadline-Ms": str(self.DEADLINE_MS)},
+                timeout=timeout,
+            )
             if r.status_code == 200:
-                return r.json()
+                return r.json(), None, False
+            if r.status_code in (429, 503):
+                # Overloaded, not down: back off only as long as the server asks.
+                retry_after = self._retry_after_sec(r)
+                warn(f"API busy (HTTP {r.status_code}), retry in {retry_after:.2f}s")
+                return None, retry_after, False
             error(f"API error: HTTP {r.status_code}")
-            return None
+            return None, None, False
+        except requests.exceptions.Timeout as e:
+            error(f"API timeout: {e}")
+            return None, None, True
         except requests.exceptions.RequestException as e:
             error(f"API connection error: {e}")
-            return None
+            return None, None, False
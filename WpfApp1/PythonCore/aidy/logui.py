@@ -1,28 +1,85 @@
 ﻿import os
 import sys
+import atexit
+import threading
 from datetime import datetime
 
+from .events import EventWriter, LEVEL_SEVERITY
+
 UI_MODE = "--ui" in sys.argv
 
-def ui_state(name: str):
+STATE_SEVERITY = {"ERROR": "error", "WARNING": "warn", "OFFLINE": "warn"}
+
+_ui = {"state": None}
+_writer = None
+_writer_lock = threading.Lock()
+_print_lock = threading.Lock()
+
+def _events():
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = EventWriter(sys.stdout)
+                atexit.register(_writer.close)
+    return _writer
+
+def _emit_state(name: str):
     if UI_MODE:
-        print(f"STATE:{name}", flush=True)
+        _events().emit("state", STATE_SEVERITY.get(name, "info"), state=name)
+
+_state_listeners = []
+
+def add_state_listener(fn):
+    _state_listeners.append(fn)
+
+def ui_state(name: str):
+    if name != "SPEAKING":
+        _ui["state"] = name
+    _emit_state(name)
+    for fn in _state_listeners:
+        try:
+            fn(name)
+        except Exception:
+            pass
+
+def ui_speech(active: bool):
+    # Speech runs on its own thread: show SPEAKING while it plays, then go back
+    # to whatever state the assistant moved to in the meantime.
+    if active:
+        _emit_state("SPEAKING")
+    elif _ui["state"]:
+        _emit_state(_ui["state"])
 
 def ui_command(text: str):
     if UI_MODE:
-        print(f"COMMAND:{text}", flush=True)
+        _events().emit("command", text=text)
+
+def ui_partial(text: str):
+    if UI_MODE:
+        _events().emit("partial", "debug", text=text)
+
+def ui_metric(name: str, value, **fields):
+    if UI_MODE:
+        _events().emit("metric", "debug", name=name, value=value, **fields)
 
 
 
 LOG_LEVEL = os.environ.get("AIDY_LOG", "INFO").upper()
-LEVELS = {"DEBUG": 10, "INFO": 20, "WARN": 30, "ERROR": 40}
+LEVELS = {"DEBUG": 10, "INFO": 20, "WARN": 30, "ERROR": 40, "FATAL": 50}
 
 def _ts():
     return datetime.now().strftime("%H:%M:%S")
 
 def log(level: str, msg: str):
     if LEVELS.get(level, 20) >= LEVELS.get(LOG_LEVEL, 20):
-        print(f"{_ts()} [{level:<5}] {msg}", flush=True)
+        if UI_MODE:
+            _events().emit("log", LEVEL_SEVERITY.get(level, "info"), level=level, msg=str(msg))
+        else:
+            # One write per line: startup steps log from several threads at once.
+            with _print_lock:
+                sys.stdout.write(f"{_ts()} [{level:<5}] {msg}\n")
+                sys.stdout.flush()
 
 def debug(msg):
     log("DEBUG", msg)
@@ -35,3 +92,6 @@ def warn(msg):
 
 def error(msg):
     log("ERROR", msg)
+
+def fatal(msg):
+    log("FATAL", msg)
@@ -0,0 +1,216 @@
+import os
+import sys
+import time
+import ctypes
+import threading
+
+try:
+    import psutil
+    PSUTIL_OK = True
+except Exception:
+    PSUTIL_OK = False
+
+IS_WINDOWS = sys.platform == "win32"
+
+if IS_WINDOWS:
+    from ctypes import wintypes
+
+    TH32CS_SNAPPROCESS = 0x00000002
+    SYNCHRONIZE = 0x00100000
+    WAIT_OBJECT_0 = 0x00000000
+    INVALID_HANDLE_VALUE = ctypes.c_void_p(-1).value
+
+    class PROCESSENTRY32W(ctypes.Structure):
+        _fields_ = [
+            ("dwSize", wintypes.DWORD),
+            ("cntUsage", wintypes.DWORD),
+            ("th32ProcessID", wintypes.DWORD),
+            ("th32DefaultHeapID", ctypes.c_void_p),
+            ("th32ModuleID", wintypes.DWORD),
+            ("cntThreads", wintypes.DWORD),
+            ("th32ParentProcessID", wintypes.DWORD),
+            ("pcPriClassBase", wintypes.LONG),
+            ("dwFlags", wintypes.DWORD),
+            ("szExeFile", wintypes.WCHAR * 260),
+        ]
+
+    kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+    kernel32.CreateToolhelp32Snapshot.argtypes = [wintypes.DWORD, wintypes.DWORD]
+    kernel32.CreateToolhelp32Snapshot.restype = wintypes.HANDLE
+    kernel32.Process32FirstW.argtypes = [wintypes.HANDLE, ctypes.POINTER(PROCESSENTRY32W)]
+    kernel32.Process32FirstW.restype = wintypes.BOOL
+    kernel32.Process32NextW.argtypes = [wintypes.HANDLE, ctypes.POINTER(PROCESSENTRY32W)]
+    kernel32.Process32NextW.restype = wintypes.BOOL
+    kernel32.OpenProcess.argtypes = [wintypes.DWORD, wintypes.BOOL, wintypes.DWORD]
+    kernel32.OpenProcess.restype = wintypes.HANDLE
+    kernel32.WaitForSingleObject.argtypes = [wintypes.HANDLE, wintypes.DWORD]
+    kernel32.WaitForSingleObject.restype = wintypes.DWORD
+    kernel32.CloseHandle.argtypes = [wintypes.HANDLE]
+    kernel32.CloseHandle.restype = wintypes.BOOL
+
+    class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+        _fields_ = [
+            ("cb", wintypes.DWORD),
+            ("PageFaultCount", wintypes.DWORD),
+            ("PeakWorkingSetSize", ctypes.c_size_t),
+            ("WorkingSetSize", ctypes.c_size_t),
+            ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+            ("PagefileUsage", ctypes.c_size_t),
+            ("PeakPagefileUsage", ctypes.c_size_t),
+        ]
+
+    kernel32.GetCurrentProcess.restype = wintypes.HANDLE
+    psapi = ctypes.WinDLL("psapi")
+    psapi.GetProcessMemoryInfo.argtypes = [wintypes.HANDLE, ctypes.POINTER(PROCESS_MEMORY_COUNTERS), wintypes.DWORD]
+    psapi.GetProcessMemoryInfo.restype = wintypes.BOOL
+
+
+def _snapshot_psutil():
+    out = []
+    for p in psutil.process_iter(["pid", "name"]):
+        name = p.info.get("name") or ""
+        if name:
+            out.append((p.info["pid"], name))
+    return out
+
+
+def _snapshot_toolhelp():
+    snap = kernel32.CreateToolhelp32Snapshot(TH32CS_SNAPPROCESS, 0)
+    if not snap or snap == INVALID_HANDLE_VALUE:
+        raise OSError(ctypes.get_last_error(), "CreateToolhelp32Snapshot failed")
+    out = []
+    try:
+        entry = PROCESSENTRY32W()
+        entry.dwSize = ctypes.sizeof(PROCESSENTRY32W)
+        ok = kernel32.Process32FirstW(snap, ctypes.byref(entry))
+        while ok:
+            out.append((int(entry.th32ProcessID), entry.szExeFile))
+            ok = kernel32.Process32NextW(snap, ctypes.byref(entry))
+    finally:
+        kernel32.CloseHandle(snap)
+    return out
+
+
+def _snapshot_proc():
+    out = []
+    for d in os.listdir("/proc"):
+        if not d.isdigit():
+            continue
+        try:
+            with open(f"/proc/{d}/comm", "r", encoding="utf-8", errors="replace") as f:
+                out.append((int(d), f.read().strip()))
+        except OSError:
+            continue
+    return out
+
+
+def take_snapshot():
+    if PSUTIL_OK:
+        return _snapshot_psutil()
+    if IS_WINDOWS:
+        return _snapshot_toolhelp()
+    return _snapshot_proc()
+
+
+def _pid_alive(pid: int) -> bool:
+    if PSUTIL_OK:
+        return psutil.pid_exists(pid)
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+
+
+def wait_for_exit(pids, timeout: float) -> list:
+    # Returns the pids that are still alive after the timeout.
+    pids = list(pids)
+    if not pids:
+        return []
+
+    if PSUTIL_OK:
+        procs = []
+        for pid in pids:
+            try:
+                procs.append(psutil.Process(pid))
+            except psutil.NoSuchProcess:
+                pass
+        _, alive = psutil.wait_procs(procs, timeout=timeout)
+        return [p.pid for p in alive]
+
+    deadline = time.monotonic() + timeout
+
+    if IS_WINDOWS:
+        alive = []
+        for pid in pids:
+            h = kernel32.OpenProcess(SYNCHRONIZE, False, pid)
+            if not h:
+                continue
+            try:
+                left_ms = max(0, int((deadline - time.monotonic()) * 1000))
+                if kernel32.WaitForSingleObject(h, left_ms) != WAIT_OBJECT_0:
+                    alive.append(pid)
+            finally:
+                kernel32.CloseHandle(h)
+        return alive
+
+    while True:
+        alive = [p for p in pids if _pid_alive(p)]
+        if not alive or time.monotonic() >= deadline:
+            return alive
+        time.sleep(0.02)
+
+
+def process_rss_bytes() -> int | None:
+    if PSUTIL_OK:
+        return psutil.Process().memory_info().rss
+    if IS_WINDOWS:
+        pmc = PROCESS_MEMORY_COUNTERS()
+        pmc.cb = ctypes.sizeof(PROCESS_MEMORY_COUNTERS)
+        if psapi.GetProcessMemoryInfo(kernel32.GetCurrentProcess(), ctypes.byref(pmc), pmc.cb):
+            return int(pmc.WorkingSetSize)
+        return None
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class ProcessTable:
+    def __init__(self, max_age: float = 1.0):
+        self.max_age = max_age
+        self._by_name: dict[str, list] = {}
+        self._taken_at = 0.0
+        self._lock = threading.Lock()
+        self.refreshes = 0
+
+    def refresh(self, force: bool = False):
+        with self._lock:
+            if not force and (time.monotonic() - self._taken_at) < self.max_age:
+                return
+            index: dict[str, list] = {}
+            for pid, name in take_snapshot():
+                index.setdefault(name.lower(), []).append(pid)
+            self._by_name = index
+            self._taken_at = time.monotonic()
+            self.refreshes += 1
+
+    def pids(self, image_name: str) -> list:
+        self.refresh()
+        return list(self._by_name.get((image_name or "").strip().strip('"').lower(), []))
+
+    def is_running(self, image_name: str) -> bool:
+        return bool(self.pids(image_name))
+
+    def invalidate(self):
+        with self._lock:
+            self._taken_at = 0.0
+
+
+PROCESS_TABLE = ProcessTable()
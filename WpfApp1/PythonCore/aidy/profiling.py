@@ -0,0 +1,228 @@
+import os
+import io
+import time
+import pstats
+import cProfile
+import threading
+import tracemalloc
+
+from .logui import debug, info, warn, ui_metric
+from .procs import process_rss_bytes
+
+PROFILE_ENV = os.environ.get("AIDY_PROFILE", "").strip()
+
+
+def profile_dir(base_dir: str) -> str | None:
+    # AIDY_PROFILE=1 -> <base_dir>/profiles, any other value is taken as the directory.
+    if not PROFILE_ENV or PROFILE_ENV.lower() in ("0", "false", "no", "off"):
+        return None
+    if PROFILE_ENV.lower() in ("1", "true", "yes", "on"):
+        return os.path.join(base_dir, "profiles")
+    return os.path.abspath(PROFILE_ENV)
+
+
+def process_status() -> dict:
+    rss = None
+    try:
+        rss = process_rss_bytes()
+    except Exception:
+        pass
+    out = {
+        "rss_mb": None if rss is None else round(rss / (1024 * 1024), 1),
+        "threads": threading.active_count(),
+    }
+    if tracemalloc.is_tracing():
+        current, peak = tracemalloc.get_traced_memory()
+        out["traced_mb"] = round(current / (1024 * 1024), 1)
+        out["traced_peak_mb"] = round(peak / (1024 * 1024), 1)
+    return out
+
+
+class _NullSection:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SECTION = _NullSection()
+
+
+class _Section:
+    def __init__(self, profiler, name: str):
+        self.profiler = profiler
+        self.name = name
+        self._prof = None
+        self._lock = None
+
+    def __enter__(self):
+        local = self.profiler._local
+        # cProfile has one hook per thread: a section inside another one is
+        # accounted to the outer section instead.
+        if getattr(local, "active", False):
+            return self
+        prof, lock = self.profiler._slot(self.name)
+        if not lock.acquire(blocking=False):
+            return self
+        local.active = True
+        self._prof, self._lock = prof, lock
+        prof.enable()
+        return self
+
+    def __exit__(self, *exc):
+        if self._prof is None:
+            return False
+        self._prof.disable()
+        self.profiler._calls[self.name] = self.profiler._calls.get(self.name, 0) + 1
+        self.profiler._local.active = False
+        self._lock.release()
+        self._prof = self._lock = None
+        return False
+
+
+# Opt-in profiling (AIDY_PROFILE). Hot paths run inside named sections, each
+# accumulating into its own cProfile; a background thread periodically writes
+# the per-function stats and a tracemalloc snapshot to the profile directory
+# and reports process RSS / thread count as a status metric (always on).
+# prefix keeps the memory dumps of several processes sharing one directory apart.
+class Profiler:
+    DUMP_INTERVAL = 120.0
+    STATUS_INTERVAL = 30.0
+    TOP_N = 40
+    MAX_MEMORY_DUMPS = 20
+    TRACE_FRAMES = 10
+
+    def __init__(self, out_dir: str | None = None, dump_interval: float | None = None,
+                 status_interval: float | None = None, prefix: str = ""):
+        self.out_dir = out_dir
+        self.prefix = prefix
+        self.enabled = bool(out_dir)
+        self.dump_interval = dump_interval or self.DUMP_INTERVAL
+        self.status_interval = status_interval or self.STATUS_INTERVAL
+
+        self._slots: dict[str, tuple] = {}
+        self._slots_lock = threading.Lock()
+        self._calls: dict[str, int] = {}
+        self._local = threading.local()
+        self._prev_snapshot = None
+        self._stop = threading.Event()
+        self._thread = None
+        self.dumps = 0
+
+    def _slot(self, name: str):
+        with self._slots_lock:
+            slot = self._slots.get(name)
+            if slot is None:
+                slot = (cProfile.Profile(), threading.Lock())
+                self._slots[name] = slot
+            return slot
+
+    def section(self, name: str):
+        if not self.enabled:
+            return _NULL_SECTION
+        return _Section(self, name)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        if self.enabled:
+            try:
+                os.makedirs(self.out_dir, exist_ok=True)
+            except OSError as e:
+                warn(f"Profiling disabled, cannot create {self.out_dir}: {e}")
+                self.enabled = False
+        if self.enabled and not tracemalloc.is_tracing():
+            tracemalloc.start(self.TRACE_FRAMES)
+        if self.enabled:
+            info(f"Profiling to {self.out_dir} (every {self.dump_interval:.0f}s)")
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="aidy-profile", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        next_status = time.monotonic()
+        next_dump = time.monotonic() + self.dump_interval
+        while not self._stop.is_set():
+            now = time.monotonic()
+            if now >= next_status:
+                self.report_status()
+                next_status = now + self.status_interval
+            if self.enabled and now >= next_dump:
+                self.dump()
+                next_dump = now + self.dump_interval
+            wait = min(next_status, next_dump if self.enabled else next_status) - time.monotonic()
+            self._stop.wait(max(0.1, wait))
+
+    def report_status(self) -> dict:
+        st = process_status()
+        for key, value in st.items():
+            if value is not None:
+                ui_metric(f"process.{key}", value)
+        debug("Status: " + " ".join(f"{k}={v}" for k, v in st.items()))
+        return st
+
+    def dump(self):
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        try:
+            for name in sorted(self._slots):
+                self._dump_stats(name)
+            self._dump_memory(stamp)
+            self.dumps += 1
+            debug(f"Profile dump #{self.dumps} written to {self.out_dir}")
+        except Exception as e:
+            warn(f"Profile dump failed: {e}")
+
+    def _dump_stats(self, name: str):
+        prof, lock = self._slot(name)
+        # Waits for a running section to finish; a profile can't be read while enabled.
+        with lock:
+            buf = io.StringIO()
+            try:
+                stats = pstats.Stats(prof, stream=buf)
+            except TypeError:
+                return  # nothing collected yet
+            stats.dump_stats(os.path.join(self.out_dir, f"{name}.prof"))
+            buf.write(f"# section={name} calls={self._calls.get(name, 0)}\n")
+            stats.sort_stats("cumulative").print_stats(self.TOP_N)
+            stats.sort_stats("tottime").print_stats(self.TOP_N)
+        self._write(os.path.join(self.out_dir, f"{name}.txt"), buf.getvalue())
+
+    def _dump_memory(self, stamp: str):
+        if not tracemalloc.is_tracing():
+            return
+        snap = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        ))
+        lines = [f"# {stamp} " + " ".join(f"{k}={v}" for k, v in process_status().items()), "", "## top by line"]
+        lines += [str(s) for s in snap.statistics("lineno")[: self.TOP_N]]
+        if self._prev_snapshot is not None:
+            lines += ["", "## growth since previous dump"]
+            lines += [str(s) for s in snap.compare_to(self._prev_snapshot, "lineno")[: self.TOP_N]]
+        self._prev_snapshot = snap
+        head = f"{self.prefix}memory-"
+        self._write(os.path.join(self.out_dir, f"{head}{stamp}.txt"), "\n".join(lines) + "\n")
+
+        old = sorted(f for f in os.listdir(self.out_dir) if f.startswith(head) and f.endswith(".txt"))
+        for f in old[: max(0, len(old) - self.MAX_MEMORY_DUMPS)]:
+            try:
+                os.remove(os.path.join(self.out_dir, f))
+            except OSError:
+                pass
+
+    def _write(self, path: str, text: str):
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp, path)
+
+    def close(self):
+        self._stop.set()
+        t, self._thread = self._thread, None
+        if t is not None:
+            t.join(timeout=1.0)
+        if self.enabled:
+            self.dump()
+            info(f"Profile written: {self.out_dir} ({self.dumps} dumps)")
@@ -0,0 +1,152 @@
+import queue
+import atexit
+import itertools
+import threading
+import subprocess
+
+from .logui import debug, warn
+
+
+# The command reached the host but didn't finish. It may have run, so callers
+# must not send it again.
+class ShellTimeout(RuntimeError):
+    pass
+
+
+# Long-lived shell fed over stdin. Each command is followed by an echo of a
+# unique sentinel line; output is collected until that line comes back.
+class ShellHost:
+    def __init__(self, argv: list, sentinel_cmd, name: str = "shell", creationflags: int = 0):
+        self.argv = list(argv)
+        self.sentinel_cmd = sentinel_cmd
+        self.name = name
+        self.creationflags = creationflags
+
+        self.proc = None
+        self._lines = None
+        self._lock = threading.Lock()
+        self._seq = itertools.count(1)
+        self.starts = 0
+
+    def _reader(self, proc, lines):
+        try:
+            for line in proc.stdout:
+                lines.put(line.rstrip("\r\n"))
+        except Exception:
+            pass
+        lines.put(None)
+
+    def _alive(self) -> bool:
+        return self.proc is not None and self.proc.poll() is None
+
+    def _start(self):
+        self._kill()
+        self.proc = subprocess.Popen(
+            self.argv,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            encoding="utf-8",
+            errors="replace",
+            bufsize=1,
+            creationflags=self.creationflags,
+        )
+        self._lines = queue.Queue()
+        threading.Thread(target=self._reader, args=(self.proc, self._lines), daemon=True).start()
+        self.starts += 1
+        debug(f"{self.name}: host started (pid={self.proc.pid}, starts={self.starts})")
+
+    def _kill(self):
+        proc, self.proc = self.proc, None
+        if proc is None:
+            return
+        try:
+            proc.stdin.close()
+        except Exception:
+            pass
+        try:
+            proc.wait(timeout=1.0)
+        except Exception:
+            try:
+                proc.kill()
+            except Exception:
+                pass
+
+    # None means the command never reached a host (it couldn't be started or
+    # the write failed twice); running it some other way is safe then.
+    def run(self, command: str, timeout: float = 10.0) -> str | None:
+        with self._lock:
+            for attempt in range(2):
+                if not self._alive():
+                    try:
+                        self._start()
+                    except Exception as e:
+                        warn(f"{self.name}: failed to start host: {e}")
+                        return None
+
+                tag = f"__AIDY_DONE_{next(self._seq)}__"
+                try:
+                    self.proc.stdin.write(f"{command}\n{self.sentinel_cmd(tag)}\n")
+                    self.proc.stdin.flush()
+                except Exception:
+                    # Host died between commands, start a fresh one and retry once.
+                    self._kill()
+                    continue
+
+                out = []
+                while True:
+                    try:
+                        line = self._lines.get(timeout=timeout)
+                    except queue.Empty:
+                        self._kill()
+                        raise ShellTimeout(f"{self.name}: command timed out after {timeout:.1f}s")
+                    if line is None:
+                        self._kill()
+                        raise ShellTimeout(f"{self.name}: host exited while running command")
+                    if line.strip() == tag:
+                        return "\n".join(out)
+                    out.append(line)
+            return None
+
+    def close(self):
+        with self._lock:
+            self._kill()
+
+
+def powershell_host() -> ShellHost:
+    return ShellHost(
+        ["powershell", "-NoLogo", "-NoProfile", "-NonInteractive",
+         "-ExecutionPolicy", "Bypass", "-Command", "-"],
+        lambda tag: f"Write-Output '{tag}'",
+        name="powershell",
+        creationflags=getattr(subprocess, "CREATE_NO_WINDOW", 0),
+    )
+
+
+def sh_host() -> ShellHost:
+    return ShellHost(["sh"], lambda tag: f"echo '{tag}'", name="sh")
+
+
+_hosts: dict[str, ShellHost] = {}
+_hosts_lock = threading.Lock()
+
+
+def get_host(name: str = "powershell") -> ShellHost:
+    with _hosts_lock:
+        host = _hosts.get(name)
+        if host is None:
+            host = powershell_host() if name == "powershell" else sh_host()
+            _hosts[name] = host
+        return host
+
+
+def shutdown_hosts():
+    with _hosts_lock:
+        hosts = list(_hosts.values())
+        _hosts.clear()
+    for h in hosts:
+        h.close()
+
+
+atexit.register(shutdown_hosts)
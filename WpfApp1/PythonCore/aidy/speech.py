@@ -0,0 +1,171 @@
+import time
+import queue
+import threading
+
+from .logui import debug, warn, ui_speech
+
+
+# Plays prompts on a worker thread so callers never block on audio or TTS.
+# play_clip(clip, priority, exclusive) starts playback and returns a Playback
+# handle (None on failure); stop_playback() cuts whatever is playing short.
+# on_clip_start(clip, t0) and on_clip_end(t_end) bracket each prompt clip that
+# actually played.
+#
+# A prompt is exclusive: it cuts clips of the same or lower priority and the
+# worker waits for it. An overlay (overlap=True) is mixed over whatever plays
+# and the worker moves straight on, so a cue can sound under the next prompt.
+class SpeechOutput:
+    POLL_SEC = 0.02
+
+    def __init__(self, play_clip, stop_playback, tts_factory=None, on_clip_start=None, on_clip_end=None, on_done=None):
+        self.play_clip = play_clip
+        self.stop_playback = stop_playback
+        self.tts_factory = tts_factory
+        self.on_clip_start = on_clip_start
+        self.on_clip_end = on_clip_end
+        self.on_done = on_done
+
+        self._jobs = queue.Queue()
+        self._cancel = threading.Event()
+        self._idle = threading.Event()
+        self._idle.set()
+        self._lock = threading.Lock()
+        self._engine = None
+        self._current = None
+        self._gen = 0
+        self._busy = False
+
+        self._thread = threading.Thread(target=self._worker, name="aidy-speech", daemon=True)
+        self._thread.start()
+
+    def speak_clip(self, clip, fallback_text: str | None = None, tag=None, priority: int = 0, overlap: bool = False):
+        self._put("clip", (clip, fallback_text, priority, overlap), tag)
+
+    def speak_text(self, text: str, tag=None):
+        self._put("tts", text, tag)
+
+    def _put(self, kind, payload, tag):
+        with self._lock:
+            self._idle.clear()
+            self._jobs.put((self._gen, kind, payload, tag, time.perf_counter()))
+
+    def speaking(self) -> bool:
+        return not self._idle.is_set()
+
+    def current(self):
+        return self._current
+
+    def wait(self, timeout: float | None = None) -> bool:
+        return self._idle.wait(timeout)
+
+    def cancel(self):
+        with self._lock:
+            while True:
+                try:
+                    self._jobs.get_nowait()
+                except queue.Empty:
+                    break
+            self._gen += 1
+            self._cancel.set()
+            if not self._busy:
+                self._idle.set()
+        try:
+            self.stop_playback()
+        except Exception:
+            pass
+        if self._engine is not None:
+            try:
+                self._engine.stop()
+            except Exception:
+                pass
+
+    def close(self):
+        self.cancel()
+        self._jobs.put(None)
+
+    def _worker(self):
+        try:
+            import comtypes
+            comtypes.CoInitialize()
+        except Exception:
+            pass
+
+        active = False
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                break
+
+            gen, kind, payload, tag, queued_at = job
+            with self._lock:
+                self._busy = True
+                stale = gen != self._gen
+                if not stale:
+                    self._cancel.clear()
+
+            if not stale:
+                if not active:
+                    active = True
+                    ui_speech(True)
+
+                self._current = payload[0] if kind == "clip" else payload
+                started_at = time.perf_counter()
+                try:
+                    if kind == "clip":
+                        self._play(payload)
+                    else:
+                        self._tts(payload)
+                except Exception as e:
+                    warn(f"Speech output failed: {e}")
+                self._current = None
+                if self.on_done is not None:
+                    try:
+                        self.on_done(tag, queued_at, started_at, time.perf_counter(), self._cancel.is_set())
+                    except Exception:
+                        pass
+
+            with self._lock:
+                self._busy = False
+                done = self._jobs.empty()
+                if done:
+                    self._idle.set()
+            if done and active:
+                active = False
+                ui_speech(False)
+
+    def _play(self, job):
+        clip, fallback_text, priority, overlap = job
+        t0 = time.monotonic()
+        pb = self.play_clip(clip, priority, not overlap)
+        if pb is None:
+            if fallback_text:
+                self._tts(fallback_text)
+                return
+            raise RuntimeError("playback failed")
+
+        if overlap:
+            # Not a prompt: no echo reference, and nothing to wait for.
+            # cancel() still cuts it through stop_playback().
+            return
+        if self.on_clip_start is not None:
+            self.on_clip_start(clip, t0)
+        try:
+            while not pb.wait(self.POLL_SEC):
+                if self._cancel.is_set():
+                    pb.cancel()
+                    debug(f"Speech: clip interrupted after {pb.elapsed() * 1000:.0f} ms")
+                    return
+            debug(f"Speech: clip done in {pb.elapsed() * 1000:.0f} ms")
+        finally:
+            if self.on_clip_end is not None:
+                self.on_clip_end(time.monotonic())
+
+    def _tts(self, text: str):
+        if self.tts_factory is None:
+            return
+        if self._engine is None:
+            self._engine = self.tts_factory()
+        if self._cancel.is_set():
+            return
+        self._engine.say(text)
+        self._engine.runAndWait()
@@ -0,0 +1,97 @@
+import time
+import threading
+
+from .logui import debug, info, warn, ui_metric
+
+
+class _Step:
+    def __init__(self, name: str, fn, after: tuple, wait: bool):
+        self.name = name
+        self.fn = fn
+        self.after = after
+        self.wait = wait
+        self.done = threading.Event()
+        self.started = None
+        self.ended = None
+        self.error = None
+        self.skipped = False
+
+
+# Startup as a small dependency graph: every step gets a thread and starts as
+# soon as the steps it runs after have finished. run() returns once the steps
+# with wait=True are done; the others keep going and report when they finish.
+# A step whose dependency failed is skipped, and run() re-raises the first
+# failure of a waited-on step, as the serial code used to.
+class StartupGraph:
+    def __init__(self, label: str = "Startup"):
+        self.label = label
+        self.steps: dict[str, _Step] = {}
+        self.t0 = None
+
+    def step(self, name: str, fn, after=(), wait: bool = True):
+        for dep in after:
+            if dep not in self.steps:
+                raise ValueError(f"{name}: unknown dependency {dep}")
+        self.steps[name] = _Step(name, fn, tuple(after), wait)
+
+    def _run_step(self, step: _Step):
+        try:
+            for dep in step.after:
+                d = self.steps[dep]
+                d.done.wait()
+                if d.error is not None or d.skipped:
+                    step.skipped = True
+                    warn(f"{self.label}: {step.name} skipped ({dep} failed)")
+                    return
+
+            step.started = time.perf_counter()
+            try:
+                step.fn()
+            except Exception as e:
+                step.error = e
+                warn(f"{self.label}: {step.name} failed: {e}")
+            step.ended = time.perf_counter()
+            ms = (step.ended - step.started) * 1000.0
+            ui_metric(f"startup.{step.name}", round(ms, 1))
+            if not step.wait:
+                info(f"{self.label}: {step.name} done in {ms:.0f} ms (at +{(step.ended - self.t0) * 1000:.0f} ms)")
+        finally:
+            step.done.set()
+
+    def run(self):
+        self.t0 = time.perf_counter()
+        for step in self.steps.values():
+            threading.Thread(target=self._run_step, args=(step,), name=f"startup-{step.name}", daemon=True).start()
+
+        for step in self.steps.values():
+            if step.wait:
+                step.done.wait()
+
+        elapsed = (time.perf_counter() - self.t0) * 1000.0
+        info(f"{self.label}: {elapsed:.0f} ms")
+        for line in self.report():
+            info(line)
+        ui_metric("startup.total", round(elapsed, 1))
+
+        for step in self.steps.values():
+            if step.wait and step.error is not None:
+                raise step.error
+
+    def report(self) -> list:
+        lines = []
+        for step in self.steps.values():
+            if step.skipped:
+                lines.append(f"  {step.name:<12} skipped")
+            elif step.started is None:
+                lines.append(f"  {step.name:<12} running")
+            elif step.ended is None:
+                lines.append(f"  {step.name:<12} +{(step.started - self.t0) * 1000:6.0f} ms  running")
+            else:
+                lines.append(
+                    f"  {step.name:<12} +{(step.started - self.t0) * 1000:6.0f} ms  "
+                    f"{(step.ended - step.started) * 1000:7.1f} ms"
+                    + ("  FAILED" if step.error is not None else "")
+                    + ("" if step.wait else "  (background)")
+                )
+        debug(f"{self.label} graph: " + ", ".join(f"{s.name}<-{'+'.join(s.after) or '-'}" for s in self.steps.values()))
+        return lines
@@ -1,8 +1,16 @@
 ﻿import ctypes
 import subprocess
 import re
+import time
+import threading
 
-import pyautogui
+try:
+    import pyautogui
+except Exception:
+    pyautogui = None   # needs a display; only the key-press fallbacks use it
+
+from .shell import get_host, ShellTimeout
+from .logui import warn
 
 try:
     from ctypes import POINTER, cast
@@ -12,6 +20,15 @@ try:
 except Exception:
     PYCaw_OK = False
 
+try:
+    from pycaw.callbacks import MMNotificationClient
+    PYCaw_NOTIFY_OK = PYCaw_OK
+except Exception:
+    MMNotificationClient = object
+    PYCaw_NOTIFY_OK = False
+
+VOLUME_KEY_STEP_PERCENT = 2  # one media key press on Windows
+
 
 def parse_first_int(text: str) -> int | None:
     m = re.search(r"\b(\d{1,3})\b", text or "")
@@ -21,22 +38,155 @@ def parse_first_int(text: str) -> int | None:
     return max(0, min(100, v))
 
 
+class _DeviceChangeClient(MMNotificationClient):
+    def __init__(self, on_change):
+        super().__init__()
+        self.on_change = on_change
+
+    def on_default_device_changed(self, flow, flow_id, role, role_id, default_device_id):
+        self.on_change()
+
+    def on_device_state_changed(self, device_id, new_state, new_state_id):
+        self.on_change()
+
+
+class PycawVolumeBackend:
+    def __init__(self):
+        self._volume = None
+        self._enumerator = None
+        self._client = None
+        self.on_change = None
+
+    def _acquire(self):
+        devices = AudioUtilities.GetSpeakers()
+        interface = devices.Activate(IAudioEndpointVolume._iid_, CLSCTX_ALL, None)
+        self._volume = cast(interface, POINTER(IAudioEndpointVolume))
+        if PYCaw_NOTIFY_OK and self._client is None:
+            try:
+                self._enumerator = AudioUtilities.GetDeviceEnumerator()
+                self._client = _DeviceChangeClient(self.invalidate)
+                self._enumerator.RegisterEndpointNotificationCallback(self._client)
+            except Exception:
+                self._client = None
+        return self._volume
+
+    def invalidate(self):
+        self._volume = None
+        if self.on_change is not None:
+            self.on_change()
+
+    def _call(self, fn):
+        vol = self._volume or self._acquire()
+        try:
+            return fn(vol)
+        except Exception:
+            # Endpoint went away (unplugged / switched): re-acquire once.
+            self.invalidate()
+            return fn(self._acquire())
+
+    def get(self) -> float:
+        return float(self._call(lambda v: v.GetMasterVolumeLevelScalar()))
+
+    def set(self, level: float):
+        self._call(lambda v: v.SetMasterVolumeLevelScalar(level, None))
+
+
+# Stand-in endpoint for tests and machines without pycaw. invalidate() acts like
+# a default-device change.
+class MemoryVolumeBackend:
+    def __init__(self, level: float = 0.5):
+        self.level = level
+        self.gets = 0
+        self.sets = 0
+        self.on_change = None
+
+    def invalidate(self):
+        if self.on_change is not None:
+            self.on_change()
+
+    def get(self) -> float:
+        self.gets += 1
+        return self.level
+
+    def set(self, level: float):
+        self.level = level
+        self.sets += 1
+
+
+class VolumeController:
+    LEVEL_MAX_AGE = 1.0
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._level = None
+        self._level_t = 0.0
+        self._lock = threading.Lock()
+        backend.on_change = self.invalidate
+
+    def invalidate(self):
+        # Device changed: the next step starts from the new endpoint's level.
+        # No lock, the backend calls this from inside _apply/_current too.
+        self._level = None
+
+    def _current(self) -> float:
+        if self._level is None or (time.monotonic() - self._level_t) > self.LEVEL_MAX_AGE:
+            self._level = self.backend.get()
+            self._level_t = time.monotonic()
+        return self._level
+
+    def _apply(self, level: float):
+        level = max(0.0, min(1.0, level))
+        self.backend.set(level)
+        self._level = level
+        self._level_t = time.monotonic()
+
+    def level_percent(self) -> int:
+        with self._lock:
+            return int(round(self._current() * 100))
+
+    def set_percent(self, p: int):
+        with self._lock:
+            self._apply(p / 100.0)
+
+    def change_percent(self, delta: int):
+        with self._lock:
+            self._apply(self._current() + delta / 100.0)
+
+
+_volume_controller = None
+
+
+def get_volume_controller():
+    global _volume_controller
+    if _volume_controller is None and PYCaw_OK:
+        _volume_controller = VolumeController(PycawVolumeBackend())
+    return _volume_controller
+
+
 def set_volume_percent(p: int) -> bool:
-    if not PYCaw_OK:
+    ctl = get_volume_controller()
+    if ctl is None:
         return False
     try:
-        devices = AudioUtilities.GetSpeakers()
-        interface = devices.Activate(IAudioEndpointVolume._iid_, CLSCTX_ALL, None)
-        volume = cast(interface, POINTER(IAudioEndpointVolume))
-        volume.SetMasterVolumeLevelScalar(p / 100.0, None)
+        ctl.set_percent(p)
         return True
     except Exception:
         return False
 
 
 def volume_steps(up: bool, steps: int):
+    steps = max(1, steps)
+    ctl = get_volume_controller()
+    if ctl is not None:
+        try:
+            delta = steps * VOLUME_KEY_STEP_PERCENT
+            ctl.change_percent(delta if up else -delta)
+            return
+        except Exception:
+            pass
+
     key = "volumeup" if up else "volumedown"
-    for _ in range(max(1, steps)):
+    for _ in range(steps):
         pyautogui.press(key)
 
 
@@ -53,12 +203,11 @@ def show_desktop():
         pass
 
     try:
-        subprocess.run(
-            ["powershell", "-NoProfile", "-Command",
-             "(New-Object -ComObject Shell.Application).MinimizeAll()"],
-            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False
-        )
+        run_powershell_hidden("(New-Object -ComObject Shell.Application).MinimizeAll()")
         return True
+    except ShellTimeout as e:
+        warn(str(e))
+        return False
     except Exception:
         pass
 
@@ -82,6 +231,13 @@ def open_cmd_new_console(keep_open: bool = True, cmdline: str | None = None):
 
 
 def run_powershell_hidden(ps_command: str):
+    # ShellTimeout propagates: the command may already have run, so it isn't
+    # retried one-shot.
+    out = get_host("powershell").run(ps_command)
+    if out is not None:
+        return
+
+    warn("PowerShell host unavailable, running one-shot powershell")
     subprocess.run(
         ["powershell", "-NoProfile", "-ExecutionPolicy", "Bypass", "-Command", ps_command],
         stdout=subprocess.DEVNULL,
@@ -0,0 +1,163 @@
+import os
+import json
+import time
+import itertools
+import threading
+from collections import deque
+
+from .logui import debug, info, warn, LOG_LEVEL, add_state_listener
+
+TRACE_PATH = os.environ.get("AIDY_TRACE", "").strip()
+
+
+def percentile(values, q: float) -> float:
+    if not values:
+        return 0.0
+    xs = sorted(values)
+    k = (len(xs) - 1) * q
+    lo = int(k)
+    hi = min(lo + 1, len(xs) - 1)
+    return xs[lo] + (xs[hi] - xs[lo]) * (k - lo)
+
+
+class _Span:
+    def __init__(self, tracer, name: str, utt, args: dict):
+        self.tracer = tracer
+        self.name = name
+        self.utt = utt
+        self.args = args
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.record(self.name, self.start, time.perf_counter(), utt=self.utt, **self.args)
+        return False
+
+
+# Per-utterance spans: each wake starts a new utterance id, spans recorded while
+# it is current are tagged with it. Kept in memory (bounded), exportable as
+# Chrome trace-event JSON (chrome://tracing, Perfetto).
+class Tracer:
+    MAX_SPANS = 20000
+    WINDOW = 200
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self.utterance = None
+        self.spans = deque(maxlen=self.MAX_SPANS)
+        self.recent: dict[str, deque] = {}
+        self._utt_spans = []
+        self._open = {}
+        self._t0 = time.perf_counter()
+
+    def new_utterance(self) -> int:
+        with self._lock:
+            self.utterance = next(self._ids)
+            self._utt_spans = []
+            return self.utterance
+
+    def end_utterance(self, outcome: str = ""):
+        with self._lock:
+            utt, spans = self.utterance, self._utt_spans
+            self.utterance = None
+            self._utt_spans = []
+        if utt is None or LOG_LEVEL != "DEBUG":
+            return
+        parts = " ".join(f"{name}={ms:.0f}ms" for name, ms in spans)
+        debug(f"Trace u{utt} {outcome}: {parts}")
+        debug(f"Trace p50/p90/p99: {self.summary_line()}")
+
+    def span(self, name: str, **args):
+        return _Span(self, name, self.utterance, args)
+
+    # begin/end come from the audio thread and from state changes on the speech
+    # and command threads; the open-span table is shared, so it takes the lock.
+    def begin(self, name: str, **args):
+        with self._lock:
+            self._open[name] = (time.perf_counter(), self.utterance, args)
+
+    def end(self, name: str):
+        if name not in self._open:
+            return   # most state changes close nothing; skip the lock
+        with self._lock:
+            item = self._open.pop(name, None)
+        if item is not None:
+            start, utt, args = item
+            self.record(name, start, time.perf_counter(), utt=utt, **args)
+
+    def record(self, name: str, start: float, end: float, utt=None, **args):
+        ms = (end - start) * 1000.0
+        with self._lock:
+            self.spans.append((name, start, end, utt, threading.get_ident(), args))
+            self.recent.setdefault(name, deque(maxlen=self.WINDOW)).append(ms)
+            if utt is not None and utt == self.utterance:
+                self._utt_spans.append((name, ms))
+
+    def percentiles(self) -> dict:
+        with self._lock:
+            recent = {k: list(v) for k, v in self.recent.items()}
+        return {
+            name: {
+                "n": len(xs),
+                "p50": round(percentile(xs, 0.5), 1),
+                "p90": round(percentile(xs, 0.9), 1),
+                "p99": round(percentile(xs, 0.99), 1),
+            }
+            for name, xs in sorted(recent.items())
+        }
+
+    def summary_line(self) -> str:
+        return " ".join(
+            f"{name}={p['p50']:.0f}/{p['p90']:.0f}/{p['p99']:.0f}" for name, p in self.percentiles().items()
+        )
+
+    def chrome_events(self) -> list:
+        pid = os.getpid()
+        with self._lock:
+            spans = list(self.spans)
+        out = []
+        for name, start, end, utt, tid, args in spans:
+            a = dict(args)
+            if utt is not None:
+                a["utterance"] = utt
+            out.append({
+                "name": name,
+                "cat": name.split(".", 1)[0],
+                "ph": "X",
+                "ts": round((start - self._t0) * 1e6, 1),
+                "dur": round((end - start) * 1e6, 1),
+                "pid": pid,
+                "tid": tid,
+                "args": a,
+            })
+        return out
+
+    def export_chrome(self, path: str):
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": self.chrome_events(), "displayTimeUnit": "ms"}, f)
+        os.replace(tmp, path)
+
+    def on_state(self, name: str):
+        # EXECUTING .. next state is the action span, whichever branch ran it.
+        if name == "EXECUTING":
+            self.begin("action.exec")
+        elif name != "SPEAKING":
+            self.end("action.exec")
+
+    def close(self):
+        if not TRACE_PATH:
+            return
+        try:
+            self.export_chrome(TRACE_PATH)
+            info(f"Trace written: {TRACE_PATH} ({len(self.spans)} spans)")
+        except Exception as e:
+            warn(f"Trace export failed: {e}")
+
+
+TRACER = Tracer()
+add_state_listener(TRACER.on_state)
@@ -0,0 +1,154 @@
+import os
+import queue
+import hashlib
+import threading
+from collections import OrderedDict
+
+from .logui import debug, info, warn
+
+
+# Renders phrases to WAV off the hot path. Entries are keyed by the text and
+# every param; a param that is still None (the voice, until the first engine has
+# picked one) means nothing can be looked up yet.
+class TTSCache:
+    def __init__(self, cache_dir: str, params: dict, engine_factory, load_clip, max_files: int = 256):
+        self.cache_dir = cache_dir
+        self.params = dict(params)
+        self.engine_factory = engine_factory
+        self.load_clip = load_clip
+        self.max_files = max_files
+
+        self._clips: OrderedDict[str, object] = OrderedDict()
+        self._lock = threading.Lock()
+        self._jobs = queue.Queue()
+        self._pending = set()
+        self._thread = None
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def set_param(self, name: str, value):
+        with self._lock:
+            self.params[name] = value
+
+    def key(self, text: str) -> str | None:
+        params = dict(self.params)
+        if any(v is None for v in params.values()):
+            return None
+        t = " ".join((text or "").split())
+        raw = "|".join([t] + [f"{k}={params[k]}" for k in sorted(params)])
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:20]
+
+    def path_for(self, text: str) -> str | None:
+        k = self.key(text)
+        return None if k is None else os.path.join(self.cache_dir, f"{k}.wav")
+
+    def get(self, text: str):
+        k = self.key(text)
+        if k is None:
+            return None
+        with self._lock:
+            clip = self._clips.get(k)
+            if clip is not None:
+                self._clips.move_to_end(k)
+                return clip
+
+        path = os.path.join(self.cache_dir, f"{k}.wav")
+        if not os.path.exists(path):
+            return None
+        try:
+            clip = self.load_clip(path)
+            os.utime(path)
+        except Exception as e:
+            warn(f"TTS cache entry unreadable ({k}): {e}")
+            return None
+
+        with self._lock:
+            self._clips[k] = clip
+            while len(self._clips) > self.max_files:
+                self._clips.popitem(last=False)
+        return clip
+
+    def request(self, texts):
+        for t in texts:
+            t = " ".join((t or "").split())
+            if not t:
+                continue
+            k = self.key(t)
+            with self._lock:
+                if t in self._pending or k in self._clips:
+                    continue
+                self._pending.add(t)
+            self._jobs.put(t)
+        self._ensure_worker()
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._worker, name="aidy-tts-cache", daemon=True)
+            self._thread.start()
+
+    def _worker(self):
+        try:
+            import comtypes
+            comtypes.CoInitialize()
+        except Exception:
+            pass
+
+        engine = None
+        rendered = 0
+        while True:
+            try:
+                text = self._jobs.get(timeout=5.0)
+            except queue.Empty:
+                # Decide to exit under the lock request() uses to start a worker,
+                # so a job queued right now either gets picked up here or sees
+                # _thread cleared and starts a new worker.
+                with self._lock:
+                    if not self._jobs.empty():
+                        continue
+                    self._thread = None
+                break
+
+            try:
+                path = self.path_for(text)
+                if path is None or not os.path.exists(path):
+                    if engine is None:
+                        engine = self.engine_factory()   # settles the voice param
+                        path = self.path_for(text)
+                    if path is None:
+                        raise RuntimeError("TTS voice unknown after engine start")
+                    if not os.path.exists(path):
+                        tmp = path + ".tmp.wav"
+                        engine.save_to_file(text, tmp)
+                        engine.runAndWait()
+                        os.replace(tmp, path)
+                        rendered += 1
+                        debug(f"TTS cache: rendered \"{text}\"")
+                        self._evict()
+            except Exception as e:
+                warn(f"TTS cache render failed (\"{text}\"): {e}")
+            finally:
+                with self._lock:
+                    self._pending.discard(text)
+
+        if rendered:
+            info(f"TTS cache: rendered {rendered} phrases")
+
+    def _evict(self):
+        try:
+            files = [
+                os.path.join(self.cache_dir, f)
+                for f in os.listdir(self.cache_dir)
+                if f.endswith(".wav") and not f.endswith(".tmp.wav")
+            ]
+        except OSError:
+            return
+        if len(files) <= self.max_files:
+            return
+        files.sort(key=lambda p: os.path.getmtime(p))
+        for p in files[: len(files) - self.max_files]:
+            try:
+                os.remove(p)
+            except OSError:
+                pass
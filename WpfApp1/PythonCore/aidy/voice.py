@@ -1,21 +1,45 @@
 ﻿import os
-import glob
+import re
+import time
+import wave
 import random
 import ctypes
 from ctypes import wintypes
 
 import pyttsx3
 
+from .logui import debug, info, warn
+from .tts_cache import TTSCache
+from .speech import SpeechOutput
+from .audio_out import AudioOutput
+from .config import AUDIO_OUTPUT
+from .trace import TRACER
+
+try:
+    from .echo import EchoSuppressor, clip_reference
+    ECHO_OK = True
+except Exception:
+    ECHO_OK = False
+
 winmm = ctypes.WinDLL("winmm")
 mciSendStringW = winmm.mciSendStringW
 mciSendStringW.argtypes = [wintypes.LPCWSTR, wintypes.LPWSTR, wintypes.UINT, wintypes.HWND]
 mciSendStringW.restype = wintypes.UINT
 
+VOICE_EXTS = (".wav", ".mp3")
+
 
 def mci(cmd: str) -> int:
     return mciSendStringW(cmd, None, 0, None)
 
 
+def mci_status(alias: str, what: str) -> str:
+    buf = ctypes.create_unicode_buffer(128)
+    if mciSendStringW(f"status {alias} {what}", buf, len(buf), None) != 0:
+        return ""
+    return buf.value
+
+
 def play_audio_async(path: str, alias: str = "aidyvoice") -> bool:
     mci(f"close {alias}")
 
@@ -38,7 +62,63 @@ def play_audio_async(path: str, alias: str = "aidyvoice") -> bool:
     return True
 
 
+class VoiceClip:
+    def __init__(self, path: str):
+        self.path = path
+        self.ext = os.path.splitext(path)[1].lower()
+        self.pcm = None
+        self.sample_rate = 0
+        self.channels = 0
+        self.sampwidth = 0
+        self.duration = 0.0
+
+        if self.ext == ".wav":
+            with wave.open(path, "rb") as w:
+                self.sample_rate = w.getframerate()
+                self.channels = w.getnchannels()
+                self.sampwidth = w.getsampwidth()
+                self.pcm = w.readframes(w.getnframes())
+            frames = len(self.pcm) // max(1, self.channels * self.sampwidth)
+            self.duration = frames / float(self.sample_rate or 1)
+
+
+def build_voice_index(voice_dir: str):
+    # -> (exact, variants): "wake.wav" is exact, "wake_02.wav" a variant of "wake".
+    # When a stem exists in several formats the WAV wins: it plays from memory
+    # without transcoding.
+    exact: dict[str, VoiceClip] = {}
+    variants: dict[str, list] = {}
+    try:
+        names = sorted(os.listdir(voice_dir), key=lambda n: (os.path.splitext(n)[0], os.path.splitext(n)[1].lower() != ".wav", n))
+    except OSError:
+        return exact, variants
+
+    for name in names:
+        stem, ext = os.path.splitext(name)
+        if ext.lower() not in VOICE_EXTS:
+            continue
+        path = os.path.join(voice_dir, name)
+        if not os.path.isfile(path):
+            continue
+        try:
+            clip = VoiceClip(path)
+        except Exception as e:
+            warn(f"Voice clip skipped ({name}): {e}")
+            continue
+
+        if exact.setdefault(stem, clip) is not clip:
+            continue
+        m = re.match(r"^(.*)_\d+$", stem)
+        if m:
+            variants.setdefault(m.group(1), []).append(clip)
+    return exact, variants
+
+
 class Voice:
+    TTS_RATE = 180
+    TTS_VOLUME = 0.9
+    VOICE_HINTS = ("zira", "female")
+
     def __init__(self, base_dir: str):
         self.base_dir = base_dir
 
@@ -50,56 +130,132 @@ class Voice:
         ]
         self.voice_dir = next((p for p in candidates if os.path.isdir(p)), candidates[0])
 
-        self.engine = pyttsx3.init()
-        self.engine.setProperty("rate", 180)
-        self.engine.setProperty("volume", 0.9)
+        self.exact_clips = {}
+        self.clip_variants = {}
+        self.refresh_index()
 
-        voices = self.engine.getProperty("voices")
-        for v in voices:
-            name = (getattr(v, "name", "") or "").lower()
-            if "zira" in name or "female" in name:
-                self.engine.setProperty("voice", v.id)
-                break
+        # Resolved by the first engine a speech or cache worker builds; nothing
+        # initialises SAPI on the startup path. Until then the TTS cache has no
+        # voice to key on and every lookup misses.
+        self.voice_id = None
 
-    def _pick_audio(self, key: str) -> str | None:
-        exts = [".wav", ".mp3"]
-        for ext in exts:
-            exact = os.path.join(self.voice_dir, f"{key}{ext}")
-            if os.path.exists(exact):
-                return exact
-
-        candidates = []
-        for ext in exts:
-            pattern = os.path.join(self.voice_dir, f"{key}_*{ext}")
-            candidates.extend([p for p in glob.glob(pattern) if os.path.isfile(p)])
-
-        if not candidates:
+        self.tts_cache = None
+        try:
+            self.tts_cache = TTSCache(
+                os.path.join(base_dir, "cache", "tts"),
+                {"rate": self.TTS_RATE, "volume": self.TTS_VOLUME, "voice": None},
+                lambda: self._configure_engine(pyttsx3.Engine()),
+                VoiceClip,
+            )
+        except Exception as e:
+            warn(f"TTS cache disabled: {e}")
+
+        self.echo = EchoSuppressor() if ECHO_OK else None
+        self.audio_out = AudioOutput(AUDIO_OUTPUT)
+        self.speech = SpeechOutput(
+            self.audio_out.play_clip,
+            self.audio_out.stop,
+            tts_factory=lambda: self._configure_engine(pyttsx3.Engine()),
+            on_clip_start=self.echo.start_reference if self.echo else None,
+            on_clip_end=self.echo.stop_reference if self.echo else None,
+            on_done=self._trace_prompt,
+        )
+
+    def _configure_engine(self, engine):
+        engine.setProperty("rate", self.TTS_RATE)
+        engine.setProperty("volume", self.TTS_VOLUME)
+
+        if self.voice_id is None:
+            voices = engine.getProperty("voices")
+            for v in voices:
+                name = (getattr(v, "name", "") or "").lower()
+                if any(h in name for h in self.VOICE_HINTS):
+                    self.voice_id = v.id
+                    break
+        if self.voice_id is not None:
+            engine.setProperty("voice", self.voice_id)
+        if self.tts_cache is not None:
+            # Key cached audio on the voice the engine really uses, not the hints.
+            self.tts_cache.set_param("voice", engine.getProperty("voice") or self.voice_id or "default")
+        return engine
+
+    def prerender(self, texts):
+        if self.tts_cache is not None:
+            self.tts_cache.request(texts)
+
+    def refresh_index(self, *_):
+        t0 = time.perf_counter()
+        exact, variants = build_voice_index(self.voice_dir)
+        self.exact_clips, self.clip_variants = exact, variants
+        info(
+            f"Voice assets indexed: {len(exact)} clips "
+            f"({sum(len(c.pcm or b'') for c in exact.values()) // 1024} KB PCM) "
+            f"in {(time.perf_counter() - t0) * 1000:.1f} ms"
+        )
+
+    def _pick_clip(self, key: str) -> VoiceClip | None:
+        clip = self.exact_clips.get(key)
+        if clip is not None:
+            return clip
+        variants = self.clip_variants.get(key)
+        if not variants:
             return None
-        return random.choice(candidates)
+        return random.choice(variants)
+
+    def _pick_audio(self, key: str) -> str | None:
+        clip = self._pick_clip(key)
+        return clip.path if clip else None
 
     def play_or_tts(self, key: str, fallback_text: str):
-        audio = self._pick_audio(key)
-        print(
-            "VOICE KEY:", key,
-            "audio:", audio,
-            "exists:", bool(audio and os.path.exists(audio)),
-            flush=True
-        )
+        clip = self._pick_clip(key)
+        debug(f"Voice key: {key} clip: {clip.path if clip else None}")
 
-        if audio and os.path.exists(audio):
-            ok = play_audio_async(audio, alias="aidyvoice")
-            if ok:
-                return
+        tag = (key, TRACER.utterance)
+        if clip is not None:
+            self.speech.speak_clip(clip, fallback_text, tag=tag)
+            return
 
-        try:
-            self.engine.say(fallback_text)
-            self.engine.runAndWait()
-        except Exception as e:
-            print("TTS ERROR:", e, flush=True)
+        cached = self.tts_cache.get(fallback_text) if self.tts_cache else None
+        if cached is not None:
+            self.speech.speak_clip(cached, fallback_text, tag=tag)
+            return
+
+        self.speech.speak_text(fallback_text, tag=tag)
+        # Render in the background so the next time it plays from cache.
+        self.prerender([fallback_text])
+
+    def _trace_prompt(self, tag, queued_at, started_at, ended_at, interrupted):
+        if tag is None:
+            return
+        key, utt = tag
+        TRACER.record("prompt.queue", queued_at, started_at, utt=utt, key=key)
+        TRACER.record("prompt.play", started_at, ended_at, utt=utt, key=key, interrupted=interrupted)
+
+    def speaking(self) -> bool:
+        return self.speech.speaking()
+
+    def cancel(self):
+        self.speech.cancel()
+
+    def echo_covers_speech(self) -> bool:
+        # True when what's playing now is known PCM the echo suppressor can remove.
+        if self.echo is None:
+            return False
+        clip = self.speech.current()
+        return isinstance(clip, VoiceClip) and clip_reference(clip) is not None
+
+    def clean_capture(self, frame: bytes) -> bytes:
+        if self.echo is None:
+            return frame
+        return self.echo.process(frame, time.monotonic())
+
+    def wait(self, timeout: float | None = None) -> bool:
+        return self.speech.wait(timeout)
+
+    def close(self):
+        self.speech.close()
+        self.audio_out.close()
 
     def tts_blocking(self, text: str):
-        try:
-            self.engine.say(text)
-            self.engine.runAndWait()
-        except Exception:
-            pass
+        self.speech.speak_text(text)
+        self.speech.wait()
@@ -0,0 +1,309 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import zipfile
+import threading
+import urllib.error
+import urllib.request
+
+import vosk
+
+from .config import VOSK_MODELS, VOSK_ARCHIVE, VOSK_MIRROR, VOSK_SHA256, VOSK_DOWNLOAD
+from .logui import debug, info, warn, error
+
+OFFICIAL_URL = "https://alphacephei.com/vosk/models"
+MODEL_LIST_URL = OFFICIAL_URL + "/model-list.json"
+MARKER = ".aidy-model.json"
+LEGACY_ARCHIVE = "vosk_model.zip"
+CHUNK = 1 << 20
+
+
+def model_name(size: str) -> str:
+    return VOSK_MODELS.get(size, size)
+
+
+def file_digest(path: str, algo: str = "sha256") -> str:
+    h = hashlib.new(algo)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(CHUNK), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _is_url(s: str) -> bool:
+    return s.startswith(("http://", "https://", "file://"))
+
+
+# Finds, verifies, extracts and loads a Vosk model off the startup path. The
+# model directory only appears once fully extracted (extract to a temp dir,
+# then rename), so a crash mid-way never leaves a half model that looks
+# installed. Downloads resume from <name>.zip.part and are never started on the
+# caller's thread.
+class ModelManager:
+    def __init__(self, base_dir: str, size: str, open_path=None):
+        self.base_dir = base_dir
+        self.open_path = open_path or (lambda p: p)
+        self.model = None
+        self.state = "idle"
+        self.error = None
+        self.load_sec = None
+        self.sha256 = None
+        self._ready = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._listeners = []
+        self._serving = None   # (size, name, model_dir) of self.model while a switch is pending
+        self.select(size)
+
+    def select(self, size: str):
+        self.size = size
+        self.name = model_name(size)
+        self.model_dir = os.path.join(self.base_dir, self.name)
+
+    def on_ready(self, fn):
+        self._listeners.append(fn)
+
+    def installed(self) -> bool:
+        return os.path.exists(os.path.join(self.model_dir, "am", "final.mdl"))
+
+    def busy(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def wait(self, timeout: float | None = None) -> bool:
+        return self._ready.wait(timeout)
+
+    def start(self):
+        with self._lock:
+            if self.busy():
+                return
+            self._ready.clear()
+            self._thread = threading.Thread(target=self._run, name="vosk-model", daemon=True)
+            self._thread.start()
+
+    def switch(self, size: str) -> bool:
+        # The current model keeps serving until the new one has loaded.
+        if model_name(size) == self.name and self.model is not None:
+            return False
+        if self.busy():
+            warn(f"Vosk model: still preparing {self.name}, can't switch now")
+            return False
+        if self.model is not None:
+            self._serving = (self.size, self.name, self.model_dir)
+        self.select(size)
+        self.start()
+        return True
+
+    def status(self) -> dict:
+        return {"model": self.name, "state": self.state, "error": self.error, "load_sec": self.load_sec}
+
+    def _set(self, state: str):
+        self.state = state
+        debug(f"Vosk model {self.name}: {state}")
+
+    def _run(self):
+        t0 = time.perf_counter()
+        try:
+            if not self.installed():
+                archive, downloaded = self._find_archive()
+                if archive is None:
+                    if not VOSK_DOWNLOAD:
+                        raise RuntimeError(f"{self.name} not installed and downloads are off (AIDY_VOSK_DOWNLOAD=0)")
+                    archive, downloaded = self._download(), True
+                try:
+                    self._verify(archive)
+                    self._extract(archive)
+                except Exception:
+                    if downloaded:
+                        self._discard(archive)
+                    raise
+                if downloaded:
+                    os.remove(archive)
+                    for ext in (".sha256", ".md5"):
+                        if os.path.exists(archive + ext):
+                            os.remove(archive + ext)
+
+            self._set("loading")
+            model = vosk.Model(self.open_path(self.model_dir))
+        except Exception as e:
+            self.error = str(e)
+            self._set("failed")
+            error(f"Vosk model {self.name} unavailable: {e}")
+            if self._serving is not None:
+                # The old model never stopped serving: report it again.
+                self.size, self.name, self.model_dir = self._serving
+                self._serving = None
+                self.error = f"switch failed: {e}"
+                self._set("ready")
+            self._ready.set()
+            return
+
+        self._serving = None
+        self.model = model
+        self.error = None
+        self.load_sec = round(time.perf_counter() - t0, 2)
+        self._set("ready")
+        info(f"Vosk model ready: {self.name} in {self.load_sec:.1f}s")
+        self._ready.set()
+        for fn in self._listeners:
+            try:
+                fn(model)
+            except Exception as e:
+                warn(f"Vosk model listener failed: {e}")
+
+    def _find_archive(self):
+        # (path, downloaded_by_us); local archives are kept after extracting.
+        zip_name = f"{self.name}.zip"
+        candidates = [VOSK_ARCHIVE] if VOSK_ARCHIVE else []
+        if VOSK_MIRROR and not _is_url(VOSK_MIRROR):
+            candidates.append(os.path.join(VOSK_MIRROR, zip_name))
+        candidates.append(os.path.join(self.base_dir, zip_name))
+
+        for path in candidates:
+            if os.path.isfile(path) and self._archive_has_model(path):
+                return path, False
+
+        # Left behind by the old synchronous downloader.
+        legacy = os.path.join(self.base_dir, LEGACY_ARCHIVE)
+        if os.path.isfile(legacy) and self._archive_has_model(legacy):
+            return legacy, True
+        return None, False
+
+    def _archive_has_model(self, path: str) -> bool:
+        try:
+            with zipfile.ZipFile(path) as z:
+                return any(n.endswith("am/final.mdl") and self.name in n for n in z.namelist())
+        except Exception as e:
+            warn(f"Vosk archive unreadable ({os.path.basename(path)}): {e}")
+            return False
+
+    def _download(self) -> str:
+        base = VOSK_MIRROR if _is_url(VOSK_MIRROR) else OFFICIAL_URL
+        url = f"{base.rstrip('/')}/{self.name}.zip"
+        final = os.path.join(self.base_dir, f"{self.name}.zip")
+        part = final + ".part"
+        self._set("downloading")
+
+        have = os.path.getsize(part) if os.path.exists(part) else 0
+        req = urllib.request.Request(url, headers={"Range": f"bytes={have}-"} if have else {})
+        try:
+            r = urllib.request.urlopen(req, timeout=30)
+        except urllib.error.HTTPError as e:
+            if not (have and e.code == 416):
+                raise
+            # Nothing past what we already have: the part is the whole archive.
+            # If it isn't, verifying or extracting it fails and _run discards it.
+            info(f"Vosk model: {os.path.basename(part)} already complete ({have >> 20} MB)")
+            r = None
+
+        if r is not None:
+            with r:
+                if have and r.status != 206:
+                    have = 0   # server ignored the range: start over
+                total = have + int(r.headers.get("Content-Length") or 0)
+                info(f"Vosk model: downloading {url}" + (f" (resuming at {have >> 20} MB)" if have else ""))
+                next_log = 0
+                with open(part, "ab" if have else "wb") as f:
+                    while True:
+                        block = r.read(CHUNK)
+                        if not block:
+                            break
+                        f.write(block)
+                        have += len(block)
+                        if total and have * 10 // total >= next_log:
+                            info(f"Vosk model: {have >> 20}/{total >> 20} MB")
+                            next_log = have * 10 // total + 1
+
+        os.replace(part, final)
+
+        # Mirrors may publish <name>.zip.sha256 next to the archive; alphacephei
+        # lists an MD5 per model in model-list.json instead.
+        try:
+            with urllib.request.urlopen(url + ".sha256", timeout=10) as r:
+                with open(final + ".sha256", "wb") as f:
+                    f.write(r.read(512))
+        except Exception as e:
+            debug(f"Vosk model: no published checksum ({e})")
+        if base == OFFICIAL_URL:
+            md5 = self._official_md5()
+            if md5:
+                with open(final + ".md5", "w", encoding="utf-8") as f:
+                    f.write(md5 + "\n")
+        return final
+
+    def _discard(self, archive: str):
+        # A download that failed to verify or extract is never resumed or reused.
+        for path in (archive, archive + ".part", archive + ".sha256", archive + ".md5"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                warn(f"Vosk model: can't remove {os.path.basename(path)}: {e}")
+
+    def _official_md5(self) -> str | None:
+        try:
+            with urllib.request.urlopen(MODEL_LIST_URL, timeout=10) as r:
+                models = json.loads(r.read().decode("utf-8"))
+            for m in models:
+                if m.get("name") == self.name and m.get("md5"):
+                    return str(m["md5"]).lower()
+        except Exception as e:
+            warn(f"Vosk model: can't read {MODEL_LIST_URL}: {e}")
+        return None
+
+    def _expected_digest(self, archive: str):
+        # (algorithm, hex digest) or None; a pin for this model wins over sidecars.
+        if self.name in VOSK_SHA256:
+            return "sha256", VOSK_SHA256[self.name]
+        for algo in ("sha256", "md5"):
+            sidecar = f"{archive}.{algo}"
+            if os.path.exists(sidecar):
+                with open(sidecar, "r", encoding="utf-8") as f:
+                    parts = f.read().split()
+                if parts:
+                    return algo, parts[0].lower()
+        return None
+
+    def _verify(self, archive: str):
+        self._set("verifying")
+        expected = self._expected_digest(archive)
+        actual = file_digest(archive)
+        if expected is None:
+            warn(f"Vosk model: no checksum for {os.path.basename(archive)}, sha256={actual}")
+        else:
+            algo, digest = expected
+            if (actual if algo == "sha256" else file_digest(archive, algo)) != digest:
+                bad = archive + ".bad"
+                os.replace(archive, bad)
+                raise RuntimeError(f"{algo} mismatch for {os.path.basename(archive)} (moved to {os.path.basename(bad)})")
+            debug(f"Vosk model: {os.path.basename(archive)} {algo} ok")
+        self.sha256 = actual
+
+    def _extract(self, archive: str):
+        self._set("extracting")
+        tmp = os.path.join(self.base_dir, f".{self.name}.partial-{os.getpid()}")
+        shutil.rmtree(tmp, ignore_errors=True)
+        try:
+            with zipfile.ZipFile(archive) as z:
+                z.extractall(tmp)
+
+            src = None
+            for root, dirs, files in os.walk(tmp):
+                if os.path.basename(root) == "am" and "final.mdl" in files:
+                    src = os.path.dirname(root)
+                    break
+            if src is None:
+                raise RuntimeError(f"{os.path.basename(archive)} has no am/final.mdl")
+
+            with open(os.path.join(src, MARKER), "w", encoding="utf-8") as f:
+                json.dump({"archive": os.path.basename(archive), "sha256": self.sha256, "extracted": time.time()}, f)
+
+            if self.installed():
+                return   # another instance got there first
+            if os.path.isdir(self.model_dir):
+                shutil.rmtree(self.model_dir)   # partial tree from before atomic extraction
+            os.replace(src, self.model_dir)
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
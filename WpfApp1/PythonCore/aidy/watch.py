@@ -0,0 +1,72 @@
+import os
+import threading
+
+from .logui import debug, warn
+
+
+def _stamp(path: str):
+    try:
+        if os.path.isdir(path):
+            # A file replaced in place doesn't touch the directory's mtime.
+            with os.scandir(path) as it:
+                return tuple(sorted(
+                    (e.name, e.stat().st_mtime_ns, e.stat().st_size) for e in it if e.is_file()
+                ))
+        st = os.stat(path)
+        return (st.st_mtime_ns, st.st_size)
+    except OSError:
+        return None
+
+
+# mtime/size polling: one stat() per watched file (or per file in a watched
+# directory) per interval, no extra deps.
+class FileWatcher:
+    def __init__(self, interval: float = 1.0):
+        self.interval = interval
+        self._watches: dict[str, list] = {}
+        self._stamps: dict[str, tuple | None] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def watch(self, path: str, callback):
+        path = os.path.abspath(path)
+        with self._lock:
+            self._watches.setdefault(path, []).append(callback)
+            self._stamps[path] = _stamp(path)
+
+    def poll(self) -> list:
+        with self._lock:
+            items = list(self._watches.items())
+
+        changed = []
+        for path, callbacks in items:
+            st = _stamp(path)
+            if st == self._stamps.get(path):
+                continue
+            self._stamps[path] = st
+            changed.append(path)
+            debug(f"Watch: changed {os.path.basename(path)}")
+            for cb in callbacks:
+                try:
+                    cb(path)
+                except Exception as e:
+                    warn(f"Reload failed ({os.path.basename(path)}): {e}")
+        return changed
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.poll()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="aidy-watch", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        t, self._thread = self._thread, None
+        if t is not None:
+            t.join(timeout=self.interval + 1.0)
@@ -2,7 +2,7 @@ import os
 import sys
 
 from aidy.assistant import Aidy
-from aidy.logui import ui_state, error, UI_MODE
+from aidy.logui import ui_state, fatal, UI_MODE
 
 
 def main():
@@ -12,7 +12,7 @@ def main():
         Aidy(base_dir=base_dir).run()
     except Exception as e:
         ui_state("ERROR")
-        error(f"Failed to start: {e}")
+        fatal(f"Failed to start: {e}")
         if not UI_MODE:
             input("Press Enter to exit...")
         sys.exit(1)
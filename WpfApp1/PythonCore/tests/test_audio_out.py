@@ -0,0 +1,135 @@
+import os
+import time
+import wave
+import tempfile
+import unittest
+
+import numpy as np
+
+from aidy.audio_out import AudioOutput, Mixer, NullSink, OUTPUT_RATE, BLOCK_FRAMES
+from aidy.speech import SpeechOutput
+
+BLOCK_SEC = BLOCK_FRAMES / OUTPUT_RATE
+
+
+class Clip:
+    def __init__(self, seconds: float, value: int = 1000):
+        self.pcm = np.full(int(seconds * OUTPUT_RATE), value, dtype="<i2").tobytes()
+        self.sample_rate = OUTPUT_RATE
+        self.channels = 1
+        self.sampwidth = 2
+
+
+def tone(seconds: float, value: int = 1000) -> bytes:
+    return Clip(seconds, value).pcm
+
+
+class MixerTest(unittest.TestCase):
+    def setUp(self):
+        self.mixer = Mixer()
+        self.sink = NullSink(self.mixer)
+        self.addCleanup(self.sink.close)
+
+    def test_completes_after_its_duration(self):
+        pb = self.mixer.play(tone(0.3))
+        self.assertAlmostEqual(pb.duration, 0.3, places=3)
+        self.sink.start()
+
+        self.assertTrue(pb.wait(2.0))
+        self.assertFalse(pb.cancelled)
+        self.assertFalse(self.mixer.busy())
+        # Realtime sink: played out on the output clock, within a couple of blocks.
+        self.assertAlmostEqual(pb.elapsed(), 0.3, delta=3 * BLOCK_SEC)
+
+    def test_elapsed_while_playing(self):
+        pb = self.mixer.play(tone(1.0))
+        self.assertEqual(pb.elapsed(), 0.0)
+        self.sink.start()
+        time.sleep(0.25)
+
+        self.assertFalse(pb.done())
+        self.assertAlmostEqual(pb.elapsed(), 0.25, delta=3 * BLOCK_SEC)
+        pb.cancel()
+        self.assertTrue(pb.cancelled)
+
+    def test_exclusive_preempts_same_or_lower_priority(self):
+        low = self.mixer.play(tone(1.0), priority=0)
+        high = self.mixer.play(tone(1.0), priority=2, exclusive=True)
+        self.assertTrue(low.cancelled)
+        self.assertFalse(high.done())
+
+        # A lower-priority exclusive clip can't cut the higher one; both play.
+        mid = self.mixer.play(tone(0.1), priority=1, exclusive=True)
+        self.assertFalse(high.done())
+        self.sink.start()
+        self.assertTrue(mid.wait(2.0))
+        self.assertFalse(mid.cancelled)
+        self.assertFalse(high.done())
+
+    def test_overlapping_buffers_are_mixed(self):
+        path = os.path.join(tempfile.mkdtemp(), "out.wav")
+        sink = NullSink(self.mixer, path=path, realtime=False)
+
+        a = self.mixer.play(tone(0.2, 1000))
+        b = self.mixer.play(tone(0.1, 2000))
+        sink.start()
+        self.assertTrue(a.wait(2.0) and b.wait(2.0))
+        sink.close()
+
+        with wave.open(path, "rb") as w:
+            self.assertEqual(w.getframerate(), OUTPUT_RATE)
+            out = np.frombuffer(w.readframes(w.getnframes()), dtype="<i2")
+        n_b = int(0.1 * OUTPUT_RATE)
+        n_a = int(0.2 * OUTPUT_RATE)
+        self.assertTrue(np.all(out[:n_b] == 3000))
+        self.assertTrue(np.all(out[n_b:n_a] == 1000))
+        self.assertTrue(np.all(out[n_a:] == 0))
+
+    def test_mix_saturates(self):
+        self.mixer.play(tone(0.1, 30000))
+        self.mixer.play(tone(0.1, 30000))
+        out = np.frombuffer(self.mixer.read(BLOCK_FRAMES), dtype="<i2")
+        self.assertTrue(np.all(out == 32767))
+
+
+class AudioOutputTest(unittest.TestCase):
+    def setUp(self):
+        self.out = AudioOutput("null")
+        self.addCleanup(self.out.close)
+
+    def test_clips_overlap_by_default(self):
+        a = self.out.play_clip(Clip(0.5))
+        b = self.out.play_clip(Clip(0.1))
+        self.assertTrue(b.wait(2.0))
+        self.assertFalse(a.done())
+
+        c = self.out.play_clip(Clip(0.1), exclusive=True)
+        self.assertTrue(a.cancelled)
+        self.assertTrue(c.wait(2.0))
+
+    def test_speech_overlay_survives_next_prompt(self):
+        played = []
+
+        def play_clip(clip, priority=0, exclusive=False):
+            pb = self.out.play_clip(clip, priority, exclusive)
+            played.append((clip, pb, exclusive))
+            return pb
+
+        speech = SpeechOutput(play_clip, self.out.stop)
+        self.addCleanup(speech.close)
+        cue, prompt = Clip(0.6), Clip(0.1)
+        speech.speak_clip(cue, priority=1, overlap=True)
+        speech.speak_clip(prompt)
+        self.assertTrue(speech.wait(2.0))
+
+        (c, cue_pb, cue_excl), (p, prompt_pb, prompt_excl) = played
+        self.assertIs(c, cue)
+        self.assertFalse(cue_excl)
+        self.assertTrue(prompt_excl)
+        self.assertTrue(prompt_pb.done() and not prompt_pb.cancelled)
+        # The prompt didn't wait for the cue, and at lower priority it didn't cut it.
+        self.assertFalse(cue_pb.done())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,120 @@
+import unittest
+
+import numpy as np
+
+from aidy.echo import EchoSuppressor
+
+SR = 16000
+FRAME = SR // 4   # 250 ms, as captured by the assistant
+
+
+class Clip:
+    def __init__(self, x: np.ndarray):
+        self.pcm = np.clip(x, -32768, 32767).astype("<i2").tobytes()
+        self.sample_rate = SR
+        self.channels = 1
+        self.sampwidth = 2
+
+
+def speech_like(seconds: float, seed: int) -> np.ndarray:
+    # Noise under a slow syllable-rate envelope: broadband, but not stationary.
+    rng = np.random.default_rng(seed)
+    n = int(seconds * SR)
+    env = 0.55 + 0.45 * np.sin(2 * np.pi * 3.0 * np.arange(n) / SR + seed)
+    return (rng.standard_normal(n) * env * 4000.0).astype(np.float32)
+
+
+def mix(ref: np.ndarray, delay_sec: float, gain: float, near=None, noise: float = 30.0, seed: int = 7) -> np.ndarray:
+    d = int(delay_sec * SR)
+    mic = np.zeros(len(ref) + d, dtype=np.float32)
+    mic[d:] += gain * ref
+    if near is not None:
+        mic[: len(near)] += near[: len(mic)]
+    mic += np.random.default_rng(seed).standard_normal(len(mic)).astype(np.float32) * noise
+    return mic
+
+
+def rms(x: np.ndarray) -> float:
+    return float(np.sqrt(np.mean(np.asarray(x, dtype=np.float64) ** 2)))
+
+
+def run(sup: EchoSuppressor, mic: np.ndarray, t0: float = 100.0):
+    # Feeds the mic signal frame by frame as the capture loop does; frame i ends
+    # at t0 + (i + 1) * 250 ms on the same clock the reference was started on.
+    out = []
+    for i in range(len(mic) // FRAME):
+        frame = mic[i * FRAME:(i + 1) * FRAME]
+        data = np.clip(frame, -32768, 32767).astype("<i2").tobytes()
+        cleaned = sup.process(data, t0 + (i + 1) * FRAME / SR)
+        out.append(np.frombuffer(cleaned, dtype="<i2").astype(np.float32))
+    return np.concatenate(out)
+
+
+class EchoSuppressorTest(unittest.TestCase):
+    def test_removes_delayed_echo(self):
+        ref = speech_like(2.0, seed=1)
+        mic = mix(ref, delay_sec=0.12, gain=0.6)
+        sup = EchoSuppressor(SR)
+        sup.start_reference(Clip(ref), 100.0)
+
+        out = run(sup, mic)
+        n = len(out)
+        self.assertLess(rms(out[FRAME:n]), 0.1 * rms(mic[FRAME:n]))
+        self.assertAlmostEqual(sup.delay_sec, 0.12, delta=0.002)
+        self.assertGreater(sup.frames_cleaned, 0)
+
+    def test_keeps_near_end_speech(self):
+        ref = speech_like(2.0, seed=1)
+        near = speech_like(2.0, seed=2) * 0.8
+        mic = mix(ref, delay_sec=0.08, gain=0.5, near=near)
+        sup = EchoSuppressor(SR)
+        sup.start_reference(Clip(ref), 100.0)
+
+        out = run(sup, mic)
+        n = len(out)
+        # What's left is the user, not our prompt.
+        self.assertGreater(np.corrcoef(out[FRAME:n], near[FRAME:n])[0, 1], 0.9)
+        self.assertLess(abs(np.corrcoef(out[FRAME:n], ref[FRAME - 1280:n - 1280])[0, 1]), 0.1)
+
+    def test_no_reference_passes_through(self):
+        mic = speech_like(1.0, seed=3)
+        sup = EchoSuppressor(SR)
+        out = run(sup, mic)
+        np.testing.assert_array_equal(out, np.clip(mic, -32768, 32767).astype("<i2")[: len(out)])
+
+    def test_unrelated_audio_is_left_alone(self):
+        ref = speech_like(2.0, seed=1)
+        other = speech_like(2.0, seed=4)
+        sup = EchoSuppressor(SR)
+        sup.start_reference(Clip(ref), 100.0)
+
+        out = run(sup, other)
+        self.assertGreater(np.corrcoef(out, other[: len(out)])[0, 1], 0.99)
+
+    def test_stop_reference_keeps_tail_then_releases(self):
+        ref = speech_like(2.0, seed=1)
+        sup = EchoSuppressor(SR)
+        sup.start_reference(Clip(ref), 100.0)
+
+        # Interrupted after 1 s: only the played second can echo.
+        sup.stop_reference(101.0)
+        self.assertTrue(sup.active(101.0 + sup.MAX_DELAY_SEC / 2))
+        self.assertFalse(sup.active(101.0 + sup.MAX_DELAY_SEC + 0.01))
+
+        tail = mix(ref[:SR], delay_sec=0.1, gain=0.6)
+        out = run(sup, tail)
+        self.assertLess(rms(out[FRAME:SR]), 0.1 * rms(tail[FRAME:SR]))
+
+        frame = (speech_like(0.25, seed=5)).astype("<i2").tobytes()
+        self.assertEqual(sup.process(frame, 101.0 + sup.MAX_DELAY_SEC + 0.5), frame)
+        self.assertIsNone(sup._ref)
+
+    def test_stop_reference_without_time_drops_it(self):
+        sup = EchoSuppressor(SR)
+        sup.start_reference(Clip(speech_like(1.0, seed=1)), 100.0)
+        sup.stop_reference()
+        self.assertFalse(sup.active(100.1))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+
+from aidy import shell
+from aidy.shell import ShellTimeout, sh_host
+
+
+@unittest.skipUnless(shutil.which("sh"), "needs a POSIX sh")
+class ShellHostTest(unittest.TestCase):
+    def setUp(self):
+        self.host = sh_host()
+        self.addCleanup(self.host.close)
+
+    def test_round_trip(self):
+        self.assertEqual(self.host.run("echo hello"), "hello")
+        self.assertEqual(self.host.run("true"), "")
+        # One host serves every command.
+        self.assertEqual(self.host.run("echo again"), "again")
+        self.assertEqual(self.host.starts, 1)
+
+    def test_multiline_output(self):
+        out = self.host.run("printf 'one\\ntwo\\n\\nfour\\n'; echo five >&2")
+        self.assertEqual(out.split("\n"), ["one", "two", "", "four", "five"])
+
+    def test_state_persists_between_commands(self):
+        self.host.run("AIDY_TEST=kept")
+        self.assertEqual(self.host.run("echo $AIDY_TEST"), "kept")
+
+    def test_restarts_after_child_is_killed(self):
+        self.assertEqual(self.host.run("echo first"), "first")
+        proc = self.host.proc
+        proc.kill()
+        proc.wait()
+
+        self.assertEqual(self.host.run("echo second"), "second")
+        self.assertEqual(self.host.starts, 2)
+        self.assertIsNot(self.host.proc, proc)
+
+    def test_timeout_does_not_rerun(self):
+        fd, marker = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.remove, marker)
+
+        t0 = time.monotonic()
+        with self.assertRaises(ShellTimeout):
+            self.host.run(f"echo ran >> '{marker}'; sleep 5", timeout=0.3)
+        self.assertLess(time.monotonic() - t0, 3.0)
+        self.assertIsNone(self.host.proc)
+
+        with open(marker, encoding="utf-8") as f:
+            self.assertEqual(f.read().splitlines(), ["ran"])
+        self.assertEqual(self.host.starts, 1)
+
+        # The next command gets a fresh host.
+        self.assertEqual(self.host.run("echo next"), "next")
+        self.assertEqual(self.host.starts, 2)
+
+    def test_host_exit_mid_command_raises(self):
+        with self.assertRaises(ShellTimeout):
+            self.host.run("exit 3")
+        self.assertEqual(self.host.starts, 1)
+
+
+@unittest.skipUnless(shutil.which("sh"), "needs a POSIX sh")
+class SharedHostsTest(unittest.TestCase):
+    def tearDown(self):
+        shell.shutdown_hosts()
+
+    def test_shutdown_hosts(self):
+        host = shell.get_host("sh")
+        self.assertIs(shell.get_host("sh"), host)
+        self.assertEqual(host.run("echo up"), "up")
+        proc = host.proc
+
+        shell.shutdown_hosts()
+        self.assertIsNone(host.proc)
+        self.assertIsNotNone(proc.poll())
+        self.assertIsNot(shell.get_host("sh"), host)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+import unittest
+
+from aidy import system
+from aidy.system import MemoryVolumeBackend, VolumeController, VOLUME_KEY_STEP_PERCENT
+
+
+class VolumeControllerTest(unittest.TestCase):
+    def setUp(self):
+        self.backend = MemoryVolumeBackend(0.5)
+        self.ctl = VolumeController(self.backend)
+
+    def test_set_percent_clamps_with_one_set(self):
+        self.ctl.set_percent(140)
+        self.assertEqual(self.backend.level, 1.0)
+        self.assertEqual(self.backend.sets, 1)
+
+        self.ctl.set_percent(-20)
+        self.assertEqual(self.backend.level, 0.0)
+        self.assertEqual(self.backend.sets, 2)
+        self.assertEqual(self.backend.gets, 0)
+
+    def test_change_percent_clamps_with_one_set(self):
+        self.ctl.change_percent(80)
+        self.assertEqual(self.backend.level, 1.0)
+        self.assertEqual(self.backend.sets, 1)
+
+        self.ctl.change_percent(-250)
+        self.assertEqual(self.backend.level, 0.0)
+        self.assertEqual(self.backend.sets, 2)
+        # The second change starts from the level just set, not a fresh read.
+        self.assertEqual(self.backend.gets, 1)
+
+    def test_level_is_cached(self):
+        self.assertEqual(self.ctl.level_percent(), 50)
+        self.backend.level = 0.8   # changed behind our back, e.g. by the tray slider
+        self.assertEqual(self.ctl.level_percent(), 50)
+        self.assertEqual(self.backend.gets, 1)
+
+    def test_invalidate_rereads_level(self):
+        self.assertEqual(self.ctl.level_percent(), 50)
+        self.backend.level = 0.8
+        self.backend.invalidate()   # default device changed
+
+        self.assertEqual(self.ctl.level_percent(), 80)
+        self.assertEqual(self.backend.gets, 2)
+
+        self.ctl.change_percent(10)
+        self.assertAlmostEqual(self.backend.level, 0.9)
+        self.assertEqual(self.backend.gets, 2)
+
+    def test_cache_expires(self):
+        self.ctl.LEVEL_MAX_AGE = 0.0
+        self.ctl.level_percent()
+        self.backend.level = 0.3
+        self.assertEqual(self.ctl.level_percent(), 30)
+        self.assertEqual(self.backend.gets, 2)
+
+
+class VolumeStepsTest(unittest.TestCase):
+    def setUp(self):
+        self.backend = MemoryVolumeBackend(0.2)
+        self._saved = system._volume_controller
+        system._volume_controller = VolumeController(self.backend)
+
+    def tearDown(self):
+        system._volume_controller = self._saved
+
+    def test_many_steps_are_one_change(self):
+        system.volume_steps(True, 50)
+        self.assertEqual(self.backend.sets, 1)
+        self.assertEqual(self.backend.gets, 1)
+        self.assertEqual(self.backend.level, 1.0)
+
+        system.volume_steps(False, 10)
+        self.assertEqual(self.backend.sets, 2)
+        self.assertAlmostEqual(self.backend.level, 1.0 - 10 * VOLUME_KEY_STEP_PERCENT / 100.0)
+
+    def test_set_volume_percent(self):
+        self.assertTrue(system.set_volume_percent(35))
+        self.assertAlmostEqual(self.backend.level, 0.35)
+        self.assertEqual(self.backend.sets, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
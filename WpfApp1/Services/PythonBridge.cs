@@ -3,6 +3,7 @@ using System;
 using System.Diagnostics;
 using System.IO;
 using System.Text;
+using System.Text.Json;
 using WpfApp1.Models;
 
 namespace WpfApp1.Services
@@ -17,8 +18,15 @@ namespace WpfApp1.Services
 
         public event Action<AidyState>? StateChanged;
         public event Action<string>? CommandHeard;
+        public event Action<string>? PartialHeard;
+        public event Action<string, double>? MetricReceived;
         public event Action<string>? LogLine;
 
+        // Sequence number and Python-side monotonic timestamp (seconds) of the last JSON event.
+        public long LastEventSeq { get; private set; }
+        public double LastEventTime { get; private set; }
+        public long DroppedEvents { get; private set; }
+
         public PythonBridge(string pythonExe, string scriptPath, string workingDir)
         {
             _pythonExe = pythonExe ?? throw new ArgumentNullException(nameof(pythonExe));
@@ -89,6 +97,11 @@ namespace WpfApp1.Services
             _proc.OutputDataReceived += (_, e) =>
             {
                 var line = e.Data ?? "";
+
+                // JSON events are logged in formatted form by ParseEvent.
+                if (line.StartsWith("{") && ParseEvent(line))
+                    return;
+
                 if (!string.IsNullOrWhiteSpace(line))
                     LogLine?.Invoke(line);
 
@@ -98,22 +111,11 @@ namespace WpfApp1.Services
             _proc.ErrorDataReceived += (_, e) =>
             {
                 var line = e.Data ?? "";
+
+                // stderr is only logged. Error comes from a "fatal" event or a
+                // non-zero exit (a crash before the event stream is up exits non-zero).
                 if (!string.IsNullOrWhiteSpace(line))
-                {
                     LogLine?.Invoke($"ERROR: {line}");
-
-                    // If Python is failing, don't let UI stay in IDLE.
-                    // Mark Error on obvious traceback/fatal/module issues.
-                    if (line.Contains("Traceback", StringComparison.OrdinalIgnoreCase) ||
-                        line.Contains("ModuleNotFoundError", StringComparison.OrdinalIgnoreCase) ||
-                        line.Contains("FileNotFoundError", StringComparison.OrdinalIgnoreCase) ||
-                        line.Contains("ImportError", StringComparison.OrdinalIgnoreCase) ||
-                        line.Contains("Fatal", StringComparison.OrdinalIgnoreCase))
-                    {
-                        _lastState = AidyState.Error;
-                        StateChanged?.Invoke(AidyState.Error);
-                    }
-                }
             };
 
             _proc.Exited += (_, __) =>
@@ -147,36 +149,110 @@ namespace WpfApp1.Services
             }
         }
 
+        private bool ParseEvent(string line)
+        {
+            JsonElement ev;
+            try
+            {
+                using var doc = JsonDocument.Parse(line);
+                ev = doc.RootElement.Clone();
+            }
+            catch (JsonException)
+            {
+                return false;
+            }
+
+            if (ev.ValueKind != JsonValueKind.Object || !ev.TryGetProperty("type", out var typeProp))
+                return false;
+
+            if (ev.TryGetProperty("seq", out var seqProp) && seqProp.TryGetInt64(out var seq))
+            {
+                if (LastEventSeq > 0 && seq > LastEventSeq + 1)
+                    DroppedEvents += seq - LastEventSeq - 1;
+                LastEventSeq = seq;
+            }
+            if (ev.TryGetProperty("t", out var tProp) && tProp.TryGetDouble(out var t))
+                LastEventTime = t;
+
+            var sev = ev.TryGetProperty("sev", out var sevProp) ? sevProp.GetString() ?? "info" : "info";
+
+            switch (typeProp.GetString())
+            {
+                case "state":
+                    if (ev.TryGetProperty("state", out var stateProp))
+                        ApplyState(stateProp.GetString() ?? "");
+                    break;
+
+                case "command":
+                    var text = ev.TryGetProperty("text", out var textProp) ? textProp.GetString() : null;
+                    if (!string.IsNullOrWhiteSpace(text))
+                        CommandHeard?.Invoke(text.Trim());
+                    break;
+
+                case "partial":
+                    var partial = ev.TryGetProperty("text", out var partialProp) ? partialProp.GetString() : null;
+                    if (!string.IsNullOrWhiteSpace(partial))
+                        PartialHeard?.Invoke(partial.Trim());
+                    break;
+
+                case "metric":
+                    if (ev.TryGetProperty("name", out var nameProp) &&
+                        ev.TryGetProperty("value", out var valueProp) &&
+                        valueProp.ValueKind == JsonValueKind.Number)
+                        MetricReceived?.Invoke(nameProp.GetString() ?? "", valueProp.GetDouble());
+                    break;
+
+                case "log":
+                    var level = ev.TryGetProperty("level", out var levelProp) ? levelProp.GetString() ?? "INFO" : "INFO";
+                    var msg = ev.TryGetProperty("msg", out var msgProp) ? msgProp.GetString() ?? "" : "";
+                    LogLine?.Invoke($"{DateTime.Now:HH:mm:ss} [{level,-5}] {msg}");
+
+                    // Severity replaces guessing from the message text.
+                    if (string.Equals(sev, "fatal", StringComparison.OrdinalIgnoreCase))
+                    {
+                        _lastState = AidyState.Error;
+                        StateChanged?.Invoke(AidyState.Error);
+                    }
+                    break;
+            }
+
+            return true;
+        }
+
+        private void ApplyState(string value)
+        {
+            var v = value.Trim().ToUpperInvariant();
+
+            AidyState? s = v switch
+            {
+                "STARTING" => AidyState.Starting,
+                "IDLE" => AidyState.Idle,
+                "LISTENING" => AidyState.Listening,
+                "PROCESSING" => AidyState.Processing,
+                "SPEAKING" => AidyState.Speaking,
+                "EXECUTING" => AidyState.Executing,
+                "SUCCESS" => AidyState.Success,
+                "WARNING" => AidyState.Warning,
+                "ERROR" => AidyState.Error,
+                "OFFLINE" => AidyState.Offline,
+                _ => null
+            };
+
+            if (s != null)
+            {
+                _lastState = s.Value;
+                LogLine?.Invoke($"[Bridge] Parsed state: {s.Value}");
+                StateChanged?.Invoke(s.Value);
+            }
+        }
+
         private void ParseLine(string line)
         {
             if (string.IsNullOrWhiteSpace(line)) return;
 
             if (line.StartsWith("STATE:", StringComparison.OrdinalIgnoreCase))
             {
-                var v = line.Substring("STATE:".Length).Trim().ToUpperInvariant();
-
-                AidyState? s = v switch
-                {
-                    "STARTING" => AidyState.Starting,
-                    "IDLE" => AidyState.Idle,
-                    "LISTENING" => AidyState.Listening,
-                    "PROCESSING" => AidyState.Processing,
-                    "SPEAKING" => AidyState.Speaking,
-                    "EXECUTING" => AidyState.Executing,
-                    "SUCCESS" => AidyState.Success,
-                    "WARNING" => AidyState.Warning,
-                    "ERROR" => AidyState.Error,
-                    "OFFLINE" => AidyState.Offline,
-                    _ => null
-                };
-
-                if (s != null)
-                {
-                    _lastState = s.Value;
-                    LogLine?.Invoke($"[Bridge] Parsed state: {s.Value}");
-                    StateChanged?.Invoke(s.Value);
-                }
-
+                ApplyState(line.Substring("STATE:".Length));
                 return;
             }
 
@@ -185,17 +261,6 @@ namespace WpfApp1.Services
                 var t = line.Substring("COMMAND:".Length).Trim();
                 if (!string.IsNullOrWhiteSpace(t))
                     CommandHeard?.Invoke(t);
-
-                return;
-            }
-
-            // Optional crash detection in stdout too
-            if (line.Contains("Traceback (most recent call last)", StringComparison.OrdinalIgnoreCase) ||
-                line.Contains("ModuleNotFoundError", StringComparison.OrdinalIgnoreCase) ||
-                line.Contains("Fatal", StringComparison.OrdinalIgnoreCase))
-            {
-                _lastState = AidyState.Error;
-                StateChanged?.Invoke(AidyState.Error);
             }
         }
 